@@ -0,0 +1,102 @@
+# self_assessment_system/core/analysis_cache.py
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Callable
+
+from core.analyzer import Analyzer, AnalysisResult, VALUES_CATEGORY
+
+
+class AnalysisCache:
+    """
+    Cache LRU có giới hạn đặt trước Analyzer.
+    Khóa = dấu vân tay của danh sách (question_id, answer) theo thứ tự + phiên bản bộ câu hỏi + tham số phân tích,
+    nên xem lại kết quả, xuất báo cáo hay streamlit rerun với cùng phản hồi đều không phải tính lại.
+    Thứ tự là một phần của khóa vì kết quả phụ thuộc vào nó (thứ tự khía cạnh quyết định các điểm bằng nhau
+    trong điểm mạnh/yếu); nhờ vậy kết quả cache không phụ thuộc vào việc ai tính trước, analyze_all hay
+    IncrementalScorer.result (cho kết quả giống hệt trên cùng danh sách).
+    """
+
+    def __init__(self, analyzer: Analyzer, max_entries: int = 256):
+        self.analyzer = analyzer
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, AnalysisResult]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(user_responses: List[Dict[str, Any]], bank_version: str = "") -> str:
+        """Hash ổn định của danh sách (question_id, answer), theo đúng thứ tự câu trả lời."""
+        items = [(r['question_id'], type(r['answer']).__name__, repr(r['answer'])) for r in user_responses]
+        payload = json.dumps([bank_version, items], ensure_ascii=False)
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+    def analyze(self,
+                user_responses: List[Dict[str, Any]],
+                top_n: int = 3,
+                category_filter: str = VALUES_CATEGORY,
+                compute: Callable[[], AnalysisResult] | None = None,
+                analyzer: Analyzer | None = None) -> AnalysisResult:
+        """
+        Trả về kết quả analyze_all từ cache nếu có, nếu không thì tính và lưu lại.
+        compute: hàm tính thay thế khi cache miss, phải cho kết quả giống analyze_all(user_responses)
+                 (ví dụ IncrementalScorer.result của chính các phản hồi này).
+        analyzer: Analyzer của phiên (khi bộ câu hỏi được nạp lại giữa chừng); mặc định self.analyzer.
+        """
+        analyzer = analyzer or self.analyzer
+        key = f"{self.fingerprint(user_responses, analyzer.bank_version)}:{top_n}:{category_filter}"
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        if compute is not None:
+            result = compute()
+        else:
+            result = analyzer.analyze_all(user_responses, top_n=top_n, category_filter=category_filter)
+
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Số lần hit/miss và kích thước hiện tại của cache."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+if __name__ == '__main__':
+    # Test
+    from core.question_generator import QuestionGenerator
+    questions = QuestionGenerator().get_all_questions()
+    cache = AnalysisCache(Analyzer(questions), max_entries=2)
+
+    responses = [{"question_id": q['id'], "answer": 4} for q in questions]
+    first = cache.analyze(responses, top_n=5)
+    second = cache.analyze(list(responses), top_n=5) # Cùng danh sách câu trả lời -> hit
+    reordered = cache.analyze(list(reversed(responses)), top_n=5) # Khác thứ tự -> miss (điểm bằng nhau xếp khác)
+    print(first is second, reordered == Analyzer(questions).analyze_all(list(reversed(responses)), top_n=5), cache.stats())
+
+    cache.analyze(responses[:10])
+    cache.analyze(responses[:20]) # Vượt max_entries -> loại bỏ mục cũ nhất
+    cache.analyze(responses, top_n=5)
+    print(cache.stats())
@@ -1,14 +1,215 @@
 # self_assessment_system/core/analyzer.py
 import pandas as pd
-from typing import List, Dict, Any, Tuple
+import numpy as np
+import hashlib
+import json
+from typing import List, Dict, Any, Tuple, Iterable, NamedTuple, Mapping
+from utils.frozen import FrozenDict
+
+# Các giá trị được coi là "Có"/"Không" cho câu hỏi yes_no (so sánh sau khi lower())
+YES_ANSWERS = ["có", "co", "c", "yes", "true", "1"]
+NO_ANSWERS = ["không", "khong", "k", "ko", "no", "false", "0"]
+
+VALUES_CATEGORY = "Giá trị cốt lõi"
+MOTIVATION_CATEGORY = "Động lực học tập và hành động"
+
+
+class AnalysisResult(NamedTuple):
+    """
+    Kết quả phân tích đầy đủ của một bộ phản hồi (bất biến, dùng chung cho UI và ReportGenerator).
+    strengths_weaknesses: {"strengths": ((dim, score), ...), "weaknesses": (...)}
+    """
+    overall_scores: Mapping[str, float]
+    strengths_weaknesses: Mapping[str, Tuple[Tuple[str, float], ...]]
+    value_proportions: Mapping[str, float]
+    motivation_trends: Mapping[str, float]
+
+class _QuestionScorer:
+    """
+    Bộ tính điểm đã biên dịch cho một câu hỏi.
+    points: bảng tra cứu cố định answer -> (slot, dimension_index, giá_trị_thô, điểm).
+    resolve(): đường chậm cho câu trả lời không có sẵn trong bảng, cho kết quả giống `_get_score_for_response`.
+    """
+    __slots__ = ("question_id", "points")
+
+    def __init__(self, question_id: str, points: Dict[Any, Tuple[int, int, float, float]]):
+        self.question_id = question_id
+        self.points = FrozenDict(points)
+
+    def resolve(self, answer: Any) -> Tuple[int, int, float, float] | None:
+        return None
+
+
+class _LikertScorer(_QuestionScorer):
+    __slots__ = ("slot", "dimension_index", "sign", "offset")
+
+    def __init__(self, question_id: str, slot: int, dimension_index: int, sign: float, offset: float, scale: range):
+        self.slot = slot
+        self.dimension_index = dimension_index
+        self.sign = sign
+        self.offset = offset
+        super().__init__(question_id, {value: (slot, dimension_index, float(value), offset + sign * value)
+                                       for value in scale})
+
+    def resolve(self, answer: Any) -> Tuple[int, int, float, float] | None:
+        if not isinstance(answer, (int, float)):
+            return None
+        raw = float(answer)
+        return (self.slot, self.dimension_index, raw, self.offset + self.sign * raw)
+
+
+class _YesNoScorer(_QuestionScorer):
+    __slots__ = ("yes", "no")
+
+    def __init__(self, question_id: str, yes: Tuple[int, int, float, float], no: Tuple[int, int, float, float]):
+        self.yes = yes
+        self.no = no
+        # Chỉ dùng khóa chuỗi: khóa số (1, 0) sẽ khớp nhầm 1.0/True do hash bằng nhau
+        points = {}
+        for answers, hit in ((NO_ANSWERS, no), (YES_ANSWERS, yes)):
+            for a in answers:
+                points.update({a: hit, a.capitalize(): hit, a.upper(): hit})
+        super().__init__(question_id, points)
+
+    def resolve(self, answer: Any) -> Tuple[int, int, float, float] | None:
+        key = str(answer).lower()
+        if key in YES_ANSWERS:
+            return self.yes
+        if key in NO_ANSWERS:
+            return self.no
+        return None
+
+
+class _ChoiceScorer(_QuestionScorer):
+    __slots__ = ()
+
+    def resolve(self, answer: Any) -> Tuple[int, int, float, float] | None:
+        return self.points.get(str(answer))
+
 
 class Analyzer:
-    def __init__(self, questions_data: List[Dict[str, Any]]):
+    # Các bảng do _build_scoring_matrix tạo ra; có thể lưu lại và truyền vào qua `compiled` để bỏ qua bước biên dịch
+    COMPILED_ATTRIBUTES = ('dimensions', 'dimension_index', '_scorers', 'slot_question_ids', 'num_slots',
+                           'slot_dimension_index', 'slot_signs', 'slot_offsets',
+                           '_value_options', '_motivation_questions')
+
+    def __init__(self, questions_data: List[Dict[str, Any]], bank_version: str | None = None,
+                 compiled: Dict[str, Any] | None = None):
         """
         Khởi tạo Analyzer với dữ liệu câu hỏi (bao gồm scoring_info).
         questions_data: List các dictionary câu hỏi từ QuestionGenerator.
+        bank_version, compiled: phiên bản và bảng đã biên dịch sẵn (xem compiled_tables), thường lấy từ
+        cache của QuestionGenerator; bỏ trống thì tính lại từ questions_data.
         """
         self.questions_map = {q['id']: q for q in questions_data}
+        # Phiên bản bộ câu hỏi: hash nội dung, dùng làm một phần khóa cache kết quả phân tích
+        self.bank_version = bank_version or hashlib.sha1(
+            json.dumps(questions_data, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        if compiled is not None:
+            for name in self.COMPILED_ATTRIBUTES:
+                setattr(self, name, compiled[name])
+            self._build_weight_matrix() # One-hot nên dựng lại nhanh hơn đọc từ cache
+        else:
+            self._build_scoring_matrix(list(self.questions_map.values()))
+
+    def _build_weight_matrix(self) -> None:
+        # Ma trận trọng số one-hot: weight_matrix[slot, dim] = 1 nếu slot đóng góp vào dim
+        self.weight_matrix = np.zeros((self.num_slots, len(self.dimensions)), dtype=np.float64)
+        self.weight_matrix[np.arange(self.num_slots), self.slot_dimension_index] = 1.0
+
+    def compiled_tables(self) -> Dict[str, Any]:
+        """Các bảng tính điểm đã biên dịch (picklable), dùng để khởi tạo lại Analyzer mà không biên dịch lại."""
+        return {name: getattr(self, name) for name in self.COMPILED_ATTRIBUTES}
+
+    def _build_scoring_matrix(self, questions_data: List[Dict[str, Any]]) -> None:
+        """
+        Biên dịch questions.json một lần khi khởi tạo:
+        - self._scorers: question_id -> bộ tính điểm đã biên dịch (xem _QuestionScorer)
+        - ma trận trọng số (slot × dimension) cho batch scoring.
+        Mỗi slot là một câu hỏi (likert, yes_no) hoặc một lựa chọn của câu multiple_choice_single.
+        Điểm của slot = offset * số_lần_trả_lời + sign * giá_trị_thô
+        (likert inverse: offset = scale_min + scale_max, sign = -1).
+        """
+        self.dimensions: List[str] = []
+        self.dimension_index: Dict[str, int] = {}
+        self._scorers: Dict[str, _QuestionScorer] = {}
+        slot_dims: List[int] = []
+        slot_signs: List[float] = []
+        slot_offsets: List[float] = []
+        self.slot_question_ids: List[str] = []
+
+        def dim_idx(dimension: str) -> int:
+            if dimension not in self.dimension_index:
+                self.dimension_index[dimension] = len(self.dimensions)
+                self.dimensions.append(dimension)
+            return self.dimension_index[dimension]
+
+        def new_slot(question_id: str, dimension: str, sign: float = 1.0, offset: float = 0.0) -> int:
+            self.slot_question_ids.append(question_id)
+            slot_dims.append(dim_idx(dimension))
+            slot_signs.append(sign)
+            slot_offsets.append(offset)
+            return len(slot_dims) - 1
+
+        for q in questions_data:
+            scoring_info = q.get('scoring_info')
+            if not scoring_info:
+                continue
+            q_type = q.get('type')
+            if q_type == "likert":
+                dimension = scoring_info.get("dimension")
+                if not dimension:
+                    continue
+                scale_min = q.get('scale_min', 1)
+                scale_max = q.get('scale_max', 5)
+                if scoring_info.get("interpretation", "direct") == "inverse":
+                    sign, offset = -1.0, float(scale_max + scale_min)
+                else:
+                    sign, offset = 1.0, 0.0
+                slot = new_slot(q['id'], dimension, sign, offset)
+                self._scorers[q['id']] = _LikertScorer(q['id'], slot, slot_dims[slot], sign, offset,
+                                                       range(int(scale_min), int(scale_max) + 1))
+            elif q_type == "yes_no":
+                dimension = scoring_info.get("dimension")
+                if not dimension:
+                    continue
+                slot = new_slot(q['id'], dimension)
+                yes_points = float(scoring_info.get("yes_value", 0))
+                no_points = float(scoring_info.get("no_value", 0))
+                self._scorers[q['id']] = _YesNoScorer(q['id'],
+                                                      (slot, slot_dims[slot], yes_points, yes_points),
+                                                      (slot, slot_dims[slot], no_points, no_points))
+            elif q_type == "multiple_choice_single":
+                choices = {}
+                for choice, choice_scoring in scoring_info.items():
+                    if isinstance(choice_scoring, dict) and "dimension" in choice_scoring and "points" in choice_scoring:
+                        slot = new_slot(q['id'], choice_scoring["dimension"])
+                        points = float(choice_scoring["points"])
+                        choices[choice] = (slot, slot_dims[slot], points, points)
+                if choices:
+                    self._scorers[q['id']] = _ChoiceScorer(q['id'], choices)
+
+        self.num_slots = len(slot_dims)
+        self.slot_dimension_index = np.array(slot_dims, dtype=np.intp)
+        self.slot_signs = np.array(slot_signs, dtype=np.float64)
+        self.slot_offsets = np.array(slot_offsets, dtype=np.float64)
+        self._build_weight_matrix()
+
+        # Bảng phụ cho analyze_all: question_id -> (category, {option value: option text})
+        self._value_options: Dict[str, Tuple[str, FrozenDict]] = {}
+        # question_id -> dimension (likert, cộng điểm thô) hoặc None (multiple_choice_single, dùng điểm của lựa chọn)
+        self._motivation_questions: Dict[str, str | None] = {}
+        for q in questions_data:
+            if q.get('type') == "multiple_choice_single":
+                option_texts = {}
+                for opt in q.get('options', []):
+                    option_texts.setdefault(opt['value'], opt['text'])
+                self._value_options[q['id']] = (q.get('category'), FrozenDict(option_texts))
+            if q.get('category') == MOTIVATION_CATEGORY and 'scoring_info' in q:
+                if q.get('type') == "multiple_choice_single":
+                    self._motivation_questions[q['id']] = None
+                elif q.get('type') == "likert" and "dimension" in q['scoring_info']:
+                    self._motivation_questions[q['id']] = q['scoring_info']["dimension"]
 
     def _get_score_for_response(self, question_id: str, answer: Any) -> Dict[str, float]:
         """
@@ -39,9 +240,9 @@ class Analyzer:
         elif q_type == "yes_no":
             dimension = scoring_info.get("dimension")
             if dimension:
-                if str(answer).lower() in ["có", "co", "c", "yes", "true", "1"]:
+                if str(answer).lower() in YES_ANSWERS:
                     scores[dimension] = float(scoring_info.get("yes_value", 0))
-                elif str(answer).lower() in ["không", "khong", "k", "ko", "no", "false", "0"]:
+                elif str(answer).lower() in NO_ANSWERS:
                     scores[dimension] = float(scoring_info.get("no_value", 0))
 
         elif q_type == "multiple_choice_single":
@@ -63,31 +264,134 @@ class Analyzer:
         Tính tổng điểm hoặc điểm trung bình cho mỗi khía cạnh (dimension).
         user_responses: list of {"question_id": "...", "answer": "..."}
         """
-        dimension_scores_sum: Dict[str, float] = {}
-        dimension_counts: Dict[str, int] = {}
+        scorers = self._scorers
+        dimension_scores_sum = [0.0] * len(self.dimensions)
+        dimension_counts = [0] * len(self.dimensions)
+        seen_order: List[int] = [] # Giữ thứ tự khía cạnh theo lần xuất hiện đầu tiên
 
         for response in user_responses:
-            q_id = response['question_id']
+            scorer = scorers.get(response['question_id'])
+            if scorer is None:
+                continue
             answer = response['answer']
-            individual_scores = self._get_score_for_response(q_id, answer)
-
-            for dim, score_val in individual_scores.items():
-                dimension_scores_sum[dim] = dimension_scores_sum.get(dim, 0.0) + score_val
-                dimension_counts[dim] = dimension_counts.get(dim, 0) + 1
-
-        # Tính điểm trung bình (hoặc có thể là tổng điểm tùy theo thiết kế)
-        # Ở đây ví dụ tính trung bình, nếu muốn tổng thì bỏ chia
-        averaged_scores: Dict[str, float] = {}
-        for dim, total_score in dimension_scores_sum.items():
-            count = dimension_counts.get(dim, 1) # Tránh chia cho 0
-            if count > 0 :
-                 # Làm tròn đến 2 chữ số thập phân
-                averaged_scores[dim] = round(total_score / count, 2)
-            else:
-                averaged_scores[dim] = 0.0
+            try:
+                hit = scorer.points.get(answer) or scorer.resolve(answer)
+            except TypeError: # Câu trả lời không hash được (list, dict...)
+                hit = scorer.resolve(answer)
+            if hit is None:
+                continue
+            dim = hit[1]
+            if not dimension_counts[dim]:
+                seen_order.append(dim)
+            dimension_scores_sum[dim] += hit[3]
+            dimension_counts[dim] += 1
+
+        # Tính điểm trung bình, làm tròn đến 2 chữ số thập phân
+        dimensions = self.dimensions
+        return {dimensions[dim]: round(dimension_scores_sum[dim] / dimension_counts[dim], 2) for dim in seen_order}
+
+    def encode_response_sets(self, response_sets: Iterable[List[Dict[str, Any]]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Mã hóa N bộ phản hồi thành hai ma trận (N × slot):
+        - values: tổng giá trị thô (likert) hoặc điểm (yes_no, multiple_choice_single) của mỗi slot
+        - counts: số câu trả lời hợp lệ rơi vào mỗi slot
+        Câu trả lời không tính điểm được sẽ bị bỏ qua giống hệt `_get_score_for_response`.
+        """
+        num_slots = self.num_slots
+        scorers = self._scorers
+        flat_slots: List[int] = []  # chỉ số phẳng row * num_slots + slot
+        raw_values: List[float] = []
+        num_rows = 0
+
+        for row, user_responses in enumerate(response_sets):
+            base = row * num_slots
+            num_rows += 1
+            for response in user_responses:
+                scorer = scorers.get(response['question_id'])
+                if scorer is None:
+                    continue
+                answer = response['answer']
+                try:
+                    hit = scorer.points.get(answer) or scorer.resolve(answer)
+                except TypeError:
+                    hit = scorer.resolve(answer)
+                if hit is None:
+                    continue
+                flat_slots.append(base + hit[0])
+                raw_values.append(hit[2])
+
+        size = num_rows * num_slots
+        values = np.bincount(flat_slots, weights=raw_values, minlength=size).astype(np.float64).reshape(num_rows, num_slots)
+        counts = np.bincount(flat_slots, minlength=size).astype(np.float64).reshape(num_rows, num_slots)
+        return values, counts
+
+    def encode_coded_answers(self, num_rows: int, row_index: np.ndarray,
+                             question_codes: np.ndarray, question_ids: List[str],
+                             answer_codes: np.ndarray, answer_values: List[Any]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Giống encode_response_sets nhưng nhận dữ liệu dạng cột (ví dụ buffer Arrow/Parquet), không cần dict từng dòng:
+        câu trả lời thứ k thuộc hàng row_index[k], câu hỏi question_ids[question_codes[k]],
+        đáp án answer_values[answer_codes[k]]. Mỗi cặp (câu hỏi, đáp án) khác nhau chỉ được tra bảng một lần.
+        """
+        num_slots = self.num_slots
+        pairs = question_codes.astype(np.int64) * len(answer_values) + answer_codes.astype(np.int64)
+        unique_pairs, inverse = np.unique(pairs, return_inverse=True)
+        pair_slots = np.full(len(unique_pairs), -1, dtype=np.int64)
+        pair_raw = np.zeros(len(unique_pairs), dtype=np.float64)
+        for k, pair in enumerate(unique_pairs.tolist()):
+            question_code, answer_code = divmod(pair, len(answer_values))
+            scorer = self._scorers.get(question_ids[question_code])
+            if scorer is None:
+                continue
+            answer = answer_values[answer_code]
+            try:
+                hit = scorer.points.get(answer) or scorer.resolve(answer)
+            except TypeError:
+                hit = scorer.resolve(answer)
+            if hit is not None:
+                pair_slots[k], pair_raw[k] = hit[0], hit[2]
+
+        slots = pair_slots[inverse]
+        answered = slots >= 0
+        flat_slots = row_index.astype(np.int64)[answered] * num_slots + slots[answered]
+        size = num_rows * num_slots
+        values = np.bincount(flat_slots, weights=pair_raw[inverse][answered], minlength=size).reshape(num_rows, num_slots)
+        counts = np.bincount(flat_slots, minlength=size).astype(np.float64).reshape(num_rows, num_slots)
+        return values, counts
+
+    def score_encoded(self, values: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        """
+        Tính điểm trung bình (users × dimensions) từ ma trận đã mã hóa bằng một phép nhân ma trận.
+        Khía cạnh không có câu trả lời nào nhận giá trị NaN.
+        """
+        slot_points = values * self.slot_signs + counts * self.slot_offsets
+        dimension_sums = slot_points @ self.weight_matrix
+        dimension_counts = counts @ self.weight_matrix
+        averaged = np.full(dimension_sums.shape, np.nan)
+        np.divide(dimension_sums, dimension_counts, out=averaged, where=dimension_counts > 0)
+        return _round_half_even(averaged, 2)
+
+    def batch_item_scores(self, response_sets: Iterable[List[Dict[str, Any]]]) -> np.ndarray:
+        """
+        Điểm từng câu hỏi/slot (N × num_slots) sau khi đảo ngược câu inverse; NaN nếu không trả lời.
+        Dùng cho phân tích độ tin cậy theo từng item.
+        """
+        values, counts = self.encode_response_sets(response_sets)
+        item_scores = np.full(values.shape, np.nan)
+        np.divide(values * self.slot_signs + counts * self.slot_offsets, counts, out=item_scores, where=counts > 0)
+        return item_scores
 
+    def batch_calculate_scores(self, response_sets: Iterable[List[Dict[str, Any]]]) -> np.ndarray:
+        """
+        Tính điểm cho N bộ phản hồi cùng lúc. Trả về mảng (N × len(self.dimensions)),
+        cột thứ j ứng với self.dimensions[j]; kết quả khớp với `calculate_overall_scores`.
+        """
+        values, counts = self.encode_response_sets(response_sets)
+        return self.score_encoded(values, counts)
 
-        return averaged_scores
+    def scores_row_to_dict(self, scores_row: np.ndarray) -> Dict[str, float]:
+        """Chuyển một hàng của `batch_calculate_scores` về dạng dict như `calculate_overall_scores`."""
+        return {self.dimensions[j]: float(scores_row[j]) for j in np.flatnonzero(~np.isnan(scores_row))}
 
     def identify_strengths_weaknesses(self, overall_scores: Dict[str, float], top_n: int = 3) -> Dict[str, List[Tuple[str, float]]]:
         """
@@ -107,7 +411,7 @@ class Analyzer:
 
         return {"strengths": strengths, "weaknesses": weaknesses}
 
-    def analyze_value_proportions(self, user_responses: List[Dict[str, Any]], category_filter: str = "Giá trị cốt lõi") -> Dict[str, float]:
+    def analyze_value_proportions(self, user_responses: List[Dict[str, Any]], category_filter: str = VALUES_CATEGORY) -> Dict[str, float]:
         """
         Phân tích tỷ lệ lựa chọn cho các câu hỏi trong một danh mục cụ thể (ví dụ: Giá trị cốt lõi).
         Hữu ích cho các câu hỏi lựa chọn ưu tiên.
@@ -160,7 +464,7 @@ class Analyzer:
             answer = response['answer']
             question_info = self.questions_map.get(q_id)
 
-            if question_info and question_info.get('category') == "Động lực học tập và hành động" and 'scoring_info' in question_info:
+            if question_info and question_info.get('category') == MOTIVATION_CATEGORY and 'scoring_info' in question_info:
                 q_scoring_info = question_info['scoring_info']
                 q_type = question_info['type']
 
@@ -186,6 +490,216 @@ class Analyzer:
                 averaged_motivation_scores[dim] = round(total_score / count, 2)
         return averaged_motivation_scores
 
+    def analyze_all(self, user_responses: List[Dict[str, Any]], top_n: int = 3,
+                    category_filter: str = VALUES_CATEGORY) -> AnalysisResult:
+        """
+        Chạy toàn bộ phân tích (điểm tổng thể, điểm mạnh/yếu, tỷ lệ giá trị, xu hướng động lực)
+        trong một lần duyệt phản hồi. Kết quả giống hệt việc gọi lần lượt từng hàm phân tích.
+        """
+        scorers = self._scorers
+        value_options = self._value_options
+        motivation_questions = self._motivation_questions
+        dimension_scores_sum = [0.0] * len(self.dimensions)
+        dimension_counts = [0] * len(self.dimensions)
+        seen_order: List[int] = []
+        value_counts: Dict[str, int] = {}
+        total_value_questions = 0
+        motivation_scores: Dict[str, float] = {}
+        motivation_counts: Dict[str, int] = {}
+
+        for response in user_responses:
+            q_id = response['question_id']
+            answer = response['answer']
+
+            hit = None
+            scorer = scorers.get(q_id)
+            if scorer is not None:
+                try:
+                    hit = scorer.points.get(answer) or scorer.resolve(answer)
+                except TypeError:
+                    hit = scorer.resolve(answer)
+                if hit is not None:
+                    dim = hit[1]
+                    if not dimension_counts[dim]:
+                        seen_order.append(dim)
+                    dimension_scores_sum[dim] += hit[3]
+                    dimension_counts[dim] += 1
+
+            value_entry = value_options.get(q_id)
+            if value_entry is not None and value_entry[0] == category_filter:
+                total_value_questions += 1
+                value_text = value_entry[1].get(str(answer))
+                if value_text is not None:
+                    value_counts[value_text] = value_counts.get(value_text, 0) + 1
+
+            if q_id in motivation_questions:
+                motivation_dim = motivation_questions[q_id]
+                if motivation_dim is not None: # likert: điểm thô, không đảo ngược
+                    points = hit[2] if hit is not None else float(answer)
+                elif hit is not None:
+                    motivation_dim, points = self.dimensions[hit[1]], hit[3]
+                else:
+                    continue
+                motivation_scores[motivation_dim] = motivation_scores.get(motivation_dim, 0.0) + points
+                motivation_counts[motivation_dim] = motivation_counts.get(motivation_dim, 0) + 1
+
+        dimensions = self.dimensions
+        overall_scores = {dimensions[dim]: round(dimension_scores_sum[dim] / dimension_counts[dim], 2) for dim in seen_order}
+        value_proportions = {}
+        if total_value_questions > 0:
+            value_proportions = {text: round((count / total_value_questions) * 100, 1) for text, count in value_counts.items()}
+        motivation_trends = {dim: round(total / motivation_counts[dim], 2) for dim, total in motivation_scores.items()}
+
+        return self._make_result(overall_scores, top_n, value_proportions, motivation_trends)
+
+    def _make_result(self, overall_scores: Dict[str, float], top_n: int,
+                     value_proportions: Dict[str, float], motivation_trends: Dict[str, float]) -> AnalysisResult:
+        strengths_weaknesses = self.identify_strengths_weaknesses(overall_scores, top_n=top_n)
+        return AnalysisResult(
+            overall_scores=FrozenDict(overall_scores),
+            strengths_weaknesses=FrozenDict({key: tuple(items) for key, items in strengths_weaknesses.items()}),
+            value_proportions=FrozenDict(value_proportions),
+            motivation_trends=FrozenDict(motivation_trends),
+        )
+
+    def incremental_scorer(self, category_filter: str = VALUES_CATEGORY) -> "IncrementalScorer":
+        """Tạo bộ tính điểm tăng dần, cập nhật khi từng câu trả lời được ghi nhận."""
+        return IncrementalScorer(self, category_filter)
+
+class IncrementalScorer:
+    """
+    Tổng điểm chạy (running aggregate) cho một phiên làm bài.
+    record()/remove() cập nhật tổng và số lượng theo từng khía cạnh với chi phí O(1),
+    result() trả về AnalysisResult giống hệt `Analyzer.analyze_all` trên danh sách phản hồi cùng thứ tự
+    (câu trả lời lại giữ vị trí cũ, câu bị bỏ thì bị xóa, như danh sách phản hồi của các UI) mà không tính điểm lại:
+    thứ tự khía cạnh (quyết định thứ tự các điểm bằng nhau trong điểm mạnh/yếu) lấy theo lần xuất hiện đầu tiên.
+    """
+
+    def __init__(self, analyzer: Analyzer, category_filter: str = VALUES_CATEGORY):
+        self.analyzer = analyzer
+        self.category_filter = category_filter
+        self._dimension_sums = [0.0] * len(analyzer.dimensions)
+        self._dimension_counts = [0] * len(analyzer.dimensions)
+        self._value_counts: Dict[str, int] = {}
+        self._total_value_questions = 0
+        self._motivation: Dict[str, List[float]] = {} # dimension -> [tổng điểm, số câu]
+        # question_id -> (dimension_index | None, điểm, value_text | None | False, (motivation_dim, điểm) | None)
+        self._contributions: Dict[str, Tuple[int | None, float, Any, Tuple[str, float] | None]] = {}
+
+    def __len__(self) -> int:
+        return len(self._contributions)
+
+    def _contribution(self, question_id: str, answer: Any) -> Tuple[int | None, float, Any, Tuple[str, float] | None]:
+        analyzer = self.analyzer
+        dim, points, hit = None, 0.0, None
+        scorer = analyzer._scorers.get(question_id)
+        if scorer is not None:
+            try:
+                hit = scorer.points.get(answer) or scorer.resolve(answer)
+            except TypeError:
+                hit = scorer.resolve(answer)
+            if hit is not None:
+                dim, points = hit[1], hit[3]
+
+        value_text = False # False: không thuộc danh mục giá trị; None: thuộc danh mục nhưng không khớp lựa chọn nào
+        value_entry = analyzer._value_options.get(question_id)
+        if value_entry is not None and value_entry[0] == self.category_filter:
+            value_text = value_entry[1].get(str(answer))
+
+        motivation = None
+        if question_id in analyzer._motivation_questions:
+            motivation_dim = analyzer._motivation_questions[question_id]
+            if motivation_dim is not None:
+                motivation = (motivation_dim, hit[2] if hit is not None else float(answer))
+            elif hit is not None:
+                motivation = (analyzer.dimensions[hit[1]], hit[3])
+        return dim, points, value_text, motivation
+
+    def _apply(self, contribution: Tuple[int | None, float, Any, Tuple[str, float] | None], sign: int) -> None:
+        dim, points, value_text, motivation = contribution
+        if dim is not None:
+            self._dimension_sums[dim] += sign * points
+            self._dimension_counts[dim] += sign
+        if value_text is not False:
+            self._total_value_questions += sign
+            if value_text is not None:
+                count = self._value_counts.get(value_text, 0) + sign
+                if count:
+                    self._value_counts[value_text] = count
+                else:
+                    del self._value_counts[value_text]
+        if motivation is not None:
+            totals = self._motivation.setdefault(motivation[0], [0.0, 0])
+            totals[0] += sign * motivation[1]
+            totals[1] += sign
+            if not totals[1]:
+                del self._motivation[motivation[0]]
+
+    def record(self, question_id: str, answer: Any) -> None:
+        """Ghi nhận (hoặc thay đổi) câu trả lời cho một câu hỏi."""
+        previous = self._contributions.get(question_id)
+        if previous is not None:
+            self._apply(previous, -1)
+        contribution = self._contribution(question_id, answer)
+        self._apply(contribution, 1)
+        self._contributions[question_id] = contribution
+
+    def remove(self, question_id: str) -> bool:
+        """Bỏ câu trả lời của một câu hỏi khỏi tổng điểm. Trả về False nếu câu hỏi chưa được ghi nhận."""
+        previous = self._contributions.pop(question_id, None)
+        if previous is None:
+            return False
+        self._apply(previous, -1)
+        return True
+
+    def reset(self) -> None:
+        self.__init__(self.analyzer, self.category_filter)
+
+    def _first_seen(self) -> Tuple[Dict[int, None], Dict[str, None], Dict[str, None]]:
+        """Khía cạnh, giá trị và khía cạnh động lực theo lần xuất hiện đầu tiên trong các câu đã ghi nhận."""
+        dims, value_texts, motivation_dims = {}, {}, {}
+        for dim, _, value_text, motivation in self._contributions.values():
+            if dim is not None:
+                dims[dim] = None
+            if value_text:
+                value_texts[value_text] = None
+            if motivation is not None:
+                motivation_dims[motivation[0]] = None
+        return dims, value_texts, motivation_dims
+
+    def overall_scores(self) -> Dict[str, float]:
+        """Hồ sơ điểm hiện tại (có thể chưa đầy đủ), khía cạnh theo thứ tự xuất hiện đầu tiên như analyze_all."""
+        return self._overall_scores(self._first_seen()[0])
+
+    def _overall_scores(self, dims: Dict[int, None]) -> Dict[str, float]:
+        dimensions = self.analyzer.dimensions
+        return {dimensions[dim]: round(self._dimension_sums[dim] / self._dimension_counts[dim], 2) for dim in dims}
+
+    def result(self, top_n: int = 3) -> AnalysisResult:
+        dims, value_texts, motivation_dims = self._first_seen()
+        value_proportions = {}
+        if self._total_value_questions > 0:
+            value_proportions = {text: round((self._value_counts[text] / self._total_value_questions) * 100, 1)
+                                 for text in value_texts}
+        motivation_trends = {dim: round(self._motivation[dim][0] / self._motivation[dim][1], 2) for dim in motivation_dims}
+        return self.analyzer._make_result(self._overall_scores(dims), top_n, value_proportions, motivation_trends)
+
+
+def _round_half_even(values: np.ndarray, ndigits: int) -> np.ndarray:
+    """
+    Làm tròn giống hệt hàm round() của Python cho cả mảng.
+    np.round nhân với 10**ndigits nên có thể lệch ở các giá trị sát nửa đơn vị (vd: 2.675),
+    những phần tử đó được làm tròn lại bằng round() để đảm bảo kết quả trùng khớp.
+    """
+    rounded = np.round(values, ndigits)
+    scaled = values * 10 ** ndigits
+    ambiguous = np.flatnonzero(np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6)
+    flat_values = values.reshape(-1)
+    flat_rounded = rounded.reshape(-1)
+    for i in ambiguous:
+        flat_rounded[i] = round(float(flat_values[i]), ndigits)
+    return rounded
+
 
 if __name__ == '__main__':
     # --- Test Analyzer ---
@@ -226,4 +740,37 @@ if __name__ == '__main__':
 
         print("\n--- Phân tích xu hướng động lực ---")
         motivation_trends = analyzer.analyze_motivation_trends(sample_user_responses)
-        print(motivation_trends)
\ No newline at end of file
+        print(motivation_trends)
+
+        print("\n--- Phân tích một lần duyệt (analyze_all) ---")
+        analysis = analyzer.analyze_all(sample_user_responses)
+        print(analysis.overall_scores == overall_scores and analysis.motivation_trends == motivation_trends)
+
+        print("\n--- Batch scoring (users × dimensions) ---")
+        batch_scores = analyzer.batch_calculate_scores([sample_user_responses, sample_user_responses[:2]])
+        print(batch_scores.shape)
+        print(analyzer.scores_row_to_dict(batch_scores[0]) == overall_scores)
+
+        print("\n--- Micro-benchmark: _get_score_for_response vs bảng tính điểm đã biên dịch ---")
+        import random
+        import timeit
+
+        def legacy_overall_scores(user_responses):
+            sums, counts = {}, {}
+            for response in user_responses:
+                for dim, score_val in analyzer._get_score_for_response(response['question_id'], response['answer']).items():
+                    sums[dim] = sums.get(dim, 0.0) + score_val
+                    counts[dim] = counts.get(dim, 0) + 1
+            return {dim: round(total / counts[dim], 2) for dim, total in sums.items()}
+
+        rng = random.Random(42)
+        bench_sets = [[{"question_id": q['id'], "answer": rng.randint(q.get('scale_min', 1), q.get('scale_max', 5))}
+                       for q in all_questions_data if q['type'] == "likert"] for _ in range(1000)]
+        assert all(legacy_overall_scores(r) == analyzer.calculate_overall_scores(r) for r in bench_sets)
+        t_legacy = min(timeit.repeat(lambda: [legacy_overall_scores(r) for r in bench_sets], number=1, repeat=5))
+        t_compiled = min(timeit.repeat(lambda: [analyzer.calculate_overall_scores(r) for r in bench_sets], number=1, repeat=5))
+        t_batch = min(timeit.repeat(lambda: analyzer.batch_calculate_scores(bench_sets), number=1, repeat=5))
+        print(f"{len(bench_sets)} bộ phản hồi × {len(bench_sets[0])} câu:")
+        print(f"  _get_score_for_response : {t_legacy * 1000:.1f} ms")
+        print(f"  compiled scorers        : {t_compiled * 1000:.1f} ms ({t_legacy / t_compiled:.1f}x)")
+        print(f"  batch_calculate_scores  : {t_batch * 1000:.1f} ms ({t_legacy / t_batch:.1f}x)")
\ No newline at end of file
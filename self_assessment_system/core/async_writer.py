@@ -0,0 +1,191 @@
+# self_assessment_system/core/async_writer.py
+import atexit
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Dict, Any, Tuple
+
+from core.data_storage import DataStorage
+
+_STOP = object() # Đánh dấu kết thúc hàng đợi cho luồng ghi
+
+
+class AsyncStorageWriter:
+    """
+    Ghi bài làm ở nền để luồng giao diện (tkinter mainloop, lượt chạy script streamlit) không bị chặn bởi đĩa chậm.
+    - Hàng đợi có giới hạn max_queue: khi đầy, submit chờ (backpressure) tối đa put_timeout giây.
+    - Một luồng ghi lấy tối đa max_batch bài đang chờ và ghi cả nhóm bằng storage.save_many (group commit).
+    - submit trả về Future[bool] (kết quả của save). Hàng đợi được ghi hết khi close() hoặc khi thoát chương trình.
+    - stats(): độ trễ ghi (từ lúc submit tới lúc ghi xong) và độ sâu hàng đợi.
+    """
+
+    def __init__(self, storage: DataStorage, max_queue: int = 1024, max_batch: int = 64,
+                 put_timeout: float | None = 5.0, latency_window: int = 1000):
+        self.storage = storage
+        self.max_batch = max_batch
+        self.put_timeout = put_timeout
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._stats_lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=latency_window) # Giây, các lần ghi gần nhất
+        self._counters = {"submitted": 0, "written": 0, "failed": 0, "rejected": 0, "batches": 0,
+                          "max_queue_depth": 0, "backpressure_waits": 0}
+        self._closed = False
+        # Số luồng đang xếp bài vào hàng đợi: close() chờ chúng xong rồi mới đặt _STOP, không bài nào nằm sau _STOP
+        self._submitting = 0
+        self._submit_cond = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name="AsyncStorageWriter", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def submit(self, user_id: str, responses: List[Dict[str, Any]], assessment_name: str = "general") -> Future:
+        """Xếp một bài làm vào hàng đợi ghi; trả về Future có kết quả True/False khi đã ghi xong."""
+        future: Future = Future()
+        # Sao chép phản hồi: giao diện có thể sửa danh sách của nó trong lúc bài làm còn nằm trong hàng đợi
+        item = (user_id, [dict(response) for response in responses], assessment_name, time.perf_counter(), future)
+        with self._submit_cond:
+            closed = self._closed
+            if not closed:
+                self._submitting += 1
+        if closed:
+            # Sau khi đóng (ví dụ lúc thoát chương trình) thì ghi đồng bộ, không để mất bài làm
+            future.set_result(self.storage.save_responses(*item[:3]))
+            return future
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._count("backpressure_waits")
+            try:
+                self._queue.put(item, timeout=self.put_timeout)
+            except queue.Full:
+                print(f"Lỗi: Hàng đợi ghi đầy ({self._queue.maxsize} bài làm), không thể lưu phản hồi của '{user_id}'.")
+                self._count("rejected")
+                future.set_result(False)
+                return future
+        finally:
+            with self._submit_cond:
+                self._submitting -= 1
+                self._submit_cond.notify_all()
+        with self._stats_lock:
+            self._counters["submitted"] += 1
+            self._counters["max_queue_depth"] = max(self._counters["max_queue_depth"], self._queue.qsize())
+        return future
+
+    def save_responses(self, user_id: str, responses: List[Dict[str, Any]], assessment_name: str = "general") -> bool:
+        """Cùng chữ ký với DataStorage.save_responses: True nếu bài làm đã vào hàng đợi (không chờ ghi xong)."""
+        future = self.submit(user_id, responses, assessment_name)
+        return not future.done() or future.result()
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self._counters[name] += 1
+
+    def _next_batch(self) -> Tuple[List[tuple], bool]:
+        """Chờ bài làm đầu tiên rồi lấy thêm các bài đang có sẵn (tối đa max_batch). Trả về (nhóm, gặp _STOP)."""
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if batch:
+                self._write(batch)
+            for _ in range(len(batch) + stopping):
+                self._queue.task_done()
+
+    def _write(self, batch: List[tuple]) -> None:
+        try:
+            results = self.storage.save_many([(user_id, responses, name) for user_id, responses, name, _, _ in batch])
+        except Exception as e: # Luồng ghi không được chết: lỗi của backend được báo qua Future
+            print(f"Lỗi khi ghi nhóm {len(batch)} bài làm: {e}")
+            results = [False] * len(batch)
+        finished = time.perf_counter()
+        with self._stats_lock:
+            self._counters["batches"] += 1
+            for (_, _, _, submitted_at, _), ok in zip(batch, results):
+                self._latencies.append(finished - submitted_at)
+                self._counters["written" if ok else "failed"] += 1
+        for (_, _, _, _, future), ok in zip(batch, results):
+            future.set_result(bool(ok))
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Chờ tới khi mọi bài làm đã xếp hàng được ghi xong. Trả về False nếu hết timeout."""
+        if timeout is None:
+            self._queue.join()
+            return True
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def close(self, timeout: float | None = None) -> None:
+        """Ghi hết hàng đợi rồi dừng luồng ghi; gọi nhiều lần không sao (cũng được gọi qua atexit)."""
+        with self._submit_cond:
+            if self._closed:
+                return
+            self._closed = True # submit() gọi sau điểm này ghi đồng bộ
+            self._submit_cond.wait_for(lambda: self._submitting == 0) # Các lần submit đang dở vẫn vào hàng đợi
+        self._queue.put(_STOP) # Không dùng put_timeout: bài làm đã xếp hàng phải được ghi trước khi dừng
+        self._worker.join(timeout)
+        atexit.unregister(self.close)
+
+    def stats(self) -> Dict[str, Any]:
+        """Số liệu ghi: bộ đếm, độ sâu hàng đợi hiện tại và độ trễ (ms) p50/p95/max trên các lần ghi gần nhất."""
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            stats = dict(self._counters)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["avg_batch_size"] = round(stats["written"] / stats["batches"], 2) if stats["batches"] else 0.0
+        if latencies:
+            stats["latency_ms"] = {
+                "p50": round(latencies[len(latencies) // 2] * 1000, 3),
+                "p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 3),
+                "max": round(latencies[-1] * 1000, 3),
+            }
+        return stats
+
+
+if __name__ == '__main__':
+    import tempfile
+    from core.log_storage import SegmentLogStorage
+
+    print("--- Benchmark: 16 luồng giao diện giả lập, mỗi luồng 500 bài làm (log + fsync) ---")
+    responses = [{"question_id": f"Q{i:02d}", "answer": i % 5 + 1} for i in range(50)]
+    storage = SegmentLogStorage(tempfile.mkdtemp())
+    writer = AsyncStorageWriter(storage, max_queue=256)
+    submit_times = []
+
+    def producer(n: int) -> None:
+        for i in range(500):
+            start_time = time.perf_counter()
+            writer.submit(f"user_{n}", responses, f"assessment_{i % 3}")
+            submit_times.append(time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    threads = [threading.Thread(target=producer, args=(n,)) for n in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.close()
+    elapsed = time.perf_counter() - start_time
+    submit_times.sort()
+    print(f"Ghi 8000 bài làm: {elapsed:.2f} giây ({8000 / elapsed:.0f} bài/giây)")
+    print(f"Thời gian submit (luồng gọi bị chặn): p50 {submit_times[4000] * 1000:.3f} ms, max {submit_times[-1] * 1000:.1f} ms")
+    print(f"Số liệu: {writer.stats()}")
+    print(f"Bài làm đọc lại được: {sum(1 for _ in storage.iter_responses())}")
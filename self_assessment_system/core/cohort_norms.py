@@ -0,0 +1,220 @@
+# self_assessment_system/core/cohort_norms.py
+import os
+import threading
+import time
+import zipfile
+from typing import List, Dict, Any
+
+import numpy as np
+
+from core.analyzer import Analyzer
+from core.data_storage import DataStorage, ANALYTICS_DIR, create_storage
+from core.response_matrix import ResponseMatrixStore
+
+NORMS_FILE_PATH = os.path.join(ANALYTICS_DIR, 'cohort_norms.npz')
+MAX_AGE_SECONDS = 24 * 3600 # Norms cũ hơn được xây lại khi khởi động
+REBUILD_BELOW = 1000 # Kho nhỏ hơn mức này: quét lại mỗi lần khởi động (rẻ), tránh dùng mãi norms từ kho gần rỗng
+SAVE_EVERY = 50 # Lưu lại file norms sau mỗi chừng này bài làm được chèn qua attach()
+
+
+class CohortNorms:
+    """
+    Chuẩn (norms) của cộng đồng: một mảng điểm đã sắp xếp cho mỗi khía cạnh.
+    Tra cứu bách phân vị của một điểm số chỉ cần tìm kiếm nhị phân, O(log n).
+    Lưu kèm số bài làm và thời điểm xây để load_or_build biết khi nào norms đã cũ; trong lúc chạy,
+    attach() chèn điểm của mỗi bài làm mới vào các mảng đã sắp xếp, và lưu lại file sau mỗi SAVE_EVERY bài làm
+    cũng như khi close(), để lần khởi động sau không mất các bài làm đó.
+    """
+
+    def __init__(self, sorted_scores: Dict[str, np.ndarray], bank_version: str = "",
+                 submissions: int = 0, built_at: float = 0.0):
+        self.sorted_scores = sorted_scores
+        self.bank_version = bank_version
+        self.submissions = submissions # Số bài làm đã đưa vào norms
+        self.built_at = built_at # time.time() lúc quét kho
+        self._lock = threading.Lock()
+        self._save_listener = None # Listener do attach() đăng ký
+        self.file_path: str | None = None # File đã nạp/lưu gần nhất, nơi các cập nhật được lưu lại
+        self._unsaved = 0 # Số bài làm đã chèn nhưng chưa lưu ra file
+
+    @classmethod
+    def build(cls, analyzer: Analyzer, storage: DataStorage, chunk_size: int = 4096) -> "CohortNorms":
+        """Tính điểm toàn bộ kho phản hồi theo từng lô (batch scoring) và sắp xếp điểm của mỗi khía cạnh."""
+        built_at = time.time()
+        chunks: List[np.ndarray] = []
+        batch: List[List[Dict[str, Any]]] = []
+        for record in storage.iter_responses():
+            batch.append(record.get("responses", []))
+            if len(batch) >= chunk_size:
+                chunks.append(analyzer.batch_calculate_scores(batch))
+                batch = []
+        if batch:
+            chunks.append(analyzer.batch_calculate_scores(batch))
+        return cls._from_scores(analyzer, np.vstack(chunks) if chunks else None, built_at)
+
+    @classmethod
+    def build_from_store(cls, analyzer: Analyzer, store: ResponseMatrixStore) -> "CohortNorms | None":
+        """Như build nhưng tính điểm thẳng từ ma trận đáp án (không đọc/giải mã JSON); None nếu store khác bộ câu hỏi."""
+        built_at = time.time()
+        scores = store.scores(analyzer)
+        return None if scores is None else cls._from_scores(analyzer, scores, built_at)
+
+    @classmethod
+    def _from_scores(cls, analyzer: Analyzer, scores: np.ndarray | None, built_at: float) -> "CohortNorms":
+        if scores is None:
+            scores = np.empty((0, len(analyzer.dimensions)))
+        sorted_scores = {}
+        for j, dimension in enumerate(analyzer.dimensions):
+            column = scores[:, j]
+            sorted_scores[dimension] = np.sort(column[~np.isnan(column)])
+        return cls(sorted_scores, analyzer.bank_version, len(scores), built_at)
+
+    def add_scores(self, dimensions: List[str], scores: np.ndarray) -> None:
+        """Chèn các hàng điểm mới (N × dimensions, NaN = chưa trả lời) vào các mảng đã sắp xếp."""
+        scores = np.atleast_2d(scores)
+        with self._lock:
+            for j, dimension in enumerate(dimensions):
+                column = scores[:, j]
+                column = np.sort(column[~np.isnan(column)])
+                if column.size:
+                    values = self.sorted_scores.get(dimension, np.empty(0))
+                    # Tạo mảng mới rồi mới gán: luồng đang tra percentile vẫn thấy một mảng đầy đủ
+                    self.sorted_scores[dimension] = np.insert(values, np.searchsorted(values, column), column)
+            self.submissions += len(scores)
+            self._unsaved += len(scores)
+
+    def attach(self, storage: DataStorage, analyzer: Analyzer, save_every: int = SAVE_EVERY) -> "CohortNorms":
+        """
+        Cập nhật norms mỗi khi storage lưu một bài làm mới (chấm điểm bằng analyzer của bộ câu hỏi hiện tại);
+        cứ save_every bài làm thì lưu lại vào self.file_path.
+        """
+        def add_record(record: Dict[str, Any]) -> None:
+            if analyzer.bank_version == self.bank_version:
+                self.add_scores(analyzer.dimensions, analyzer.batch_calculate_scores([record.get("responses", [])]))
+                if self._unsaved >= save_every:
+                    self.close()
+        self.detach(storage)
+        self._save_listener = add_record
+        storage.add_save_listener(add_record)
+        return self
+
+    def detach(self, storage: DataStorage) -> None:
+        """Ngừng cập nhật từ storage và lưu các cập nhật còn lại."""
+        if self._save_listener is not None:
+            storage.remove_save_listener(self._save_listener)
+            self._save_listener = None
+        self.close()
+
+    def close(self) -> None:
+        """Lưu các bài làm đã chèn qua attach() mà chưa được lưu ra file."""
+        if self._unsaved and self.file_path is not None:
+            self.save(self.file_path)
+
+    def is_stale(self, analyzer: Analyzer, max_age_seconds: float = MAX_AGE_SECONDS,
+                 rebuild_below: int = REBUILD_BELOW) -> bool:
+        """Norms thuộc bộ câu hỏi khác, quá cũ, hoặc xây từ một kho còn quá ít bài làm."""
+        return (self.bank_version != analyzer.bank_version
+                or time.time() - self.built_at > max_age_seconds
+                or self.submissions < rebuild_below)
+
+    def cohort_size(self, dimension: str) -> int:
+        values = self.sorted_scores.get(dimension)
+        return 0 if values is None else int(values.size)
+
+    def percentile(self, dimension: str, score: float) -> float | None:
+        """
+        Bách phân vị của `score` trong cộng đồng (0-100): tỷ lệ người có điểm thấp hơn,
+        cộng một nửa số người có điểm bằng. Trả về None nếu chưa có dữ liệu cho khía cạnh này.
+        """
+        values = self.sorted_scores.get(dimension)
+        if values is None or values.size == 0:
+            return None
+        below = np.searchsorted(values, score, side='left')
+        below_or_equal = np.searchsorted(values, score, side='right')
+        return round(float((below + below_or_equal) / 2 / values.size * 100), 1)
+
+    def percentiles(self, overall_scores: Dict[str, float]) -> Dict[str, float]:
+        """Bách phân vị cho mọi khía cạnh trong `overall_scores` có dữ liệu cộng đồng."""
+        result = {}
+        for dimension, score in overall_scores.items():
+            pct = self.percentile(dimension, score)
+            if pct is not None:
+                result[dimension] = pct
+        return result
+
+    def save(self, file_path: str = NORMS_FILE_PATH) -> bool:
+        """Ghi qua file tạm rồi os.replace: tiến trình khác đang khởi động không bao giờ đọc phải file ghi dở."""
+        with self._lock:
+            dimensions = list(self.sorted_scores.keys())
+            arrays = [self.sorted_scores[d] for d in dimensions]
+            submissions, unsaved = self.submissions, self._unsaved
+        temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+            with open(temp_path, 'wb') as f:
+                np.savez(f,
+                         dimensions=np.array(dimensions, dtype=str),
+                         offsets=np.cumsum([0] + [values.size for values in arrays]),
+                         values=np.concatenate(arrays) if arrays else np.empty(0),
+                         bank_version=np.array(self.bank_version),
+                         submissions=np.array(submissions),
+                         built_at=np.array(self.built_at))
+            os.replace(temp_path, file_path)
+        except OSError as e:
+            print(f"Lỗi khi lưu cohort norms: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+        with self._lock:
+            self._unsaved -= unsaved
+        self.file_path = file_path
+        return True
+
+    @classmethod
+    def load(cls, file_path: str = NORMS_FILE_PATH) -> "CohortNorms | None":
+        if not os.path.exists(file_path):
+            return None
+        try:
+            with np.load(file_path, allow_pickle=False) as data:
+                offsets = data["offsets"]
+                values = data["values"]
+                sorted_scores = {str(d): values[offsets[i]:offsets[i + 1]] for i, d in enumerate(data["dimensions"])}
+                # File cũ không có số bài làm/thời điểm xây: coi như đã cũ
+                submissions = int(data["submissions"]) if "submissions" in data.files else 0
+                built_at = float(data["built_at"]) if "built_at" in data.files else 0.0
+                norms = cls(sorted_scores, str(data["bank_version"]), submissions, built_at)
+        except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile) as e: # File hỏng: load_or_build sẽ xây lại
+            print(f"Lỗi khi tải cohort norms: {e}")
+            return None
+        norms.file_path = file_path
+        return norms
+
+    @classmethod
+    def load_or_build(cls, analyzer: Analyzer, storage: DataStorage, file_path: str = NORMS_FILE_PATH,
+                      max_age_seconds: float = MAX_AGE_SECONDS, rebuild_below: int = REBUILD_BELOW,
+                      store: ResponseMatrixStore | None = None) -> "CohortNorms":
+        """
+        Dùng norms đã lưu nếu chưa cũ (xem is_stale), nếu không thì xây lại và lưu: từ `store` (ma trận đáp án
+        được cập nhật cùng storage) nếu có và cùng bộ câu hỏi, ngược lại quét kho phản hồi.
+        Với store, norms có số bài làm khác số hàng của store (cập nhật của tiến trình khác chưa được lưu) cũng bị xây lại.
+        """
+        use_store = store is not None and store.codec.version == analyzer.bank_version
+        norms = cls.load(file_path)
+        if (norms is None or norms.is_stale(analyzer, max_age_seconds, rebuild_below)
+                or (use_store and norms.submissions != len(store))):
+            norms = (cls.build_from_store(analyzer, store) if use_store else None) or cls.build(analyzer, storage)
+            norms.save(file_path)
+        return norms
+
+
+if __name__ == '__main__':
+    # Xây dựng lại norms từ toàn bộ kho phản hồi (qua ma trận đáp án, xây store nếu chưa có)
+    from core.question_generator import QuestionGenerator
+    from core.response_codec import ResponseCodec
+    generator = QuestionGenerator()
+    analyzer = generator.create_analyzer()
+    norms = CohortNorms.build_from_store(analyzer, ResponseMatrixStore.load_or_build(ResponseCodec(generator.bank), create_storage()))
+    norms.save()
+    print(f"Đã lưu cohort norms vào: {os.path.abspath(NORMS_FILE_PATH)}")
+    for dimension in analyzer.dimensions[:5]:
+        print(f"{dimension}: n={norms.cohort_size(dimension)}, điểm 4.0 -> bách phân vị {norms.percentile(dimension, 4.0)}")
@@ -0,0 +1,285 @@
+# self_assessment_system/core/compaction.py
+import collections
+import itertools
+import json
+import os
+import threading
+import time
+import zlib
+from typing import List, Dict, Any, Iterable, Iterator, Tuple
+
+from utils.file_lock import FileLock, LockTimeout
+
+SEGMENTS_DIRNAME = 'segments'
+SEGMENT_PREFIX = 'segment_'
+SEGMENT_SUFFIX = '.seg'
+INDEX_SUFFIX = '.idx.json'
+COMPACTION_LOCK_FILE = '.compaction.lock'
+RECORDS_PER_BLOCK = 256 # Đọc một bản ghi = giải nén một khối (~256 bản ghi)
+
+
+class CompactedSegments:
+    """
+    Các file phản hồi cũ của DataStorage sau khi gộp: data/segments/segment_XXXXXXXX.seg là chuỗi các khối zlib,
+    mỗi khối chứa tối đa RECORDS_PER_BLOCK bản ghi JSON gọn (một dòng mỗi bản ghi); file phụ .idx.json ghi
+    vị trí các khối và tên file gốc -> (khối, dòng). Bản ghi vẫn được tra theo tên file gốc, nên manifest và
+    mọi API đọc của DataStorage không đổi. Segment chỉ có hiệu lực khi file .idx.json tồn tại (ghi sau cùng).
+    Mỗi lúc chỉ một tiến trình gộp (khóa data/.compaction.lock), nên số segment và file tạm không bị tranh chấp;
+    người đọc và người ghi bài mới không cần khóa.
+    """
+
+    def __init__(self, data_directory: str, cached_blocks: int = 8):
+        self.data_directory = data_directory
+        self.directory = os.path.join(data_directory, SEGMENTS_DIRNAME)
+        self._lock = threading.Lock()
+        self._locations: Dict[str, Tuple[int, int, int]] = {} # tên file gốc -> (segment, khối, dòng)
+        self._blocks: Dict[int, List[List[int]]] = {} # segment -> [[offset, độ dài nén], ...]
+        self._block_cache: collections.OrderedDict = collections.OrderedDict()
+        self._cached_blocks = cached_blocks
+        self._compaction_lock = FileLock(os.path.join(data_directory, COMPACTION_LOCK_FILE))
+
+    def _segment_path(self, segment_no: int, suffix: str = SEGMENT_SUFFIX) -> str:
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{segment_no:08d}{suffix}")
+
+    def segment_numbers(self) -> List[int]:
+        """Các segment đã hoàn tất (có file index), tăng dần."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(name[len(SEGMENT_PREFIX):-len(INDEX_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.startswith(SEGMENT_PREFIX) and name.endswith(INDEX_SUFFIX))
+
+    def refresh(self) -> List[int]:
+        """Nạp index của các segment mới hoàn tất (do tiến trình khác hoặc lần gộp mới). Trả về các segment vừa nạp."""
+        added = []
+        with self._lock:
+            for segment_no in self.segment_numbers():
+                if segment_no in self._blocks:
+                    continue
+                try:
+                    with open(self._segment_path(segment_no, INDEX_SUFFIX), 'r', encoding='utf-8') as f:
+                        index = json.load(f)
+                except (IOError, json.JSONDecodeError) as e:
+                    print(f"Bỏ qua index segment {segment_no} không đọc được: {e}")
+                    continue
+                self._blocks[segment_no] = index["blocks"]
+                for filename, block, line in index["records"]:
+                    self._locations[filename] = (segment_no, block, line)
+                added.append(segment_no)
+        return added
+
+    def _read_block(self, segment_no: int, block: int) -> List[bytes]:
+        key = (segment_no, block)
+        with self._lock:
+            lines = self._block_cache.get(key)
+            if lines is not None:
+                self._block_cache.move_to_end(key)
+                return lines
+            offset, length = self._blocks[segment_no][block]
+        with open(self._segment_path(segment_no), 'rb') as f:
+            f.seek(offset)
+            lines = zlib.decompress(f.read(length)).split(b"\n")
+        with self._lock:
+            self._block_cache[key] = lines
+            if len(self._block_cache) > self._cached_blocks:
+                self._block_cache.popitem(last=False)
+        return lines
+
+    def read(self, filename: str) -> Dict[str, Any] | None:
+        """Bản ghi của file gốc đã được gộp; None nếu không có trong segment nào."""
+        location = self._locations.get(filename)
+        if location is None and self.refresh(): # Có thể vừa được gộp bởi lần chạy khác
+            location = self._locations.get(filename)
+        if location is None:
+            return None
+        return self.read_location(location)
+
+    def loaded_segments(self) -> List[int]:
+        return list(self._blocks)
+
+    def location(self, filename: str) -> Tuple[int, int, int] | None:
+        return self._locations.get(filename)
+
+    def iter_locations(self, segment_numbers: Iterable[int]) -> Iterator[Tuple[str, Tuple[int, int, int]]]:
+        """(tên file gốc, (segment, khối, dòng)) của các segment cho trước, theo thứ tự lưu trong segment."""
+        wanted = set(segment_numbers)
+        for filename, location in sorted(((f, loc) for f, loc in list(self._locations.items()) if loc[0] in wanted),
+                                         key=lambda item: item[1]):
+            yield filename, location
+
+    def read_location(self, location: Tuple[int, int, int]) -> Dict[str, Any] | None:
+        segment_no, block, line = location
+        try:
+            return json.loads(self._read_block(segment_no, block)[line])
+        except (IOError, OSError, zlib.error, json.JSONDecodeError, IndexError) as e:
+            print(f"Lỗi khi đọc segment {segment_no}, khối {block}: {e}")
+            return None
+
+    # --- Gộp ---
+    def _write_segment(self, segment_no: int, items: Iterable[Tuple[str, Dict[str, Any]]]) -> List[str]:
+        """
+        Ghi segment và index qua file tạm; index được đổi tên sau cùng và đánh dấu segment hoàn tất.
+        items được đọc dần từng khối, nên bộ nhớ chỉ giữ một khối bản ghi dù segment lớn. Trả về các tên file đã ghi.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        segment_path, index_path = self._segment_path(segment_no), self._segment_path(segment_no, INDEX_SUFFIX)
+        blocks, records = [], []
+        items = iter(items)
+        with open(segment_path + ".tmp", 'wb') as f:
+            while True:
+                chunk = list(itertools.islice(items, RECORDS_PER_BLOCK))
+                if not chunk:
+                    break
+                payload = "\n".join(json.dumps(record, ensure_ascii=False, separators=(',', ':')) for _, record in chunk)
+                compressed = zlib.compress(payload.encode('utf-8'), 6)
+                blocks.append([f.tell(), len(compressed)])
+                f.write(compressed)
+                records.extend([filename, len(blocks) - 1, line] for line, (filename, _) in enumerate(chunk))
+            f.flush()
+            os.fsync(f.fileno())
+        if not records:
+            os.remove(segment_path + ".tmp")
+            return []
+        with open(index_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump({"blocks": blocks, "records": records}, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(segment_path + ".tmp", segment_path)
+        os.replace(index_path + ".tmp", index_path)
+        return [filename for filename, _, _ in records]
+
+    def _read_candidates(self, filenames: List[str]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for filename in filenames:
+            try:
+                with open(os.path.join(self.data_directory, filename), 'r', encoding='utf-8') as f:
+                    yield filename, json.load(f)
+            except (IOError, json.JSONDecodeError) as e:
+                print(f"Bỏ qua file phản hồi không đọc được '{filename}': {e}")
+
+    def _verify_and_remove(self, filenames: List[str]) -> Tuple[int, int]:
+        """
+        So từng bản ghi trong segment với file gốc; chỉ xóa file gốc khi khớp. Trả về (đã xóa, không khớp).
+        File gốc đã mất (bị xóa ở lần chạy trước) được bỏ qua.
+        """
+        removed = mismatched = 0
+        for filename in filenames:
+            path = os.path.join(self.data_directory, filename)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    original = json.load(f)
+            except FileNotFoundError:
+                continue
+            except (IOError, json.JSONDecodeError) as e:
+                print(f"Giữ lại '{filename}': không đọc được file gốc ({e})")
+                mismatched += 1
+                continue
+            if self.read(filename) != original:
+                print(f"Giữ lại '{filename}': bản ghi trong segment không khớp file gốc")
+                mismatched += 1
+                continue
+            os.remove(path)
+            removed += 1
+        return removed, mismatched
+
+    def compact(self, older_than_seconds: float = 7 * 24 * 3600, records_per_segment: int = 100_000) -> Dict[str, int]:
+        """
+        Gộp các file responses_*.json cũ hơn older_than_seconds thành segment mới, kiểm tra rồi xóa file gốc.
+        Chạy lại an toàn sau khi bị ngắt: file tạm dở dang bị bỏ, file gốc đã nằm trong segment hoàn tất thì
+        chỉ cần kiểm tra và xóa; mỗi lần chạy chỉ xử lý các file chưa gộp (tăng dần).
+        Nếu tiến trình khác đang gộp thì không chờ: trả về ngay với stats["busy"] = 1.
+        records_per_segment chỉ quyết định kích thước segment: bản ghi được đọc và nén từng khối một.
+        """
+        stats = {"compacted": 0, "segments": 0, "removed": 0, "mismatched": 0, "busy": 0}
+        try:
+            with self._compaction_lock.exclusive(timeout=0):
+                self._compact(older_than_seconds, records_per_segment, stats)
+        except LockTimeout:
+            print("Bỏ qua gộp: một tiến trình khác đang gộp thư mục này.")
+            stats["busy"] = 1
+        return stats
+
+    def _compact(self, older_than_seconds: float, records_per_segment: int, stats: Dict[str, int]) -> None:
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".tmp"): # Lần chạy trước bị ngắt trước khi segment hoàn tất
+                    os.remove(os.path.join(self.directory, name))
+        self.refresh()
+        cutoff_ns = time.time_ns() - int(older_than_seconds * 1e9)
+        already_compacted, candidates = [], []
+        with os.scandir(self.data_directory) as entries:
+            for entry in entries:
+                if not (entry.name.startswith("responses_") and entry.name.endswith(".json")):
+                    continue
+                if entry.name in self._locations:
+                    already_compacted.append(entry.name)
+                elif entry.stat().st_mtime_ns <= cutoff_ns:
+                    candidates.append(entry.name)
+        stats["removed"], stats["mismatched"] = self._verify_and_remove(already_compacted)
+
+        candidates.sort()
+        for start in range(0, len(candidates), records_per_segment):
+            segment_no = max(self.segment_numbers(), default=0) + 1
+            # Đọc file gốc ngay khi ghi từng khối, không giữ cả segment trong bộ nhớ
+            written = self._write_segment(segment_no, self._read_candidates(candidates[start:start + records_per_segment]))
+            if not written:
+                continue
+            self.refresh()
+            removed, mismatched = self._verify_and_remove(written)
+            stats["compacted"] += len(written)
+            stats["segments"] += 1
+            stats["removed"] += removed
+            stats["mismatched"] += mismatched
+
+
+if __name__ == '__main__':
+    import shutil
+    import sys
+    import tempfile
+    from core.data_storage import DataStorage, DATA_DIR
+
+    if len(sys.argv) > 1 and sys.argv[1] == "run": # python -m core.compaction run [số_ngày]
+        days = float(sys.argv[2]) if len(sys.argv) > 2 else 7
+        print(f"Kết quả gộp: {DataStorage(DATA_DIR).compact(older_than_seconds=days * 24 * 3600)}")
+        sys.exit(0)
+
+    print("--- Demo: 20.000 file phản hồi, gộp trong lúc một luồng khác vẫn đọc ---")
+    bench_dir = tempfile.mkdtemp()
+    storage = DataStorage(bench_dir)
+    responses = [{"question_id": f"Q{i:02d}", "answer": i % 5 + 1} for i in range(50)]
+    for start in range(0, 20_000, 1000):
+        storage.save_many([(f"user_{i % 2000}", responses, f"assessment_{i % 2}") for i in range(start, start + 1000)])
+    expected_latest = {u: storage.load_latest_response(f"user_{u}", "assessment_1") for u in range(0, 2000, 97)}
+    size_before = sum(e.stat().st_size for e in os.scandir(bench_dir) if e.is_file())
+
+    read_errors = []
+    stop = threading.Event()
+
+    def reader() -> None:
+        reader_storage = DataStorage(bench_dir)
+        while not stop.is_set():
+            for u, expected in expected_latest.items():
+                if reader_storage.load_latest_response(f"user_{u}", "assessment_1") != expected:
+                    read_errors.append(u)
+
+    reader_thread = threading.Thread(target=reader)
+    reader_thread.start()
+    start_time = time.perf_counter()
+    print(f"Lần gộp 1 (10.000 file/segment): {storage.compact(older_than_seconds=0, records_per_segment=10_000)}")
+    print(f"Thời gian: {time.perf_counter() - start_time:.1f} giây")
+    stop.set()
+    reader_thread.join()
+    size_after = sum(e.stat().st_size for e in os.scandir(os.path.join(bench_dir, SEGMENTS_DIRNAME)))
+    print(f"Dung lượng: {size_before / 1e6:.1f} MB file rời -> {size_after / 1e6:.1f} MB segment; lỗi đọc trong lúc gộp: {len(read_errors)}")
+
+    storage.save_many([("user_1", responses, "assessment_1")] * 10)
+    reopened = DataStorage(bench_dir)
+    print(f"Sau khi gộp: iter_responses đọc {sum(1 for _ in reopened.iter_responses())} bài làm, "
+          f"lịch sử user_1: {len(reopened.load_history('user_1'))} bài")
+
+    print("\n--- Mô phỏng bị ngắt: segment đã hoàn tất nhưng file gốc chưa xóa ---")
+    leftover = reopened.list_submissions("user_1")[0]
+    with open(os.path.join(bench_dir, leftover["file"]), 'w', encoding='utf-8') as f:
+        json.dump(reopened.segments.read(leftover["file"]), f)
+    with open(os.path.join(bench_dir, SEGMENTS_DIRNAME, "segment_00000009.seg.tmp"), 'wb') as f:
+        f.write(b"partial")
+    print(f"Chạy lại: {reopened.compact(older_than_seconds=3600)}")
+    shutil.rmtree(bench_dir)
@@ -1,56 +1,162 @@
 import json
 import os
 import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Tuple, Callable
+
+from core.compaction import CompactedSegments
+from core.submission_manifest import SubmissionManifest
+from utils.ulid import ULID_LENGTH, is_ulid, new_ulid
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+# Thư mục chứa các bảng/chỉ mục phân tích dẫn xuất từ kho phản hồi (norms, clustering...)
+ANALYTICS_DIR = os.path.join(os.path.dirname(__file__), '..', 'analytics')
 
 class DataStorage:
-    def __init__(self, data_directory: str = DATA_DIR):
+    def __init__(self, data_directory: str = DATA_DIR, fsync: bool = False):
+        self._init_directory(data_directory, fsync)
+        # Chỉ mục lịch sử lâu dài theo người dùng (data/.manifest), cập nhật cùng mỗi lần lưu
+        self.manifest = SubmissionManifest(self.data_directory)
+        # Các file cũ đã được gộp vào data/segments (compact); vẫn đọc được theo tên file gốc
+        self.segments = CompactedSegments(self.data_directory)
+
+    def _init_directory(self, data_directory: str, fsync: bool) -> None:
+        """
+        Phần khởi tạo chung của mọi backend (thư mục dữ liệu, save listener). Backend log/SQLite gọi hàm này thay cho
+        __init__: chúng không dùng manifest JSON và segment đã gộp của backend file rời.
+        """
         self.data_directory = data_directory
+        self.fsync = fsync # True: fsync từng file và thư mục trước khi báo đã lưu (bền vững cả khi mất điện)
         if not os.path.exists(self.data_directory):
             os.makedirs(self.data_directory)
+        self._save_listeners: List[Callable[[Dict[str, Any]], None]] = []
 
-    def save_responses(self, user_id: str, responses: List[Dict[str, Any]], assessment_name: str = "general") -> bool:
+    def add_save_listener(self, listener: Callable[[Dict[str, Any]], None]) -> None:
+        """Đăng ký hàm được gọi với bản ghi vừa lưu sau mỗi lần save_responses thành công."""
+        self._save_listeners.append(listener)
+
+    def remove_save_listener(self, listener: Callable[[Dict[str, Any]], None]) -> None:
+        """Gỡ một listener đã đăng ký (ví dụ chỉ mục của bộ câu hỏi cũ sau khi nạp lại)."""
+        # Tạo danh sách mới thay vì sửa tại chỗ: luồng ghi nền đang duyệt danh sách cũ không bị ảnh hưởng
+        self._save_listeners = [l for l in self._save_listeners if l != listener]
+
+    def _notify_saved(self, record: Dict[str, Any]) -> None:
+        for listener in self._save_listeners:
+            try:
+                listener(record)
+            except Exception as e:
+                print(f"Lỗi trong listener sau khi lưu phản hồi: {e}")
+
+    @staticmethod
+    def _new_record(user_id: str, responses: List[Dict[str, Any]], assessment_name: str) -> Dict[str, Any]:
         """
-        Lưu trữ phản hồi của người dùng.
-        responses: list of {"question_id": "...", "answer": "..."}
+        Bản ghi của một lần nộp bài, dùng chung cho mọi backend. submission_id là ULID (tăng dần trong tiến trình,
+        ngẫu nhiên 80 bit giữa các tiến trình): định danh duy nhất kể cả khi hai lần nộp trùng user và thời điểm.
         """
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"responses_{user_id}_{assessment_name}_{timestamp}.json"
-        file_path = os.path.join(self.data_directory, filename)
-
-        data_to_save = {
+        return {
             "user_id": user_id,
             "assessment_name": assessment_name,
             "timestamp": datetime.datetime.now().isoformat(),
+            "submission_id": new_ulid(),
             "responses": responses
         }
 
+    def _new_submission(self, user_id: str, responses: List[Dict[str, Any]], assessment_name: str) -> Tuple[str, Dict[str, Any]]:
+        """
+        Tên file và bản ghi của một lần nộp bài. Tên file mang submission_id nên hai lần nộp trong cùng một giây
+        không còn ghi đè lên nhau; tên file vẫn sắp xếp theo thời gian.
+        """
+        record = self._new_record(user_id, responses, assessment_name)
+        file_time = datetime.datetime.fromisoformat(record["timestamp"]).strftime('%Y%m%d_%H%M%S')
+        filename = f"responses_{user_id}_{assessment_name}_{file_time}_{record['submission_id']}.json"
+        return filename, record
+
+    def _write_files(self, submissions: List[Tuple[str, Dict[str, Any]]], indent: int | None = 4) -> List[bool]:
+        """
+        Ghi nguyên tử: mỗi bản ghi được ghi vào file tạm (không bắt đầu bằng "responses_" nên không bị đọc nhầm)
+        rồi os.replace sang tên thật, người đọc không bao giờ thấy file ghi dở. Với fsync=True, dữ liệu được fsync
+        trước khi đổi tên và thư mục được fsync một lần cho cả nhóm.
+        indent=None: JSON gọn, mã hóa bằng bộ mã hóa C của json (có indent thì json phải dùng bộ mã hóa Python, chậm hơn ~10 lần).
+        """
+        self._ensure_manifest()
+        results = []
+        for filename, record in submissions:
+            file_path = os.path.join(self.data_directory, filename)
+            temp_path = os.path.join(self.data_directory, f".tmp_{filename}")
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False, indent=indent))
+                    if self.fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+                os.replace(temp_path, file_path)
+            except (IOError, OSError, TypeError, ValueError) as e:
+                print(f"Lỗi khi lưu file: {e}")
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                results.append(False)
+                continue
+            results.append(True)
+        if self.fsync and any(results) and hasattr(os, 'O_DIRECTORY'):
+            directory_fd = os.open(self.data_directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(directory_fd)
+            finally:
+                os.close(directory_fd)
+        saved = [(record, filename) for (filename, record), ok in zip(submissions, results) if ok]
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data_to_save, f, ensure_ascii=False, indent=4)
-            print(f"Đã lưu phản hồi vào: {file_path}")
-            return True
-        except IOError as e:
-            print(f"Lỗi khi lưu file: {e}")
+            self.manifest.add(saved) # Sau khi file phản hồi đã nằm trên đĩa
+        except OSError as e:
+            print(f"Lỗi khi cập nhật manifest (chạy lại rebuild-manifest để khôi phục): {e}")
+        for (_, record), ok in zip(submissions, results):
+            if ok:
+                self._notify_saved(record)
+        return results
+
+    def save_responses(self, user_id: str, responses: List[Dict[str, Any]], assessment_name: str = "general") -> bool:
+        """
+        Lưu trữ phản hồi của người dùng.
+        responses: list of {"question_id": "...", "answer": "..."}
+        """
+        filename, record = self._new_submission(user_id, responses, assessment_name)
+        if not self._write_files([(filename, record)])[0]:
             return False
+        print(f"Đã lưu phản hồi vào: {os.path.join(self.data_directory, filename)}")
+        return True
 
-    def load_latest_response(self, user_id: str, assessment_name: str = "general") -> Dict[str, Any] | None:
-        """Tải phản hồi gần nhất của người dùng cho một bài đánh giá cụ thể."""
-        try:
-            response_files = [
-                f for f in os.listdir(self.data_directory)
-                if f.startswith(f"responses_{user_id}_{assessment_name}_") and f.endswith(".json")
-            ]
-            if not response_files:
-                return None
+    def save_many(self, submissions: Iterable[Tuple[str, List[Dict[str, Any]], str]]) -> List[bool]:
+        """
+        Lưu một nhóm bài làm (user_id, responses, assessment_name); trả về kết quả của từng bài theo thứ tự.
+        Backend JSON: mỗi bài một file JSON gọn (ghi nguyên tử), chỉ mục và fsync thư mục được cập nhật một lần cho cả nhóm.
+        """
+        return self._write_files([self._new_submission(user_id, responses, assessment_name)
+                                  for user_id, responses, assessment_name in submissions], indent=None)
 
-            latest_file = sorted(response_files, reverse=True)[0]
-            file_path = os.path.join(self.data_directory, latest_file)
+    def _ensure_manifest(self) -> None:
+        """
+        Lần đầu dùng manifest với một thư mục cũ (chưa có manifest): dựng từ các file hiện có, chỉ một lần
+        kể cả khi nhiều tiến trình cùng mở thư mục (các tiến trình còn lại chờ rồi dùng manifest vừa dựng).
+        """
+        if not self.manifest.is_complete():
+            self.rebuild_manifest(if_incomplete=True)
 
-            with open(file_path, 'r', encoding='utf-8') as f:
+    def rebuild_manifest(self, if_incomplete: bool = False) -> int:
+        """Dựng lại manifest từ mọi bài làm trên đĩa (file rời và segment đã gộp). Trả về số bài làm."""
+        return self.manifest.rebuild(((record, filename) for filename, record in self._iter_stored()), if_incomplete)
+
+    def compact(self, older_than_seconds: float = 7 * 24 * 3600, records_per_segment: int = 100_000) -> Dict[str, int]:
+        """Gộp các file phản hồi cũ thành segment nén (xem CompactedSegments.compact); các API đọc không đổi."""
+        return self.segments.compact(older_than_seconds, records_per_segment)
+
+    def _read_submission(self, filename: str) -> Dict[str, Any] | None:
+        """Đọc bài làm theo tên file gốc: file rời, hoặc từ segment nếu file đã được gộp."""
+        try:
+            with open(os.path.join(self.data_directory, filename), 'r', encoding='utf-8') as f:
                 return json.load(f)
+        except FileNotFoundError:
+            record = self.segments.read(filename)
+            if record is None:
+                print(f"Lỗi khi tải file: không tìm thấy '{filename}'")
+            return record
         except IOError as e:
             print(f"Lỗi khi tải file: {e}")
             return None
@@ -58,8 +164,153 @@ class DataStorage:
             print(f"Lỗi: File phản hồi không phải là JSON hợp lệ.")
             return None
 
+    def load_latest_response(self, user_id: str, assessment_name: str = "general") -> Dict[str, Any] | None:
+        """Tải phản hồi gần nhất của người dùng cho một bài đánh giá cụ thể (tra manifest, không liệt kê thư mục)."""
+        self._ensure_manifest()
+        latest_file = self.manifest.latest(user_id, assessment_name)
+        return self._read_submission(latest_file) if latest_file is not None else None
+
+    def list_submissions(self, user_id: str, assessment_name: str | None = None) -> List[Dict[str, str]]:
+        """Danh sách các lần làm bài của người dùng (mọi bài đánh giá nếu assessment_name là None), cũ -> mới."""
+        self._ensure_manifest()
+        return [
+            {"timestamp": timestamp, "assessment_name": name, "file": filename}
+            for timestamp, name, filename in self.manifest.history(user_id, assessment_name)
+        ]
+
+    def load_history(self, user_id: str, assessment_name: str | None = None) -> List[Dict[str, Any]]:
+        """Tải toàn bộ các lần làm bài của người dùng theo thứ tự thời gian."""
+        history = []
+        for submission in self.list_submissions(user_id, assessment_name):
+            record = self._read_submission(submission["file"])
+            if record is not None:
+                history.append(record)
+        return history
+
+    def _iter_stored(self, wanted: Callable[[str], bool] | None = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        (tên file gốc, bản ghi) của mọi bài làm: trong các segment đã gộp rồi các file rời, mỗi bài đúng một lần
+        kể cả khi một lần gộp đang chạy song song (file bị xóa sau khi đã duyệt segment sẽ được đọc từ segment mới).
+        wanted: lọc trước theo tên file, trước khi đọc bản ghi.
+        """
+        segments = self.segments
+        segments.refresh()
+        seen_segments = set(segments.loaded_segments())
+        for filename, location in segments.iter_locations(seen_segments):
+            if wanted is None or wanted(filename):
+                record = segments.read_location(location)
+                if record is not None:
+                    yield filename, record
+        loose_files = set()
+        with os.scandir(self.data_directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if not (name.startswith("responses_") and name.endswith(".json")):
+                    continue
+                location = segments.location(name)
+                if location is not None and location[0] in seen_segments:
+                    continue
+                loose_files.add(name)
+                if wanted is not None and not wanted(name):
+                    continue
+                try:
+                    with open(entry.path, 'r', encoding='utf-8') as f:
+                        record = json.load(f)
+                except FileNotFoundError:
+                    loose_files.discard(name) # Vừa được gộp: đọc từ segment mới ở dưới
+                    continue
+                except (IOError, json.JSONDecodeError) as e:
+                    print(f"Bỏ qua file phản hồi không đọc được '{name}': {e}")
+                    continue
+                yield name, record
+        segments.refresh()
+        new_segments = set(segments.loaded_segments()) - seen_segments
+        for filename, location in segments.iter_locations(new_segments):
+            if filename not in loose_files and (wanted is None or wanted(filename)):
+                record = segments.read_location(location)
+                if record is not None:
+                    yield filename, record
+
+    def iter_responses(self, user_id: str | None = None, assessment_name: str | None = None,
+                       since: datetime.datetime | str | None = None,
+                       until: datetime.datetime | str | None = None) -> Iterator[Dict[str, Any]]:
+        """
+        Duyệt lần lượt từng bản ghi phản hồi đã lưu (file rời và segment đã gộp), mỗi lần chỉ giữ một bản ghi.
+        Bộ lọc (tùy chọn): user_id, assessment_name, khoảng thời gian since <= timestamp < until.
+        Bài làm bị loại trước khi đọc dựa vào tên file gốc (tiền tố user/bài đánh giá, thời điểm lưu);
+        bản ghi đọc được vẫn được kiểm tra lại vì tên file không tách user_id/assessment_name chắc chắn.
+        """
+        since_iso, until_iso = time_bound(since), time_bound(until)
+        # Thời điểm trong tên file (làm tròn xuống giây) luôn <= timestamp của bản ghi
+        since_name = (datetime.datetime.fromisoformat(since_iso) - datetime.timedelta(minutes=1)).strftime("%Y%m%d_%H%M%S") if since_iso else None
+        until_name = datetime.datetime.fromisoformat(until_iso).strftime("%Y%m%d_%H%M%S") if until_iso else None
+        prefix = "responses_" + (f"{user_id}_" if user_id is not None else "")
+        if user_id is not None and assessment_name is not None:
+            prefix += f"{assessment_name}_"
+
+        def wanted(name: str) -> bool:
+            if not name.startswith(prefix):
+                return False
+            stem = name[:-len(".json")]
+            if is_ulid(stem[-ULID_LENGTH:]) and stem[-ULID_LENGTH - 1:-ULID_LENGTH] == "_":
+                stem = stem[:-ULID_LENGTH - 1] # Tên file mới: ..._{YYYYmmdd_HHMMSS}_{submission_id}.json
+            file_time = stem[-len("YYYYmmdd_HHMMSS"):]
+            if file_time[8:9] == "_" and file_time.replace("_", "").isdigit(): # Chỉ lọc trước với tên file chuẩn
+                if assessment_name is not None and not stem[:-len(file_time) - 1].endswith(f"_{assessment_name}"):
+                    return False
+                if (since_name and file_time < since_name) or (until_name and file_time > until_name):
+                    return False
+            return True
+
+        for _, record in self._iter_stored(wanted):
+            if record_matches(record, user_id, assessment_name, since_iso, until_iso):
+                yield record
+
+
+def time_bound(value: datetime.datetime | str | None) -> str | None:
+    """Chuẩn hóa mốc thời gian lọc về chuỗi ISO (so sánh được trực tiếp với trường timestamp của bản ghi)."""
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return datetime.datetime.fromisoformat(value).isoformat()
+
+
+def record_matches(record: Dict[str, Any], user_id: str | None, assessment_name: str | None,
+                   since_iso: str | None, until_iso: str | None) -> bool:
+    """Bộ lọc chung cho iter_responses của các backend (since bao gồm, until không bao gồm)."""
+    timestamp = record.get("timestamp", "")
+    return ((user_id is None or record.get("user_id") == user_id)
+            and (assessment_name is None or record.get("assessment_name") == assessment_name)
+            and (since_iso is None or timestamp >= since_iso)
+            and (until_iso is None or timestamp < until_iso))
+
+# Chọn backend lưu trữ cho các UI: "json" (mặc định, mỗi lần nộp bài một file), "log" (segment chỉ-ghi-nối)
+# hoặc "sqlite"
+STORAGE_BACKEND_ENV = "SELF_ASSESSMENT_STORAGE"
+
+
+def create_storage(backend: str | None = None) -> DataStorage:
+    """Tạo DataStorage theo tên backend, mặc định đọc từ biến môi trường SELF_ASSESSMENT_STORAGE."""
+    backend = (backend or os.environ.get(STORAGE_BACKEND_ENV) or "json").lower()
+    if backend == "log":
+        from core.log_storage import SegmentLogStorage
+        return SegmentLogStorage()
+    if backend == "sqlite":
+        from core.sqlite_storage import SQLiteStorage
+        return SQLiteStorage()
+    if backend != "json":
+        print(f"Lỗi: Backend lưu trữ '{backend}' không hợp lệ, dùng 'json'.")
+    return DataStorage()
+
 
 if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild-manifest": # python -m core.data_storage rebuild-manifest [thư_mục]
+        target = DataStorage(sys.argv[2] if len(sys.argv) > 2 else DATA_DIR)
+        print(f"Đã dựng lại manifest: {target.rebuild_manifest()} bài làm")
+        sys.exit(0)
+
     # Test
     storage = DataStorage()
     user_responses_test = [
@@ -71,4 +322,40 @@ if __name__ == '__main__':
     loaded_data = storage.load_latest_response("test_user")
     if loaded_data:
         print("\nDữ liệu phản hồi đã tải:")
-        print(json.dumps(loaded_data, indent=2, ensure_ascii=False))
\ No newline at end of file
+        print(json.dumps(loaded_data, indent=2, ensure_ascii=False))
+
+    import tempfile
+    import threading
+    import time
+
+    print("\n--- Benchmark: save_many, 4 luồng × 5.000 bài làm của cùng một người dùng ---")
+    bench_storage = DataStorage(tempfile.mkdtemp())
+    responses = [{"question_id": f"Q{i:02d}", "answer": i % 5 + 1} for i in range(50)]
+
+    def ingest() -> None:
+        for _ in range(50):
+            bench_storage.save_many([("bench_user", responses, "bench")] * 100)
+
+    start_time = time.perf_counter()
+    threads = [threading.Thread(target=ingest) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start_time
+    saved = list(bench_storage.iter_responses("bench_user", "bench"))
+    print(f"Ghi 20000 bài làm: {elapsed:.2f} giây ({20000 / elapsed:.0f} bài/giây)")
+    print(f"Đọc lại: {len(saved)} bài làm, {len({r['submission_id'] for r in saved})} submission_id khác nhau")
+
+    print("\n--- Benchmark: load_latest_response với 10 file và 100.000 file (10.000 người dùng) ---")
+    for num_files in (10, 100_000):
+        latency_storage = DataStorage(tempfile.mkdtemp())
+        for start in range(0, num_files, 1000):
+            latency_storage.save_many([(f"user_{i % 10_000}", responses, "bench") for i in range(start, min(start + 1000, num_files))])
+        start_time = time.perf_counter()
+        for i in range(1000):
+            latency_storage.load_latest_response(f"user_{i * 7 % min(num_files, 10_000)}", "bench")
+        elapsed = (time.perf_counter() - start_time) / 1000
+        start_time = time.perf_counter()
+        os.listdir(latency_storage.data_directory)
+        print(f"{num_files} file: {elapsed * 1000:.3f} ms / lần (một lần os.listdir như cách cũ: {(time.perf_counter() - start_time) * 1000:.1f} ms)")
\ No newline at end of file
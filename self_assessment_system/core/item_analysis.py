@@ -0,0 +1,144 @@
+# self_assessment_system/core/item_analysis.py
+from typing import List, Dict, Any, Iterable, Tuple
+
+import numpy as np
+
+from core.analyzer import Analyzer
+from core.data_storage import DataStorage, create_storage
+from core.response_matrix import ResponseMatrixStore
+
+# Chỉ những loại câu hỏi cho một điểm số trên mỗi câu mới được coi là item của thang đo
+ITEM_QUESTION_TYPES = ("likert", "yes_no")
+
+
+class ItemAnalyzer:
+    """
+    Phân tích item (psychometric) trên toàn bộ kho phản hồi, dựa trên Analyzer:
+    Cronbach's alpha cho mỗi khía cạnh/danh mục, tương quan item-tổng đã hiệu chỉnh
+    và alpha nếu bỏ item. Mọi phép tính đều vector hóa qua ma trận hiệp phương sai.
+    """
+
+    def __init__(self, analyzer: Analyzer):
+        self.analyzer = analyzer
+        self.item_slots = np.array([slot for slot, q_id in enumerate(analyzer.slot_question_ids)
+                                    if analyzer.questions_map[q_id].get('type') in ITEM_QUESTION_TYPES], dtype=np.intp)
+        self.item_ids = [analyzer.slot_question_ids[slot] for slot in self.item_slots]
+
+    def build_item_matrix(self, response_sets: Iterable[List[Dict[str, Any]]], chunk_size: int = 8192) -> np.ndarray:
+        """Ma trận điểm (người dùng × item) theo thứ tự self.item_ids, NaN nếu không trả lời."""
+        chunks: List[np.ndarray] = []
+        batch: List[List[Dict[str, Any]]] = []
+        for responses in response_sets:
+            batch.append(responses)
+            if len(batch) >= chunk_size:
+                chunks.append(self.analyzer.batch_item_scores(batch)[:, self.item_slots])
+                batch = []
+        if batch:
+            chunks.append(self.analyzer.batch_item_scores(batch)[:, self.item_slots])
+        return np.vstack(chunks) if chunks else np.empty((0, len(self.item_ids)))
+
+    def build_item_matrix_from_storage(self, storage: DataStorage, assessment_name: str | None = None,
+                                       since: str | None = None, until: str | None = None) -> np.ndarray:
+        """Ma trận item của các bài làm trong kho, có thể giới hạn theo bài đánh giá và khoảng thời gian."""
+        records = storage.iter_responses(assessment_name=assessment_name, since=since, until=until)
+        return self.build_item_matrix(record.get("responses", []) for record in records)
+
+    def build_item_matrix_from_store(self, store: ResponseMatrixStore, assessment_name: str | None = None) -> np.ndarray | None:
+        """Như build_item_matrix_from_storage nhưng tính thẳng từ ma trận đáp án; None nếu store khác bộ câu hỏi."""
+        rows = store.select(assessment_name=assessment_name) if assessment_name is not None else None
+        item_scores = store.item_scores(self.analyzer, rows)
+        return None if item_scores is None else item_scores[:, self.item_slots]
+
+    @staticmethod
+    def cronbach_statistics(items: np.ndarray) -> Tuple[float, np.ndarray, np.ndarray, int]:
+        """
+        Tính cho một thang đo (n × k, chỉ gồm các hàng đầy đủ):
+        alpha, tương quan item-tổng đã hiệu chỉnh (k,), alpha nếu bỏ item (k,), n.
+        Tất cả suy ra từ ma trận hiệp phương sai k × k, không lặp theo hàng.
+        """
+        n, k = items.shape
+        nan_items = np.full(k, np.nan)
+        if n < 2 or k < 2:
+            return float('nan'), nan_items, nan_items, n
+
+        centered = items - items.mean(axis=0)
+        cov = centered.T @ centered / (n - 1)
+        item_vars = np.diag(cov)
+        total_var = cov.sum()
+        sum_item_vars = item_vars.sum()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            alpha = k / (k - 1) * (1 - sum_item_vars / total_var)
+            # cov(X_i, T - X_i) và var(T - X_i) với T là tổng điểm
+            cov_item_rest = cov.sum(axis=1) - item_vars
+            rest_var = total_var - 2 * cov.sum(axis=1) + item_vars
+            item_total_r = cov_item_rest / np.sqrt(item_vars * rest_var)
+            if k > 2:
+                alpha_if_deleted = (k - 1) / (k - 2) * (1 - (sum_item_vars - item_vars) / rest_var)
+            else:
+                alpha_if_deleted = nan_items
+        return float(alpha), item_total_r, alpha_if_deleted, n
+
+    def _groups(self, group_by: str) -> Dict[str, List[int]]:
+        groups: Dict[str, List[int]] = {}
+        for col, q_id in enumerate(self.item_ids):
+            if group_by == "category":
+                key = self.analyzer.questions_map[q_id].get('category')
+            else:
+                key = self.analyzer.dimensions[self.analyzer.slot_dimension_index[self.item_slots[col]]]
+            groups.setdefault(key, []).append(col)
+        return groups
+
+    def reliability(self, item_matrix: np.ndarray, group_by: str = "dimension", min_items: int = 2) -> Dict[str, Dict[str, Any]]:
+        """
+        Độ tin cậy cho mỗi nhóm item (group_by = "dimension" hoặc "category").
+        Mỗi nhóm dùng các hàng trả lời đủ mọi item trong nhóm (listwise deletion).
+        Trả về {nhóm: {"alpha", "n", "k", "items": {question_id: {"item_total_r", "alpha_if_deleted"}}}}.
+        """
+        report: Dict[str, Dict[str, Any]] = {}
+        for group, cols in self._groups(group_by).items():
+            if len(cols) < min_items:
+                continue
+            items = item_matrix[:, cols]
+            items = items[~np.isnan(items).any(axis=1)]
+            alpha, item_total_r, alpha_if_deleted, n = self.cronbach_statistics(items)
+            report[group] = {
+                "alpha": round(alpha, 3) if not np.isnan(alpha) else None,
+                "n": n,
+                "k": len(cols),
+                "items": {
+                    self.item_ids[col]: {
+                        "item_total_r": round(float(item_total_r[i]), 3) if not np.isnan(item_total_r[i]) else None,
+                        "alpha_if_deleted": round(float(alpha_if_deleted[i]), 3) if not np.isnan(alpha_if_deleted[i]) else None,
+                    }
+                    for i, col in enumerate(cols)
+                },
+            }
+        return report
+
+
+if __name__ == '__main__':
+    import time
+    from core.question_generator import QuestionGenerator
+
+    from core.response_codec import ResponseCodec
+
+    generator = QuestionGenerator()
+    item_analyzer = ItemAnalyzer(generator.create_analyzer())
+
+    print("--- Độ tin cậy trên kho phản hồi hiện có ---")
+    store = ResponseMatrixStore.load_or_build(ResponseCodec(generator.bank), create_storage())
+    archive_matrix = item_analyzer.build_item_matrix_from_store(store)
+    for group, stats in item_analyzer.reliability(archive_matrix, group_by="category").items():
+        print(f"{group}: alpha={stats['alpha']} (n={stats['n']}, k={stats['k']})")
+
+    print("\n--- Dữ liệu mô phỏng: 300.000 bài làm ---")
+    rng = np.random.default_rng(0)
+    n_users = 300_000
+    latent = rng.normal(size=(n_users, 1))
+    simulated = np.clip(np.rint(3 + latent + rng.normal(scale=0.8, size=(n_users, len(item_analyzer.item_ids)))), 1, 5)
+    start = time.perf_counter()
+    report = item_analyzer.reliability(simulated, group_by="category")
+    print(f"Tính xong {len(report)} thang đo trong {time.perf_counter() - start:.2f} giây")
+    for group, stats in report.items():
+        worst_item = min(stats["items"].items(), key=lambda item: item[1]["item_total_r"] or 0)
+        print(f"{group}: alpha={stats['alpha']}, item yếu nhất {worst_item[0]} (r={worst_item[1]['item_total_r']})")
@@ -0,0 +1,366 @@
+# self_assessment_system/core/log_storage.py
+import bisect
+import datetime
+import json
+import os
+import struct
+import threading
+import zlib
+from typing import List, Dict, Any, Iterable, Iterator, Tuple, Callable
+
+from core.data_storage import DataStorage, time_bound, record_matches
+from utils.file_lock import FileLock
+
+LOG_DIR = os.path.join(os.path.dirname(__file__), '..', 'data_log')
+
+# Khung bản ghi: [độ dài key][độ dài payload][crc32(key + payload)] + key + payload
+# key = JSON gọn [user_id, assessment_name, timestamp] để dựng chỉ mục mà không cần giải mã payload
+FRAME_HEADER = struct.Struct('<III')
+
+
+class SegmentLogStorage(DataStorage):
+    """
+    Backend lưu trữ dạng log chỉ-ghi-nối: mỗi lần nộp bài là một bản ghi JSON gọn nối vào file segment
+    hiện tại, segment được "cuộn" sang file mới khi vượt max_segment_bytes. Thay cho hàng triệu file nhỏ.
+    - Group commit: các luồng lưu đồng thời dùng chung một lần fsync (luồng đến trước fsync cho cả nhóm).
+    - Khởi động: quét header của các segment để dựng chỉ mục; phần đuôi ghi dở của segment cuối bị cắt bỏ.
+    - Nhiều tiến trình: mỗi lần ghi nối giữ khóa file .append.lock; offset lấy từ kích thước thật của file và danh sách
+      segment được đọc lại dưới khóa, nên các tiến trình không ghi đè hay cuộn trùng segment của nhau. Trước mỗi lần
+      ghi/đọc, các bản ghi tiến trình khác đã nối vào được đưa vào chỉ mục (chỉ đọc key).
+    Giữ nguyên chữ ký save_responses / load_latest_response của DataStorage; mỗi bản ghi có submission_id (ULID) như
+    backend JSON. Không dùng manifest và segment đã gộp của backend JSON: chỉ mục dựng từ key của khung khi mở.
+    """
+
+    SEGMENT_PREFIX = "segment_"
+    SEGMENT_SUFFIX = ".log"
+    LOCK_FILE = ".append.lock"
+
+    def __init__(self, data_directory: str = LOG_DIR, max_segment_bytes: int = 64 * 1024 * 1024, fsync: bool = True):
+        self._init_directory(data_directory, fsync)
+        self.max_segment_bytes = max_segment_bytes
+        self._lock = threading.Lock() # Bảo vệ segment đang ghi và chỉ mục
+        self._sync_cond = threading.Condition()
+        self._sync_in_progress = False
+        self._written_seq = 0 # Số bản ghi đã ghi vào OS
+        self._durable_seq = 0 # Số bản ghi đã được fsync
+        # user_id -> [(timestamp, assessment_name, (segment_no, offset))] sắp xếp theo thời gian
+        self._user_index = {}
+        self._segments: List[int] = []
+        self._index_pos = (1, 0) # (segment, offset) đã được đưa vào chỉ mục
+        self._file_lock = FileLock(os.path.join(self.data_directory, self.LOCK_FILE))
+        with self._file_lock.exclusive(): # Không cắt đuôi segment trong lúc tiến trình khác đang ghi nối
+            self._recover()
+            self._active_no = self._segments[-1] if self._segments else 1
+            self._active = open(self._segment_path(self._active_no), 'ab')
+            if not self._segments:
+                self._segments.append(self._active_no)
+
+    def _segment_path(self, segment_no: int) -> str:
+        return os.path.join(self.data_directory, f"{self.SEGMENT_PREFIX}{segment_no:08d}{self.SEGMENT_SUFFIX}")
+
+    def _scan_segment(self, segment_no: int, read_payload: bool,
+                      key_filter: Callable[[List[str]], bool] | None = None,
+                      start: int = 0) -> Iterator[Tuple[int, int, List[str], bytes | None]]:
+        """
+        Duyệt các bản ghi của một segment từ offset `start`: (offset, offset kết thúc, key, payload hoặc None).
+        Khi read_payload=True, bản ghi có crc sai bị bỏ qua. Dừng tại khung không đầy đủ (đuôi ghi dở).
+        key_filter: bỏ qua (không đọc payload) các bản ghi có key không khớp.
+        """
+        with open(self._segment_path(segment_no), 'rb') as f:
+            f.seek(start)
+            offset = start
+            while True:
+                header = f.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    return
+                key_len, payload_len, crc = FRAME_HEADER.unpack(header)
+                key_bytes = f.read(key_len)
+                if key_filter is not None and len(key_bytes) == key_len:
+                    try:
+                        wanted = key_filter(json.loads(key_bytes))
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        wanted = True # Để nhánh bên dưới xử lý khung hỏng như bình thường
+                    if not wanted:
+                        f.seek(payload_len, os.SEEK_CUR)
+                        offset += FRAME_HEADER.size + key_len + payload_len
+                        continue
+                if read_payload:
+                    payload = f.read(payload_len)
+                    if len(key_bytes) < key_len or len(payload) < payload_len:
+                        return
+                    if zlib.crc32(payload, zlib.crc32(key_bytes)) != crc:
+                        print(f"Bỏ qua bản ghi hỏng tại segment {segment_no}, offset {offset}")
+                        offset += FRAME_HEADER.size + key_len + payload_len
+                        continue
+                else:
+                    payload = None
+                    if len(key_bytes) < key_len or f.seek(payload_len, os.SEEK_CUR) > os.fstat(f.fileno()).st_size:
+                        return
+                try:
+                    key = json.loads(key_bytes)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    return
+                end = offset + FRAME_HEADER.size + key_len + payload_len
+                yield offset, end, key, payload
+                offset = end
+
+    def _list_segments(self) -> List[int]:
+        return sorted(
+            int(name[len(self.SEGMENT_PREFIX):-len(self.SEGMENT_SUFFIX)])
+            for name in os.listdir(self.data_directory)
+            if name.startswith(self.SEGMENT_PREFIX) and name.endswith(self.SEGMENT_SUFFIX)
+        )
+
+    def _recover(self) -> None:
+        """
+        Dựng chỉ mục từ các segment; segment cuối được kiểm tra crc và cắt bỏ phần đuôi hỏng.
+        Gọi khi đang giữ khóa file (độc quyền).
+        """
+        self._segments = self._list_segments()
+        for position, segment_no in enumerate(self._segments):
+            is_last = position == len(self._segments) - 1
+            end = 0
+            for offset, end, key, payload in self._scan_segment(segment_no, read_payload=is_last):
+                self._index_record(key, (segment_no, offset))
+            if is_last:
+                if end < os.path.getsize(self._segment_path(segment_no)):
+                    print(f"Cắt bỏ phần đuôi ghi dở của segment {segment_no} tại offset {end}")
+                    os.truncate(self._segment_path(segment_no), end)
+                self._index_pos = (segment_no, end)
+
+    def _catch_up(self) -> None:
+        """
+        Gọi khi đang giữ self._lock: đưa vào chỉ mục các bản ghi mà tiến trình khác đã nối vào từ vị trí
+        self._index_pos (chỉ đọc key). Dừng ở khung chưa đầy đủ, lần sau đọc tiếp từ đó.
+        """
+        index_segment, index_offset = self._index_pos
+        if (self._segments and self._segments[-1] == index_segment
+                and os.path.getsize(self._segment_path(index_segment)) == index_offset
+                and not os.path.exists(self._segment_path(index_segment + 1))):
+            return # Không có gì mới: tránh listdir ở mỗi lần đọc
+        segments = self._list_segments()
+        for segment_no in segments:
+            if segment_no < index_segment:
+                continue
+            end = index_offset if segment_no == index_segment else 0
+            for offset, end, key, payload in self._scan_segment(segment_no, read_payload=False, start=end):
+                self._index_record(key, (segment_no, offset))
+            self._index_pos = (segment_no, end)
+        self._segments = segments
+
+    def _index_record(self, key: List[str], location: Tuple[int, int]) -> None:
+        user_id, assessment_name, timestamp = key
+        bisect.insort(self._user_index.setdefault(user_id, []), (timestamp, assessment_name, location))
+
+    def _switch_segment(self, segment_no: int) -> None:
+        """
+        Đóng segment hiện tại (sau khi fsync) và mở segment `segment_no` để ghi nối: segment mới khi cuộn,
+        hoặc segment mà tiến trình khác vừa cuộn sang. Gọi khi đang giữ self._lock và khóa file.
+        """
+        self._active.flush()
+        if self.fsync:
+            os.fsync(self._active.fileno())
+            self._durable_seq = self._written_seq
+        self._active.close()
+        self._active_no = segment_no
+        if segment_no not in self._segments:
+            self._segments.append(segment_no)
+        self._active = open(self._segment_path(segment_no), 'ab')
+
+    def _append(self, key: List[str], record: Dict[str, Any]) -> int:
+        key_bytes = json.dumps(key, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        payload = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        frame = FRAME_HEADER.pack(len(key_bytes), len(payload), zlib.crc32(payload, zlib.crc32(key_bytes))) + key_bytes + payload
+        with self._lock, self._file_lock.exclusive():
+            self._catch_up()
+            if self._segments[-1] != self._active_no: # Tiến trình khác đã cuộn sang segment mới
+                self._switch_segment(self._segments[-1])
+            size = os.fstat(self._active.fileno()).st_size
+            if size > self._index_pos[1]: # Đuôi dở của một tiến trình đã chết giữa lần ghi (người ghi khác đều giữ khóa)
+                print(f"Cắt bỏ phần đuôi ghi dở của segment {self._active_no} tại offset {self._index_pos[1]}")
+                os.truncate(self._segment_path(self._active_no), self._index_pos[1])
+                size = self._index_pos[1]
+            if size > 0 and size + len(frame) > self.max_segment_bytes:
+                self._switch_segment(self._active_no + 1)
+                size = 0
+            self._active.write(frame)
+            self._active.flush() # Ghi xuống OS trước khi nhả khóa
+            self._written_seq += 1
+            self._index_record(key, (self._active_no, size))
+            self._index_pos = (self._active_no, size + len(frame))
+            return self._written_seq
+
+    def _wait_durable(self, seq: int) -> None:
+        """
+        Group commit: nếu đang có luồng fsync thì chờ; luồng đầu tiên thấy chưa ai fsync sẽ fsync
+        một lần cho mọi bản ghi đã ghi tới thời điểm đó, rồi đánh thức các luồng đang chờ.
+        """
+        with self._sync_cond:
+            while self._durable_seq < seq and self._sync_in_progress:
+                self._sync_cond.wait()
+            if self._durable_seq >= seq:
+                return
+            self._sync_in_progress = True
+        synced_seq = None
+        try:
+            with self._lock:
+                target_seq = self._written_seq
+                fd = os.dup(self._active.fileno()) # Bản sao fd: segment có thể bị cuộn trong lúc fsync
+            try:
+                os.fsync(fd)
+                synced_seq = target_seq
+            finally:
+                os.close(fd)
+        finally:
+            with self._sync_cond:
+                self._sync_in_progress = False
+                if synced_seq is not None:
+                    self._durable_seq = max(self._durable_seq, synced_seq)
+                self._sync_cond.notify_all()
+
+    def save_responses(self, user_id: str, responses: List[Dict[str, Any]], assessment_name: str = "general") -> bool:
+        """Nối phản hồi vào log; trả về sau khi bản ghi đã được fsync (nếu bật fsync)."""
+        data_to_save = self._new_record(user_id, responses, assessment_name)
+        try:
+            seq = self._append([user_id, assessment_name, data_to_save["timestamp"]], data_to_save)
+            if self.fsync:
+                self._wait_durable(seq)
+        except (IOError, OSError, TypeError, ValueError) as e:
+            print(f"Lỗi khi ghi log phản hồi: {e}")
+            return False
+        self._notify_saved(data_to_save)
+        return True
+
+    def save_many(self, submissions: Iterable[Tuple[str, List[Dict[str, Any]], str]]) -> List[bool]:
+        """Nối cả nhóm bài làm vào log rồi chờ một lần fsync chung cho cả nhóm."""
+        results, saved, last_seq = [], [], 0
+        for user_id, responses, assessment_name in submissions:
+            data_to_save = self._new_record(user_id, responses, assessment_name)
+            try:
+                last_seq = self._append([user_id, assessment_name, data_to_save["timestamp"]], data_to_save)
+            except (IOError, OSError, TypeError, ValueError) as e:
+                print(f"Lỗi khi ghi log phản hồi: {e}")
+                results.append(False)
+                continue
+            results.append(True)
+            saved.append(data_to_save)
+        if saved and self.fsync:
+            try:
+                self._wait_durable(last_seq)
+            except OSError as e:
+                print(f"Lỗi khi fsync log phản hồi: {e}")
+                return [False] * len(results)
+        for record in saved:
+            self._notify_saved(record)
+        return results
+
+    def rebuild_manifest(self, if_incomplete: bool = False) -> int:
+        raise NotImplementedError("Backend log không có manifest: chỉ mục được dựng lại từ các segment mỗi khi mở")
+
+    def compact(self, older_than_seconds: float = 7 * 24 * 3600, records_per_segment: int = 100_000) -> Dict[str, int]:
+        raise NotImplementedError("Backend log đã lưu theo segment, không có file phản hồi rời để gộp")
+
+    def _read_record(self, location: Tuple[int, int]) -> Dict[str, Any] | None:
+        segment_no, offset = location
+        try:
+            with open(self._segment_path(segment_no), 'rb') as f:
+                f.seek(offset)
+                key_len, payload_len, crc = FRAME_HEADER.unpack(f.read(FRAME_HEADER.size))
+                body = f.read(key_len + payload_len)
+            if zlib.crc32(body) != crc:
+                print(f"Lỗi: Bản ghi tại segment {segment_no}, offset {offset} bị hỏng (crc không khớp).")
+                return None
+            return json.loads(body[key_len:])
+        except (IOError, struct.error, json.JSONDecodeError) as e:
+            print(f"Lỗi khi đọc bản ghi tại segment {segment_no}, offset {offset}: {e}")
+            return None
+
+    def load_latest_response(self, user_id: str, assessment_name: str = "general") -> Dict[str, Any] | None:
+        """Tải phản hồi gần nhất của người dùng cho một bài đánh giá cụ thể (tra chỉ mục, một lần đọc)."""
+        with self._lock:
+            self._catch_up()
+            entries = list(self._user_index.get(user_id, []))
+        for timestamp, name, location in reversed(entries):
+            if name == assessment_name:
+                return self._read_record(location)
+        return None
+
+    def list_submissions(self, user_id: str, assessment_name: str | None = None) -> List[Dict[str, Any]]:
+        """Danh sách các lần làm bài của người dùng, cũ -> mới; vị trí bản ghi là (segment, offset)."""
+        with self._lock:
+            self._catch_up()
+            entries = list(self._user_index.get(user_id, []))
+        return [
+            {"timestamp": timestamp, "assessment_name": name, "segment": location[0], "offset": location[1]}
+            for timestamp, name, location in entries
+            if assessment_name is None or name == assessment_name
+        ]
+
+    def load_history(self, user_id: str, assessment_name: str | None = None) -> List[Dict[str, Any]]:
+        history = []
+        for submission in self.list_submissions(user_id, assessment_name):
+            record = self._read_record((submission["segment"], submission["offset"]))
+            if record is not None:
+                history.append(record)
+        return history
+
+    def iter_responses(self, user_id: str | None = None, assessment_name: str | None = None,
+                       since: datetime.datetime | str | None = None,
+                       until: datetime.datetime | str | None = None) -> Iterator[Dict[str, Any]]:
+        """
+        Duyệt các bản ghi theo thứ tự ghi. Bộ lọc được áp trên key của khung (hoặc chỉ mục theo user_id)
+        nên payload của bản ghi không khớp không bao giờ được đọc/giải mã.
+        """
+        since_iso, until_iso = time_bound(since), time_bound(until)
+
+        def wanted(key: List[str]) -> bool:
+            return record_matches({"user_id": key[0], "assessment_name": key[1], "timestamp": key[2]},
+                                  user_id, assessment_name, since_iso, until_iso)
+
+        if user_id is not None: # Có sẵn vị trí từng bản ghi của người dùng trong chỉ mục
+            for submission in self.list_submissions(user_id, assessment_name):
+                if wanted([user_id, submission["assessment_name"], submission["timestamp"]]):
+                    record = self._read_record((submission["segment"], submission["offset"]))
+                    if record is not None:
+                        yield record
+            return
+        with self._lock:
+            self._catch_up()
+            segments = list(self._segments)
+        key_filter = wanted if (assessment_name, since_iso, until_iso) != (None, None, None) else None
+        for segment_no in segments:
+            for offset, end, key, payload in self._scan_segment(segment_no, read_payload=True, key_filter=key_filter):
+                yield json.loads(payload)
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._active.closed:
+                self._active.flush()
+                if self.fsync:
+                    os.fsync(self._active.fileno())
+                self._active.close()
+
+
+if __name__ == '__main__':
+    import tempfile
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    temp_dir = tempfile.mkdtemp()
+    storage = SegmentLogStorage(temp_dir, max_segment_bytes=256 * 1024)
+    responses = [{"question_id": f"Q{i:02d}", "answer": i % 5 + 1} for i in range(50)]
+    storage.save_responses("test_user", responses, "demo")
+    print(f"Bản ghi mới nhất: {storage.load_latest_response('test_user', 'demo')['timestamp']}")
+
+    print("\n--- Benchmark: 2000 lần lưu từ 16 luồng (group commit) ---")
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(lambda i: storage.save_responses(f"user_{i % 100}", responses, "demo"), range(2000)))
+    elapsed = time.perf_counter() - start_time
+    print(f"{2000 / elapsed:.0f} bản ghi/giây, {len(storage._segments)} segment")
+    storage.close()
+
+    reopened = SegmentLogStorage(temp_dir, max_segment_bytes=256 * 1024)
+    print(f"Mở lại: {sum(1 for _ in reopened.iter_responses())} bản ghi, "
+          f"{len(reopened.list_submissions('user_7'))} lần làm bài của user_7")
+    reopened.close()
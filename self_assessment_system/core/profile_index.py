@@ -0,0 +1,372 @@
+# self_assessment_system/core/profile_index.py
+import datetime
+import json
+import os
+import shutil
+import threading
+import uuid
+from typing import List, Dict, Any, Iterable
+
+import numpy as np
+
+from core.analyzer import Analyzer
+from core.data_storage import DataStorage, ANALYTICS_DIR
+from utils.file_lock import FileLock
+
+PROFILE_INDEX_DIR = os.path.join(ANALYTICS_DIR, 'profile_index')
+# reconcile() đọc lại các bài làm lưu từ (hồ sơ mới nhất trong chỉ mục - khoảng này): bù cho lệch giờ giữa các tiến trình
+RECONCILE_MARGIN = datetime.timedelta(minutes=10)
+
+
+class ProfileIndex:
+    """
+    Chỉ mục láng giềng gần nhất ("những hồ sơ giống tôi") trên vector điểm các khía cạnh.
+    - Trên đĩa: ma trận uint8 đã lượng tử hóa (append-only) + danh sách metadata từng hàng,
+      khởi động chỉ cần đọc file, không phải tính lại từ kho phản hồi.
+    - Trong bộ nhớ: ma trận float32 và chuẩn bình phương của từng hàng, truy vấn k-NN
+      là một phép nhân ma trận-vector (brute force) + argpartition.
+    - Nhiều tiến trình: mỗi lần ghi nối giữ khóa .lock của thư mục và nạp trước các hồ sơ tiến trình khác đã thêm.
+      build() dựng trong thư mục tạm rồi thay các file dưới khóa; meta.json mang một "generation" mới, nên tiến trình
+      đang mở chỉ mục cũ nhận ra và nạp lại từ đầu thay vì đọc tiếp theo offset cũ.
+    - load_or_build() đối chiếu với storage (reconcile) để bù các bài làm đã lưu khi chưa gắn chỉ mục.
+    - Nhiều luồng: save listener chạy trên luồng của AsyncStorageWriter trong khi UI truy vấn; truy vấn lấy
+      (vectors, norms) dưới self._lock rồi tính ngoài khóa. Các hàng [:size] không bao giờ bị ghi đè
+      (khi tăng dung lượng thì cấp phát mảng mới) nên ảnh chụp đó luôn nhất quán.
+    """
+
+    VECTORS_FILE = 'vectors.u8'
+    ROWS_FILE = 'rows.jsonl'
+    META_FILE = 'meta.json'
+    LOCK_FILE = '.lock'
+
+    def __init__(self, analyzer: Analyzer, directory: str = PROFILE_INDEX_DIR):
+        self.analyzer = analyzer
+        self.directory = directory
+        self.dimensions = list(analyzer.dimensions)
+        self.dimension_index = {d: i for i, d in enumerate(self.dimensions)}
+        likert = [q for q in analyzer.questions_map.values() if q.get('type') == "likert"]
+        self.scale_min = float(min((q.get('scale_min', 1) for q in likert), default=0))
+        self.scale_max = float(max((q.get('scale_max', 5) for q in likert), default=5))
+        self.fill_value = (self.scale_min + self.scale_max) / 2 # Khía cạnh chưa trả lời
+
+        self.rows: List[List[str]] = [] # [user_id, assessment_name, timestamp] cho từng hàng
+        self._vectors = np.empty((0, len(self.dimensions)), dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._size = 0
+        self._rows_bytes = 0 # Phần rows.jsonl đã nạp vào self.rows
+        self._generation: str | None = None # "generation" trong meta.json của các file đã nạp
+        self._lock = threading.Lock() # Bảo vệ _vectors/_norms/_size giữa luồng ghi và luồng truy vấn
+        self._file_lock = FileLock(os.path.join(directory, self.LOCK_FILE))
+
+    def __len__(self) -> int:
+        return self._size
+
+    # --- Lượng tử hóa: 0 = chưa trả lời, 1..255 trải đều trên [scale_min, scale_max] ---
+    def _quantize(self, scores: np.ndarray) -> np.ndarray:
+        span = self.scale_max - self.scale_min or 1.0
+        scaled = np.rint((np.clip(scores, self.scale_min, self.scale_max) - self.scale_min) / span * 254) + 1
+        return np.where(np.isnan(scores), 0, scaled).astype(np.uint8)
+
+    def _dequantize(self, codes: np.ndarray) -> np.ndarray:
+        span = self.scale_max - self.scale_min or 1.0
+        values = (codes.astype(np.float32) - 1) / 254 * span + self.scale_min
+        return np.where(codes == 0, self.fill_value, values).astype(np.float32)
+
+    def _append_in_memory(self, codes: np.ndarray) -> None:
+        """Gọi sau khi self.rows đã có các hàng tương ứng, để mọi hàng trong ảnh chụp đều có metadata."""
+        vectors = self._dequantize(codes)
+        with self._lock:
+            needed = self._size + len(codes)
+            if needed > len(self._vectors): # Tăng dung lượng theo cấp số nhân để append O(1) khấu hao
+                capacity = max(needed, 2 * len(self._vectors), 1024)
+                grown = np.empty((capacity, len(self.dimensions)), dtype=np.float32)
+                grown[:self._size] = self._vectors[:self._size]
+                self._vectors = grown
+                grown_norms = np.empty(capacity, dtype=np.float32)
+                grown_norms[:self._size] = self._norms[:self._size]
+                self._norms = grown_norms
+            self._vectors[self._size:needed] = vectors
+            self._norms[self._size:needed] = (vectors * vectors).sum(axis=1)
+            self._size = needed
+
+    def _snapshot(self) -> tuple:
+        """(vectors, norms, rows) của các hàng hiện có; an toàn để đọc ngoài khóa trong khi luồng khác thêm hàng."""
+        with self._lock:
+            return self._vectors[:self._size], self._norms[:self._size], self.rows
+
+    def _reset_in_memory(self) -> None:
+        """Bỏ mọi hàng đã nạp (các file vừa được build() thay thế). self.rows là list mới: ảnh chụp cũ vẫn nhất quán."""
+        with self._lock:
+            self.rows = []
+            self._vectors = np.empty((0, len(self.dimensions)), dtype=np.float32)
+            self._norms = np.empty(0, dtype=np.float32)
+            self._size = 0
+        self._rows_bytes = 0
+
+    @staticmethod
+    def _row_of(record: Dict[str, Any]) -> List[str]:
+        return [record.get("user_id", ""), record.get("assessment_name", ""), record.get("timestamp", "")]
+
+    def add_scores(self, scores: np.ndarray, rows: List[List[str]]) -> None:
+        """Thêm các hàng điểm (N × dimensions, NaN = chưa trả lời) cùng [user_id, assessment_name, timestamp] tương ứng."""
+        codes = self._quantize(np.atleast_2d(scores))
+        with self._file_lock.exclusive(): # Hai file cùng thứ tự hàng kể cả khi nhiều tiến trình cùng ghi
+            self._catch_up()
+            self._append_locked(codes, rows)
+
+    def _append_locked(self, codes: np.ndarray, rows: List[List[str]]) -> None:
+        """Ghi nối các hàng đã lượng tử hóa; gọi khi đang giữ khóa file, ngay sau _catch_up."""
+        self._write_meta()
+        with open(os.path.join(self.directory, self.VECTORS_FILE), 'ab') as f:
+            f.write(codes.tobytes())
+        rows_bytes = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode('utf-8')
+        with open(os.path.join(self.directory, self.ROWS_FILE), 'ab') as f:
+            f.write(rows_bytes)
+        self._rows_bytes += len(rows_bytes)
+        self.rows.extend(rows)
+        self._append_in_memory(codes)
+
+    def _catch_up(self) -> None:
+        """
+        Gọi khi đang giữ khóa: nạp các hồ sơ đã được ghi nối kể từ lần đọc trước (bởi tiến trình khác), và cắt bỏ
+        phần dư của một lần ghi bị ngắt (vector chưa có metadata, dòng ghi dở) để hai file luôn khớp nhau.
+        """
+        meta = self._read_meta()
+        generation = meta.get("generation") if meta else None
+        if meta and (meta.get("bank_version") != self.analyzer.bank_version or meta.get("dimensions") != self.dimensions):
+            # Tiến trình khác đã xây lại thư mục cho bộ câu hỏi khác: không được ghi hàng có độ rộng cũ vào đó
+            raise ValueError(f"Chỉ mục '{self.directory}' đã được xây lại cho bộ câu hỏi {meta.get('bank_version')}")
+        if generation != self._generation:
+            if self._size or self._rows_bytes:
+                self._reset_in_memory()
+            self._generation = generation
+        width = len(self.dimensions)
+        vectors_path, rows_path = os.path.join(self.directory, self.VECTORS_FILE), os.path.join(self.directory, self.ROWS_FILE)
+        try:
+            with open(rows_path, 'rb') as f:
+                f.seek(self._rows_bytes)
+                tail = f.read()
+        except FileNotFoundError:
+            tail = b""
+        complete = tail[:tail.rfind(b"\n") + 1] # Chỉ các dòng đầy đủ
+        lines = complete.split(b"\n")[:-1]
+        vectors_size = os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0
+        count = min(vectors_size // width, self._size + len(lines)) if width else self._size
+        if count - self._size < len(lines):
+            lines = lines[:max(count - self._size, 0)]
+            complete = b"".join(line + b"\n" for line in lines)
+        if vectors_size != count * width:
+            os.truncate(vectors_path, count * width)
+        rows_bytes = self._rows_bytes + len(complete)
+        if len(tail) != len(complete):
+            os.truncate(rows_path, rows_bytes)
+        if lines:
+            codes = np.fromfile(vectors_path, dtype=np.uint8, count=len(lines) * width, offset=self._size * width)
+            self.rows.extend(json.loads(b"[" + b",".join(lines) + b"]")) # Một lần parse nhanh hơn nhiều so với từng dòng
+            self._append_in_memory(codes.reshape(len(lines), width))
+        self._rows_bytes = rows_bytes
+
+    def refresh(self) -> int:
+        """Nạp các hồ sơ do tiến trình khác thêm vào từ lần đọc trước. Trả về số hồ sơ mới."""
+        if not os.path.isdir(self.directory):
+            return 0
+        before = self._size
+        with self._file_lock.exclusive():
+            self._catch_up()
+        return self._size - before
+
+    def add_record(self, record: Dict[str, Any]) -> None:
+        """Thêm một bài làm đã lưu (định dạng của DataStorage); dùng làm save listener."""
+        scores = self.analyzer.batch_calculate_scores([record.get("responses", [])])
+        self.add_scores(scores, [self._row_of(record)])
+
+    def attach(self, storage: DataStorage) -> "ProfileIndex":
+        """Cập nhật chỉ mục mỗi khi storage lưu một bài làm mới."""
+        storage.add_save_listener(self.add_record)
+        return self
+
+    def detach(self, storage: DataStorage) -> None:
+        """Ngừng cập nhật từ storage (trước khi chỉ mục được thay bằng chỉ mục của bộ câu hỏi mới)."""
+        storage.remove_save_listener(self.add_record)
+
+    def reconcile(self, storage: DataStorage, since: str | None = None) -> int:
+        """
+        Thêm các bài làm có trong storage nhưng chưa có trong chỉ mục (lưu khi chỉ mục chưa được gắn, hoặc trong lúc
+        build()). Chỉ đọc các bài làm từ `since`; mặc định từ hồ sơ mới nhất trong chỉ mục trừ RECONCILE_MARGIN
+        (chỉ mục rỗng: cả kho). Trả về số hồ sơ đã thêm.
+        """
+        if since is None:
+            latest = max((row[2] for row in self.rows), default="")
+            try:
+                since = (datetime.datetime.fromisoformat(latest) - RECONCILE_MARGIN).isoformat() if latest else None
+            except ValueError:
+                since = None
+        candidates = list(storage.iter_responses(since=since))
+        if not candidates:
+            return 0
+        with self._file_lock.exclusive():
+            self._catch_up() # Tiến trình khác có thể vừa thêm chính các bài làm này
+            known = {tuple(row) for row in self.rows if since is None or row[2] >= since}
+            missing = [record for record in candidates if tuple(self._row_of(record)) not in known]
+            if missing:
+                scores = self.analyzer.batch_calculate_scores(record.get("responses", []) for record in missing)
+                self._append_locked(self._quantize(scores), [self._row_of(record) for record in missing])
+        return len(missing)
+
+    def nearest(self, overall_scores: Dict[str, float], k: int = 5, exclude_user: str | None = None) -> List[Dict[str, Any]]:
+        """
+        k hồ sơ gần nhất (khoảng cách Euclid trên thang điểm gốc), có thể loại trừ chính người dùng.
+        Khi loại trừ, số ứng viên được nhân đôi cho đến khi đủ k hồ sơ của người khác (hoặc hết chỉ mục).
+        """
+        vectors, norms, rows = self._snapshot()
+        size = len(vectors)
+        if size == 0 or k <= 0:
+            return []
+        query = np.full(len(self.dimensions), self.fill_value, dtype=np.float32)
+        for dimension, score in overall_scores.items():
+            index = self.dimension_index.get(dimension)
+            if index is not None:
+                query[index] = score
+        distances = norms - 2 * (vectors @ query) + query @ query
+
+        wanted = min(size, k + (16 if exclude_user is not None else 0))
+        while True:
+            candidates = np.argpartition(distances, wanted - 1)[:wanted] if wanted < size else np.arange(size)
+            candidates = candidates[np.argsort(distances[candidates], kind='stable')]
+            neighbours = []
+            for i in candidates:
+                user_id, assessment_name, timestamp = rows[i]
+                if exclude_user is not None and user_id == exclude_user:
+                    continue
+                neighbours.append({"user_id": user_id, "assessment_name": assessment_name, "timestamp": timestamp,
+                                   "row": int(i), "distance": round(float(np.sqrt(max(distances[i], 0.0))), 3)})
+                if len(neighbours) == k:
+                    return neighbours
+            if wanted == size:
+                return neighbours
+            wanted = min(size, 2 * wanted)
+
+    def similar_profiles_summary(self, overall_scores: Dict[str, float], k: int = 10,
+                                 exclude_user: str | None = None, top_n: int = 3) -> Dict[str, Any] | None:
+        """Tóm tắt ẩn danh nhóm hồ sơ tương tự: số người, khoảng cách trung bình, khía cạnh họ mạnh nhất (và điểm của nhóm)."""
+        neighbours = self.nearest(overall_scores, k, exclude_user)
+        if not neighbours:
+            return None
+        mean_vector = self._snapshot()[0][[n["row"] for n in neighbours]].mean(axis=0)
+        strongest = np.argsort(mean_vector)[::-1][:top_n]
+        return {
+            "count": len(neighbours),
+            "mean_distance": round(float(np.mean([n["distance"] for n in neighbours])), 3),
+            "common_strengths": [self.dimensions[i] for i in strongest],
+            "strength_scores": {self.dimensions[i]: round(float(mean_vector[i]), 2) for i in strongest},
+        }
+
+    def _read_meta(self) -> Dict[str, Any] | None:
+        try:
+            with open(os.path.join(self.directory, self.META_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (IOError, json.JSONDecodeError):
+            return None
+
+    def _write_meta(self) -> None:
+        meta_path = os.path.join(self.directory, self.META_FILE)
+        if os.path.exists(meta_path):
+            return
+        self._generation = uuid.uuid4().hex
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({"bank_version": self.analyzer.bank_version, "dimensions": self.dimensions,
+                       "scale_min": self.scale_min, "scale_max": self.scale_max, "generation": self._generation},
+                      f, ensure_ascii=False, indent=4)
+
+    @classmethod
+    def load(cls, analyzer: Analyzer, directory: str = PROFILE_INDEX_DIR) -> "ProfileIndex | None":
+        """Nạp chỉ mục từ đĩa; None nếu chưa có hoặc được xây cho bộ câu hỏi khác."""
+        index = cls(analyzer, directory)
+        try:
+            with open(os.path.join(directory, cls.META_FILE), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("bank_version") != analyzer.bank_version or meta.get("dimensions") != index.dimensions:
+                return None
+            if not (os.path.exists(os.path.join(directory, cls.VECTORS_FILE)) and os.path.exists(os.path.join(directory, cls.ROWS_FILE))):
+                return None
+            # Nếu lần ghi trước bị ngắt giữa chừng, chỉ giữ số hàng có đủ cả vector và metadata
+            with index._file_lock.exclusive():
+                index._catch_up()
+        except (IOError, json.JSONDecodeError, ValueError):
+            return None
+        return index
+
+    @classmethod
+    def build(cls, analyzer: Analyzer, records: Iterable[Dict[str, Any]], directory: str = PROFILE_INDEX_DIR,
+              chunk_size: int = 4096) -> "ProfileIndex":
+        """
+        Xây mới chỉ mục từ các bản ghi phản hồi, tính điểm theo lô. Dựng trong thư mục tạm rồi thay các file
+        dưới khóa: tiến trình khác đang mở chỉ mục không bao giờ thấy thư mục nửa cũ nửa mới.
+        """
+        temp = cls(analyzer, f"{directory}.tmp-{uuid.uuid4().hex[:8]}")
+        batch: List[Dict[str, Any]] = []
+
+        def flush() -> None:
+            scores = analyzer.batch_calculate_scores(r.get("responses", []) for r in batch)
+            temp.add_scores(scores, [cls._row_of(r) for r in batch])
+            batch.clear()
+
+        for record in records:
+            batch.append(record)
+            if len(batch) >= chunk_size:
+                flush()
+        if batch:
+            flush()
+        os.makedirs(temp.directory, exist_ok=True)
+        temp._write_meta() # Kho rỗng: vẫn tạo đủ ba file
+        for name in (cls.VECTORS_FILE, cls.ROWS_FILE):
+            open(os.path.join(temp.directory, name), 'ab').close()
+
+        index = cls(analyzer, directory)
+        with index._file_lock.exclusive():
+            for name in (cls.VECTORS_FILE, cls.ROWS_FILE, cls.META_FILE): # meta sau cùng: generation mới
+                os.replace(os.path.join(temp.directory, name), os.path.join(directory, name))
+            index._catch_up()
+        shutil.rmtree(temp.directory, ignore_errors=True)
+        return index
+
+    @classmethod
+    def load_or_build(cls, analyzer: Analyzer, storage: DataStorage, directory: str = PROFILE_INDEX_DIR) -> "ProfileIndex":
+        """Nạp (hoặc xây) chỉ mục rồi bổ sung các bài làm trong storage mà chỉ mục chưa có."""
+        index = cls.load(analyzer, directory)
+        if index is None:
+            started = (datetime.datetime.now() - RECONCILE_MARGIN).isoformat()
+            index = cls.build(analyzer, storage.iter_responses(), directory)
+            index.reconcile(storage, since=started) # Bài làm lưu trong lúc đang xây (vào các file cũ)
+        else:
+            index.reconcile(storage)
+        return index
+
+
+if __name__ == '__main__':
+    import tempfile
+    import time
+    from core.question_generator import QuestionGenerator
+
+    analyzer = Analyzer(QuestionGenerator().get_all_questions())
+    index = ProfileIndex.load_or_build(analyzer, DataStorage())
+    print(f"Chỉ mục hiện có {len(index)} hồ sơ")
+
+    print("\n--- Benchmark: 1.000.000 hồ sơ mô phỏng ---")
+    bench_dir = tempfile.mkdtemp()
+    bench = ProfileIndex(analyzer, bench_dir)
+    rng = np.random.default_rng(0)
+    n_profiles = 1_000_000
+    for start in range(0, n_profiles, 100_000):
+        block = np.round(rng.uniform(1, 5, size=(100_000, len(analyzer.dimensions))), 2)
+        bench.add_scores(block, [[f"user_{start + i}", "bench", ""] for i in range(len(block))])
+    start_time = time.perf_counter()
+    reloaded = ProfileIndex.load(analyzer, bench_dir)
+    print(f"Nạp lại từ đĩa: {time.perf_counter() - start_time:.2f} giây")
+    query = {d: 4.0 for d in analyzer.dimensions}
+    reloaded.nearest(query)
+    start_time = time.perf_counter()
+    for _ in range(20):
+        neighbours = reloaded.nearest(query, k=5)
+    print(f"Truy vấn k=5: {(time.perf_counter() - start_time) / 20 * 1000:.1f} ms / truy vấn")
+    print(neighbours[0])
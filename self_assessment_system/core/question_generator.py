@@ -1,47 +1,312 @@
+import gc
+import hashlib
 import json
 import os
-from typing import List, Dict, Any
+import pickle
+import sys
+import threading
+from typing import List, Dict, Any, Tuple, Callable, NamedTuple
+from utils.frozen import FrozenDict, freeze
+from core.analyzer import Analyzer
+from core.data_storage import ANALYTICS_DIR
 
 QUESTIONS_FILE_PATH = os.path.join(os.path.dirname(__file__), '..', 'assets', 'questions.json')
+COMPILED_CACHE_DIR = os.path.join(ANALYTICS_DIR, 'compiled_questions')
+COMPILED_CACHE_AUTO = "auto" # cache_file mặc định: mỗi file câu hỏi một file cache riêng (compiled_cache_path)
+COMPILED_CACHE_FORMAT = 2 # Tăng khi cấu trúc QuestionBank hoặc bảng của Analyzer thay đổi
+
+
+def compiled_cache_path(questions_file: str) -> str:
+    """File cache đã biên dịch của một file câu hỏi, đặt tên theo đường dẫn tuyệt đối của file đó."""
+    source_path = os.path.abspath(questions_file)
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    digest = hashlib.blake2b(source_path.encode('utf-8'), digest_size=8).hexdigest()
+    return os.path.join(COMPILED_CACHE_DIR, f"{stem}.{digest}.compiled.pkl")
+
+
+class QuestionBank:
+    """
+    Ảnh chụp bất biến của bộ câu hỏi, với các chỉ mục dựng sẵn khi nạp:
+    - questions: tuple các câu hỏi (FrozenDict, options/scoring_info lồng nhau cũng bất biến)
+    - question_index: question_id -> số nguyên (thứ tự trong file), id đã được intern
+    - version: hash nội dung, trùng với Analyzer.bank_version
+    Vì không thể sửa, các bản ghi có thể chia sẻ an toàn giữa các luồng và module.
+    """
+    __slots__ = ('questions', 'question_ids', 'question_index', 'version', '_by_id', '_by_category')
+
+    def __init__(self, questions_data: List[Dict[str, Any]]):
+        self.questions: Tuple[FrozenDict, ...] = tuple(freeze(q) for q in questions_data)
+        self.version = hashlib.sha1(
+            json.dumps(self.questions, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        self.question_ids: Tuple[str, ...] = tuple(sys.intern(q['id']) for q in self.questions if 'id' in q)
+        self.question_index: FrozenDict = FrozenDict((qid, i) for i, qid in enumerate(self.question_ids))
+        self._by_id: Dict[str, FrozenDict] = {}
+        by_category: Dict[str, List[FrozenDict]] = {}
+        for q in self.questions:
+            self._by_id.setdefault(q.get('id'), q) # Giữ câu hỏi đầu tiên nếu trùng id, như cách quét tuyến tính cũ
+            by_category.setdefault(q.get('category'), []).append(q)
+        self._by_category: Dict[str, Tuple[FrozenDict, ...]] = {c: tuple(qs) for c, qs in by_category.items()}
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def get(self, question_id: str) -> FrozenDict | None:
+        return self._by_id.get(question_id)
+
+    def by_category(self, category_name: str) -> Tuple[FrozenDict, ...]:
+        return self._by_category.get(category_name, ())
+
+    @property
+    def categories(self) -> List[str]:
+        return [c for c in self._by_category if c is not None]
+
+
+class BankSnapshot(NamedTuple):
+    """Bộ câu hỏi cùng Analyzer tương ứng; một phiên làm bài giữ nguyên snapshot từ đầu đến cuối."""
+    bank: QuestionBank
+    analyzer: Analyzer
+
 
 class QuestionGenerator:
-    def __init__(self, questions_file: str = QUESTIONS_FILE_PATH):
-        self.questions = self._load_questions(questions_file)
+    def __init__(self, questions_file: str = QUESTIONS_FILE_PATH, cache_file: str | None = COMPILED_CACHE_AUTO):
+        """
+        cache_file: file pickle chứa bộ câu hỏi đã nạp + bảng tính điểm đã biên dịch của Analyzer.
+        Mặc định mỗi file câu hỏi có file cache riêng (compiled_cache_path); cache còn ghi đường dẫn file nguồn,
+        nên một cache_file dùng chung cho nhiều file câu hỏi chỉ bị tạo lại, không bao giờ trả nhầm bộ câu hỏi.
+        Cache hợp lệ khi kích thước và mtime của file câu hỏi khớp; nếu chỉ mtime đổi thì so hash nội dung.
+        None để luôn đọc lại questions.json.
+        """
+        self.questions_file = questions_file
+        self.cache_file = compiled_cache_path(questions_file) if cache_file == COMPILED_CACHE_AUTO else cache_file
+        bank, tables = self._load_compiled(questions_file)
+        # Bộ câu hỏi và Analyzer nằm chung một tuple: reload thay cả hai bằng một phép gán (nguyên tử)
+        self._snapshot = BankSnapshot(bank, Analyzer(bank.questions, bank.version, tables))
+        self._reload_listeners: List[Callable[[BankSnapshot, BankSnapshot], None]] = []
+        self._reload_lock = threading.Lock()
+        self._observer = None
+        self._reload_timer: threading.Timer | None = None
+
+    @property
+    def bank(self) -> QuestionBank:
+        return self._snapshot.bank
+
+    def snapshot(self) -> BankSnapshot:
+        """Snapshot hiện tại; giữ lại ở đầu phiên để cả phiên dùng cùng một phiên bản câu hỏi."""
+        return self._snapshot
 
     def _load_questions(self, file_path: str) -> List[Dict[str, Any]]:
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                questions_data = json.load(f)
-            if not isinstance(questions_data, list):
-                raise ValueError("Questions data should be a list.")
-            return questions_data
+            with open(file_path, 'rb') as f:
+                return self._parse_questions(f.read(), file_path)
         except FileNotFoundError:
             print(f"Lỗi: Không tìm thấy file câu hỏi tại '{file_path}'")
             return []
-        except json.JSONDecodeError:
+
+    def _parse_questions(self, raw: bytes, file_path: str) -> List[Dict[str, Any]]:
+        try:
+            questions_data = json.loads(raw.decode('utf-8'))
+            if not isinstance(questions_data, list):
+                raise ValueError("Questions data should be a list.")
+            return questions_data
+        except (json.JSONDecodeError, UnicodeDecodeError):
             print(f"Lỗi: File câu hỏi '{file_path}' không phải là JSON hợp lệ.")
             return []
         except ValueError as e:
             print(f"Lỗi: {e}")
             return []
 
-    def get_all_questions(self) -> List[Dict[str, Any]]:
-        return self.questions
+    def _load_compiled(self, file_path: str) -> Tuple[QuestionBank, Dict[str, Any] | None]:
+        """Nạp bộ câu hỏi, ưu tiên cache đã biên dịch (một lần đọc + unpickle) nếu còn khớp với file nguồn."""
+        if self.cache_file is None:
+            return QuestionBank(self._load_questions(file_path)), None
+        try:
+            stat = os.stat(file_path)
+            cache = self._read_cache()
+            if cache and (cache["source_size"], cache["source_mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+                return cache["bank"], cache["analyzer_tables"]
+            with open(file_path, 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            print(f"Lỗi: Không tìm thấy file câu hỏi tại '{file_path}'")
+            return QuestionBank([]), None
 
-    def get_questions_by_category(self, category_name: str) -> List[Dict[str, Any]]:
-        return [q for q in self.questions if q.get('category') == category_name]
+        digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+        if cache and cache["source_hash"] == digest: # Nội dung không đổi (touch, checkout lại...): chỉ cập nhật stat
+            bank, tables = cache["bank"], cache["analyzer_tables"]
+        else:
+            bank = QuestionBank(self._parse_questions(raw, file_path))
+            if not bank.questions:
+                return bank, None # Không cache bộ câu hỏi lỗi/rỗng
+            tables = Analyzer(bank.questions, bank.version).compiled_tables()
+        self._write_cache(stat, digest, bank, tables)
+        return bank, tables
 
-    def get_question_by_id(self, question_id: str) -> Dict[str, Any] | None:
-        for q in self.questions:
-            if q.get('id') == question_id:
-                return q
-        return None
+    def _read_cache(self) -> Dict[str, Any] | None:
+        gc_was_enabled = gc.isenabled()
+        try:
+            with open(self.cache_file, 'rb') as f:
+                raw = f.read()
+            gc.disable() # Unpickle hàng nghìn object nhỏ: tránh GC quét lặp lại giữa chừng
+            cache = pickle.loads(raw)
+            if cache.get("format") != COMPILED_CACHE_FORMAT or cache.get("source_path") != os.path.abspath(self.questions_file):
+                return None
+            return cache
+        except FileNotFoundError:
+            return None
+        except Exception as e: # File hỏng hoặc được tạo bởi phiên bản mã khác
+            print(f"Lỗi khi đọc cache câu hỏi '{self.cache_file}', sẽ tạo lại: {e}")
+            return None
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def _write_cache(self, stat: os.stat_result, digest: str, bank: QuestionBank, tables: Dict[str, Any]) -> None:
+        cache = {"format": COMPILED_CACHE_FORMAT, "source_path": os.path.abspath(self.questions_file),
+                 "source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns, "source_hash": digest, "bank": bank, "analyzer_tables": tables}
+        temp_path = f"{self.cache_file}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            with open(temp_path, 'wb') as f:
+                pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.cache_file) # Ghi nguyên tử: tiến trình khác không đọc phải file dở
+        except OSError as e:
+            print(f"Lỗi khi ghi cache câu hỏi: {e}")
+
+    def create_analyzer(self) -> Analyzer:
+        """Analyzer dùng bảng tính điểm đã biên dịch sẵn trong cache (nếu có) thay vì biên dịch lại."""
+        bank, analyzer = self._snapshot
+        return Analyzer(bank.questions, bank.version, analyzer.compiled_tables())
+
+    # --- Hot reload ---
+    @staticmethod
+    def validate_bank(bank: QuestionBank) -> List[str]:
+        """Danh sách lỗi của bộ câu hỏi (rỗng nếu hợp lệ)."""
+        problems = []
+        if not bank.questions:
+            problems.append("Bộ câu hỏi rỗng hoặc không đọc được.")
+        seen_ids = set()
+        for position, q in enumerate(bank.questions):
+            if not q.get('id') or not q.get('type'):
+                problems.append(f"Câu hỏi thứ {position + 1} thiếu 'id' hoặc 'type'.")
+            elif q['id'] in seen_ids:
+                problems.append(f"Trùng id câu hỏi: {q['id']}")
+            seen_ids.add(q.get('id'))
+        return problems
+
+    def add_reload_listener(self, listener: Callable[[BankSnapshot, BankSnapshot], None]) -> None:
+        """listener(snapshot_cũ, snapshot_mới) được gọi sau mỗi lần đổi sang bộ câu hỏi mới."""
+        self._reload_listeners.append(listener)
+
+    def reload(self) -> bool:
+        """
+        Đọc lại file câu hỏi; nếu hợp lệ và khác phiên bản hiện tại thì thay snapshot.
+        Các phiên đang giữ snapshot cũ không bị ảnh hưởng. Trả về True nếu đã đổi.
+        """
+        with self._reload_lock:
+            try:
+                bank, tables = self._load_compiled(self.questions_file)
+                problems = self.validate_bank(bank)
+                if problems:
+                    print(f"Lỗi: Bỏ qua bộ câu hỏi mới không hợp lệ: {'; '.join(problems)}")
+                    return False
+                if bank.version == self._snapshot.bank.version:
+                    return False
+                new_snapshot = BankSnapshot(bank, Analyzer(bank.questions, bank.version, tables))
+            except Exception as e:
+                print(f"Lỗi khi nạp lại bộ câu hỏi: {e}")
+                return False
+            old_snapshot, self._snapshot = self._snapshot, new_snapshot
+        print(f"Đã nạp bộ câu hỏi mới: phiên bản {new_snapshot.bank.version} ({len(bank)} câu hỏi)")
+        for listener in self._reload_listeners:
+            try:
+                listener(old_snapshot, new_snapshot)
+            except Exception as e:
+                print(f"Lỗi trong listener khi nạp lại bộ câu hỏi: {e}")
+        return True
+
+    def start_watching(self, debounce_seconds: float = 0.5) -> bool:
+        """
+        Theo dõi file câu hỏi bằng watchdog và tự reload (trong luồng nền) khi file thay đổi.
+        Các sự kiện liên tiếp trong debounce_seconds (trình soạn thảo thường ghi nhiều lần) được gộp lại.
+        """
+        if self._observer is not None:
+            return True
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            print("Lỗi: Cần cài đặt watchdog để theo dõi thay đổi của file câu hỏi.")
+            return False
+
+        target = os.path.abspath(self.questions_file)
+        generator = self
+
+        class _QuestionsFileHandler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                # Bỏ qua sự kiện mở/đọc file: chính reload() đọc file và sẽ tự kích hoạt lại
+                if event.event_type not in ('modified', 'created', 'moved', 'closed'):
+                    return
+                paths = (event.src_path, getattr(event, 'dest_path', None))
+                if any(p and os.path.abspath(p) == target for p in paths):
+                    generator._schedule_reload(debounce_seconds)
+
+        self._observer = Observer()
+        self._observer.schedule(_QuestionsFileHandler(), os.path.dirname(target), recursive=False)
+        self._observer.daemon = True
+        self._observer.start()
+        return True
+
+    def _schedule_reload(self, delay: float) -> None:
+        if self._reload_timer is not None:
+            self._reload_timer.cancel()
+        self._reload_timer = threading.Timer(delay, self.reload)
+        self._reload_timer.daemon = True
+        self._reload_timer.start()
+
+    def stop_watching(self) -> None:
+        if self._reload_timer is not None:
+            self._reload_timer.cancel()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+    @property
+    def questions(self) -> Tuple[FrozenDict, ...]:
+        return self.bank.questions
+
+    @property
+    def question_index(self) -> FrozenDict:
+        """question_id -> chỉ số nguyên, dùng khi cần làm việc với id dạng số (mảng numpy, mã hóa nhị phân...)"""
+        return self.bank.question_index
+
+    def get_all_questions(self) -> Tuple[FrozenDict, ...]:
+        return self.bank.questions
+
+    def get_questions_by_category(self, category_name: str) -> Tuple[FrozenDict, ...]:
+        return self.bank.by_category(category_name)
+
+    def get_question_by_id(self, question_id: str) -> FrozenDict | None:
+        return self.bank.get(question_id)
 
 if __name__ == '__main__':
+    if '--watch' in sys.argv: # python -m core.question_generator --watch: theo dõi và nạp lại khi sửa file
+        import time
+        generator = QuestionGenerator()
+        generator.add_reload_listener(lambda old, new: print(f"{old.bank.version} -> {new.bank.version}"))
+        if generator.start_watching():
+            print(f"Đang theo dõi {os.path.abspath(generator.questions_file)} (Ctrl+C để dừng)")
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                generator.stop_watching()
+        sys.exit(0)
+
     # Test
     generator = QuestionGenerator()
     all_q = generator.get_all_questions()
-    print(f"Tổng số câu hỏi: {len(all_q)}")
+    print(f"Tổng số câu hỏi: {len(all_q)} (phiên bản {generator.bank.version})")
     if all_q:
         print("\nCâu hỏi đầu tiên:")
         print(json.dumps(all_q[0], indent=2, ensure_ascii=False))
@@ -52,4 +317,34 @@ if __name__ == '__main__':
     q_cv01 = generator.get_question_by_id("CV01")
     if q_cv01:
         print("\nThông tin câu hỏi CV01:")
-        print(json.dumps(q_cv01, indent=2, ensure_ascii=False))
\ No newline at end of file
+        print(json.dumps(q_cv01, indent=2, ensure_ascii=False))
+
+    print(f"\nChỉ số của CV_L01: {generator.question_index.get('CV_L01')}")
+    try:
+        all_q[0]['text'] = "sửa đổi"
+    except TypeError as e:
+        print(f"Câu hỏi là bất biến: {e}")
+
+    print("\n--- Benchmark: khởi động với bộ 5000 câu hỏi ---")
+    import tempfile
+    import time
+    temp_dir = tempfile.mkdtemp()
+    big_file = os.path.join(temp_dir, 'questions.json')
+    likert_template = next(q for q in all_q if q['type'] == "likert")
+    with open(big_file, 'w', encoding='utf-8') as f:
+        json.dump([{**likert_template, "id": f"Q{i:05d}",
+                    "scoring_info": {**likert_template['scoring_info'], "dimension": f"Dimension {i % 200}"}}
+                   for i in range(5000)], f, ensure_ascii=False)
+    cache_path = os.path.join(temp_dir, 'questions.compiled.pkl')
+    for label, kwargs in (("Không cache", {"cache_file": None}), ("Lần đầu (tạo cache)", {"cache_file": cache_path}),
+                          ("Có cache", {"cache_file": cache_path})):
+        start_time = time.perf_counter()
+        big_generator = QuestionGenerator(big_file, **kwargs)
+        big_generator.create_analyzer()
+        print(f"{label}: {(time.perf_counter() - start_time) * 1000:.1f} ms")
+
+    import timeit
+    ids = [q['id'] for q in all_q]
+    linear = timeit.timeit(lambda: [next((q for q in all_q if q.get('id') == i), None) for i in ids], number=200)
+    indexed = timeit.timeit(lambda: [generator.get_question_by_id(i) for i in ids], number=200)
+    print(f"Tra cứu {len(ids)} id x 200: quét tuyến tính {linear * 1000:.1f} ms, chỉ mục {indexed * 1000:.1f} ms")
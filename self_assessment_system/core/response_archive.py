@@ -0,0 +1,233 @@
+# self_assessment_system/core/response_archive.py
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from typing import List, Dict, Any, Iterable, Iterator, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from core.analyzer import Analyzer
+from core.data_storage import create_storage
+
+ARCHIVE_DIR = os.path.join(os.path.dirname(__file__), '..', 'data_parquet')
+
+# Một dòng cho mỗi câu trả lời. Câu trả lời là số nguyên trong khoảng int8 nằm ở cột answer;
+# các loại khác (chuỗi Có/Không, lựa chọn, tự luận, số thực...) lưu dạng JSON ở answer_json để không mất kiểu.
+ARCHIVE_SCHEMA = pa.schema([
+    ("submission_id", pa.int64()),
+    ("user_id", pa.dictionary(pa.int32(), pa.string())),
+    ("timestamp", pa.dictionary(pa.int32(), pa.string())),
+    ("question_id", pa.dictionary(pa.int16(), pa.string())),
+    ("answer", pa.int8()),
+    ("answer_json", pa.dictionary(pa.int32(), pa.string())),
+    ("assessment_name", pa.string()),
+    ("month", pa.string()),
+])
+PARTITIONING = ds.partitioning(pa.schema([("assessment_name", pa.string()), ("month", pa.string())]), flavor="hive")
+INT8_ANSWER_CODES = 256 # Mã đáp án 0..255 ứng với giá trị int8 -128..127, từ 256 trở đi là answer_json
+
+
+def submission_id(record: Dict[str, Any]) -> int:
+    """Id ổn định của một lần nộp bài (hash 63 bit của user_id, assessment_name, timestamp)."""
+    key = json.dumps([record.get("user_id", ""), record.get("assessment_name", ""), record.get("timestamp", "")],
+                     ensure_ascii=False)
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') >> 1
+
+
+class ResponseArchive:
+    """
+    Kho lưu trữ dạng cột (Parquet) của các bài làm, phân vùng theo assessment_name và tháng:
+    archive/assessment_name=.../month=YYYY-MM/part-*.parquet.
+    Các job phân tích đọc thẳng buffer Arrow và tính điểm theo lô, không phải đọc lại hàng nghìn file JSON.
+    """
+
+    def __init__(self, archive_directory: str = ARCHIVE_DIR):
+        self.archive_directory = archive_directory
+
+    @staticmethod
+    def _records_to_table(records: Iterable[Dict[str, Any]]) -> pa.Table:
+        columns: Dict[str, list] = {name: [] for name in ARCHIVE_SCHEMA.names}
+        for record in records:
+            record_id = submission_id(record)
+            timestamp = record.get("timestamp", "")
+            meta = (record_id, record.get("user_id", ""), timestamp, record.get("assessment_name", ""), timestamp[:7] or "unknown")
+            for response in record.get("responses", []):
+                answer = response.get("answer")
+                is_int8 = type(answer) is int and -128 <= answer <= 127
+                for name, value in zip(("submission_id", "user_id", "timestamp", "assessment_name", "month"), meta):
+                    columns[name].append(value)
+                columns["question_id"].append(response.get("question_id"))
+                columns["answer"].append(answer if is_int8 else None)
+                columns["answer_json"].append(None if is_int8 else json.dumps(answer, ensure_ascii=False))
+        return pa.Table.from_pydict(columns, schema=ARCHIVE_SCHEMA)
+
+    def _write(self, table: pa.Table, directory: str) -> None:
+        ds.write_dataset(table, directory, format="parquet", partitioning=PARTITIONING,
+                         basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+                         existing_data_behavior="overwrite_or_ignore",
+                         max_rows_per_group=1 << 20, min_rows_per_group=1 << 16)
+
+    def export(self, records: Iterable[Dict[str, Any]], batch_size: int = 20_000, append: bool = False) -> int:
+        """
+        Ghi các bản ghi phản hồi vào kho Parquet, từng lô batch_size bài làm (bộ nhớ có giới hạn).
+        append=False: dựng lại toàn bộ trong thư mục tạm rồi thay thế, kho cũ vẫn đọc được cho tới lúc đổi.
+        Trả về số bài làm đã ghi.
+        """
+        target = self.archive_directory if append else f"{self.archive_directory}.tmp-{uuid.uuid4().hex[:8]}"
+        exported = 0
+        batch: List[Dict[str, Any]] = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                self._write(self._records_to_table(batch), target)
+                exported += len(batch)
+                batch = []
+        if batch:
+            self._write(self._records_to_table(batch), target)
+            exported += len(batch)
+        if not append:
+            self._swap_in(target)
+        return exported
+
+    def _swap_in(self, new_directory: str) -> None:
+        if not os.path.exists(new_directory):
+            os.makedirs(new_directory)
+        old_directory = f"{self.archive_directory}.old-{uuid.uuid4().hex[:8]}"
+        if os.path.exists(self.archive_directory):
+            os.rename(self.archive_directory, old_directory)
+        os.rename(new_directory, self.archive_directory)
+        shutil.rmtree(old_directory, ignore_errors=True)
+
+    def compact(self) -> int:
+        """Gộp các file part nhỏ của từng phân vùng (sinh ra bởi export append) thành một file. Trả về số phân vùng đã gộp."""
+        compacted = 0
+        for root, _, files in os.walk(self.archive_directory):
+            parts = sorted(f for f in files if f.endswith(".parquet"))
+            if len(parts) < 2:
+                continue
+            merged = pa.concat_tables([pq.read_table(os.path.join(root, f)) for f in parts]).unify_dictionaries()
+            temp_path = os.path.join(root, f"part-{uuid.uuid4().hex}-0.parquet.tmp")
+            pq.write_table(merged.combine_chunks(), temp_path)
+            os.replace(temp_path, temp_path[:-len(".tmp")])
+            for f in parts:
+                os.remove(os.path.join(root, f))
+            compacted += 1
+        return compacted
+
+    def dataset(self) -> ds.Dataset:
+        return ds.dataset(self.archive_directory, format="parquet", partitioning=PARTITIONING, schema=ARCHIVE_SCHEMA)
+
+    @staticmethod
+    def _filter(assessment_name: str | None, since_month: str | None, until_month: str | None) -> ds.Expression | None:
+        conditions = []
+        if assessment_name is not None:
+            conditions.append(pc.field("assessment_name") == assessment_name)
+        if since_month is not None:
+            conditions.append(pc.field("month") >= since_month)
+        if until_month is not None:
+            conditions.append(pc.field("month") <= until_month)
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    @staticmethod
+    def _dictionary_codes(column: pa.ChunkedArray) -> Tuple[np.ndarray, List[Any]]:
+        """Mã và từ điển của một cột dictionary (mã -1 cho giá trị null)."""
+        array = column.unify_dictionaries().combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+        indices = array.indices
+        codes = pc.fill_null(indices, -1).to_numpy().astype(np.int64)
+        return codes, array.dictionary.to_pylist()
+
+    def iter_scores(self, analyzer: Analyzer, assessment_name: str | None = None,
+                    since_month: str | None = None, until_month: str | None = None) -> Iterator[Tuple[Dict[str, List[str]], np.ndarray]]:
+        """
+        Duyệt từng file Parquet (chỉ các phân vùng khớp bộ lọc) và tính điểm theo lô từ buffer Arrow.
+        Mỗi lần trả về (metadata các bài làm: user_id/assessment_name/timestamp, ma trận điểm N × analyzer.dimensions).
+        """
+        expression = self._filter(assessment_name, since_month, until_month)
+        columns = ["submission_id", "user_id", "timestamp", "question_id", "answer", "answer_json", "assessment_name"]
+        for fragment in self.dataset().get_fragments(filter=expression):
+            table = fragment.to_table(columns=columns, filter=expression, schema=ARCHIVE_SCHEMA)
+            if table.num_rows == 0:
+                continue
+            # Hàng = bài làm, theo thứ tự xuất hiện trong file
+            submission_ids = table.column("submission_id").to_numpy()
+            unique_ids, first_index, inverse = np.unique(submission_ids, return_index=True, return_inverse=True)
+            order = np.argsort(first_index)
+            rank = np.empty(len(order), dtype=np.int64)
+            rank[order] = np.arange(len(order))
+            row_index = rank[inverse]
+
+            question_codes, question_ids = self._dictionary_codes(table.column("question_id"))
+            answers = table.column("answer").combine_chunks()
+            answer_codes = pc.fill_null(answers, 0).to_numpy().astype(np.int64) + 128
+            json_codes, json_values = self._dictionary_codes(table.column("answer_json"))
+            is_json = ~answers.is_valid().to_numpy(zero_copy_only=False)
+            answer_codes[is_json] = INT8_ANSWER_CODES + json_codes[is_json]
+            answer_values = list(range(-128, 128)) + [json.loads(v) for v in json_values]
+
+            has_question = question_codes >= 0
+            values, counts = analyzer.encode_coded_answers(len(order), row_index[has_question], question_codes[has_question],
+                                                           question_ids, answer_codes[has_question], answer_values)
+            first_rows = table.take(pa.array(first_index[order]))
+            meta = {name: first_rows.column(name).to_pylist() for name in ("user_id", "assessment_name", "timestamp")}
+            yield meta, analyzer.score_encoded(values, counts)
+
+
+if __name__ == '__main__':
+    import sys
+    import tempfile
+    import time
+    import datetime
+    from core.question_generator import QuestionGenerator
+
+    analyzer = QuestionGenerator().create_analyzer()
+    if len(sys.argv) > 1 and sys.argv[1] in ("export", "compact"): # python -m core.response_archive export|compact
+        archive = ResponseArchive()
+        if sys.argv[1] == "export":
+            print(f"Đã xuất {archive.export(create_storage().iter_responses())} bài làm vào {os.path.abspath(ARCHIVE_DIR)}")
+        else:
+            print(f"Đã gộp {archive.compact()} phân vùng")
+        sys.exit(0)
+
+    print("--- Kiểm tra: điểm đọc từ Parquet khớp với batch_calculate_scores ---")
+    rng = np.random.default_rng(0)
+    questions = [q for q in analyzer.questions_map.values() if q.get('scoring_info')]
+    base = datetime.datetime(2024, 1, 1)
+
+    def random_answer(q):
+        if q['type'] == "likert":
+            return int(rng.integers(q.get('scale_min', 1), q.get('scale_max', 5) + 1))
+        if q['type'] == "yes_no":
+            return str(rng.choice(["Có", "Không"]))
+        return str(rng.choice([opt['value'] for opt in q.get('options', [])] or ["?"]))
+
+    records = [{"user_id": f"user_{i % 5000}", "assessment_name": f"assessment_{i % 2}",
+                "timestamp": (base + datetime.timedelta(hours=7 * i)).isoformat(),
+                "responses": [{"question_id": q['id'], "answer": random_answer(q)} for q in questions if rng.random() < 0.9]}
+               for i in range(20_000)]
+    archive = ResponseArchive(os.path.join(tempfile.mkdtemp(), "archive"))
+    start_time = time.perf_counter()
+    archive.export(records)
+    print(f"Xuất {len(records)} bài làm: {time.perf_counter() - start_time:.2f} giây")
+
+    start_time = time.perf_counter()
+    scored = list(archive.iter_scores(analyzer))
+    elapsed = time.perf_counter() - start_time
+    scores_by_key = {}
+    for meta, scores in scored:
+        for user_id, name, timestamp, row in zip(meta["user_id"], meta["assessment_name"], meta["timestamp"], scores):
+            scores_by_key[(user_id, name, timestamp)] = row
+    expected = analyzer.batch_calculate_scores(r["responses"] for r in records)
+    actual = np.array([scores_by_key[(r["user_id"], r["assessment_name"], r["timestamp"])] for r in records])
+    print(f"Đọc + tính điểm từ Arrow: {elapsed:.2f} giây, khớp: {np.array_equal(expected, actual, equal_nan=True)}")
+
+    subset = sum(len(scores) for _, scores in archive.iter_scores(analyzer, "assessment_1", since_month="2025-06"))
+    print(f"assessment_1 từ 2025-06: {subset} bài làm")
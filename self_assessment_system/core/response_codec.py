@@ -0,0 +1,200 @@
+# self_assessment_system/core/response_codec.py
+import json
+import struct
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+
+from core.question_generator import QuestionBank
+
+# Bản ghi gọn: [magic][bank_version 8 byte][số câu hỏi][độ dài 4 trường chuỗi][độ dài phần JSON]
+#   + user_id, assessment_name, timestamp, submission_id (utf-8) + phần JSON (có thể rỗng) + mỗi câu hỏi một byte
+# Phần JSON = [các khóa khác của bản ghi, các phản hồi không mã hóa được (extras)], bỏ trống khi cả hai đều rỗng.
+RECORD_HEADER = struct.Struct('<4s8sHHHHHI')
+MAGIC = b"SAR1"
+STRING_FIELDS = ("user_id", "assessment_name", "timestamp", "submission_id")
+MISSING_FIELD = 0xFFFF # Độ dài đánh dấu trường không có (hoặc không phải chuỗi, khi đó nằm trong phần JSON)
+UNANSWERED = 255 # Mã dành riêng cho câu chưa trả lời
+MAX_CODES = UNANSWERED # Mã đáp án hợp lệ: 0..254
+
+
+class ResponseCodec:
+    """
+    Mã hóa bản ghi phản hồi (định dạng JSON của DataStorage) thành dạng nhị phân gọn theo một bộ câu hỏi:
+    vector đáp án uint8 theo thứ tự câu hỏi cố định của bộ câu hỏi, UNANSWERED cho câu chưa trả lời.
+    Mã là vị trí của đáp án trong bảng giá trị của câu hỏi (likert: scale_min..scale_max, yes_no: Có/Không,
+    multiple_choice_single: value của các lựa chọn). Mọi phản hồi khác (tự luận, giá trị ngoài thang, câu không
+    có trong bộ câu hỏi, trả lời trùng hoặc sai thứ tự, khóa lạ) được giữ nguyên ở extras kèm vị trí trong danh sách,
+    nên decode(encode(record)) == record.
+    """
+
+    def __init__(self, bank: QuestionBank):
+        self.version = bank.version
+        self.question_order: Tuple[str, ...] = tuple(dict.fromkeys(bank.question_ids))
+        self.position: Dict[str, int] = {qid: i for i, qid in enumerate(self.question_order)}
+        self.code_values: List[Tuple[Any, ...]] = [self._value_table(bank.get(qid)) for qid in self.question_order]
+        # (kiểu, giá trị) làm khóa: 1, 1.0 và True không bị coi là cùng một đáp án
+        self._value_codes: List[Dict[Tuple[type, Any], int]] = [
+            {(type(value), value): code for code, value in enumerate(values)} for values in self.code_values
+        ]
+        self._version_bytes = bytes.fromhex(self.version)
+
+    @staticmethod
+    def _value_table(question: Dict[str, Any]) -> Tuple[Any, ...]:
+        q_type = question.get('type')
+        if q_type == "likert":
+            values = tuple(range(question.get('scale_min', 1), question.get('scale_max', 5) + 1))
+        elif q_type == "yes_no":
+            values = ("Có", "Không")
+        elif q_type == "multiple_choice_single":
+            values = tuple(opt['value'] for opt in question.get('options', []) if 'value' in opt)
+        else:
+            values = ()
+        return values[:MAX_CODES]
+
+    def encode_codes(self, responses: List[Dict[str, Any]]) -> Tuple[bytearray, List[list]]:
+        """Vector mã (một byte mỗi câu hỏi) và danh sách [vị trí, phản hồi] không đóng gói được."""
+        codes = bytearray([UNANSWERED]) * len(self.question_order)
+        extras = []
+        last_position = -1
+        for index, response in enumerate(responses):
+            code = None
+            position = self.position.get(response.get("question_id")) if len(response) == 2 else None
+            if position is not None and "answer" in response:
+                answer = response["answer"]
+                if type(answer) in (int, str):
+                    code = self._value_codes[position].get((type(answer), answer))
+            # Chỉ đóng gói khi vị trí tái tạo được: theo đúng thứ tự bộ câu hỏi và mỗi câu một lần
+            if code is None or position <= last_position:
+                extras.append([index, response])
+                continue
+            codes[position] = code
+            last_position = position
+        return codes, extras
+
+    def encode_row(self, responses: List[Dict[str, Any]]) -> Tuple[bytearray, List[list]]:
+        """
+        Vector mã theo vị trí câu hỏi, bất kể thứ tự các phản hồi (cho ma trận đáp án, không cần tái tạo danh sách).
+        Trả về cùng danh sách [vị trí, phản hồi] của các phản hồi cho câu hỏi có bảng mã mà vector không biểu diễn được
+        (giá trị ngoài thang, sai kiểu, thiếu answer, trả lời trùng). Phản hồi cho câu tự luận hoặc câu không có trong
+        bộ câu hỏi không có cột trong vector và không bị tính là thiếu.
+        """
+        codes = bytearray([UNANSWERED]) * len(self.question_order)
+        unencoded = []
+        for index, response in enumerate(responses):
+            position = self.position.get(response.get("question_id"))
+            if position is None or not self.code_values[position]:
+                continue
+            answer = response.get("answer")
+            code = self._value_codes[position].get((type(answer), answer)) if type(answer) in (int, str) else None
+            if code is None or codes[position] != UNANSWERED:
+                unencoded.append([index, response])
+                continue
+            codes[position] = code
+        return codes, unencoded
+
+    def encode(self, record: Dict[str, Any]) -> bytes:
+        codes, extras = self.encode_codes(record.get("responses", []))
+        fields = []
+        for name in STRING_FIELDS:
+            value = record.get(name)
+            encoded = value.encode('utf-8') if type(value) is str else None
+            fields.append(encoded if encoded is not None and len(encoded) < MISSING_FIELD else None)
+        rest = {key: value for key, value in record.items()
+                if key != "responses" and not (key in STRING_FIELDS and fields[STRING_FIELDS.index(key)] is not None)}
+        rest_bytes = json.dumps([rest, extras], ensure_ascii=False, separators=(',', ':')).encode('utf-8') if rest or extras else b""
+        lengths = [MISSING_FIELD if field is None else len(field) for field in fields]
+        return b"".join([RECORD_HEADER.pack(MAGIC, self._version_bytes, len(codes), *lengths, len(rest_bytes)),
+                         *(field for field in fields if field is not None), rest_bytes, codes])
+
+    def _parse(self, data: bytes) -> Tuple[Dict[str, Any], list, memoryview] | None:
+        """(meta của bản ghi, extras, vùng mã đáp án) hoặc None nếu không đúng định dạng/bộ câu hỏi."""
+        magic, version_bytes, num_questions, *lengths, rest_len = RECORD_HEADER.unpack_from(data)
+        if magic != MAGIC:
+            print("Lỗi: Dữ liệu không phải bản ghi phản hồi nhị phân.")
+            return None
+        if version_bytes != self._version_bytes or num_questions != len(self.question_order):
+            print(f"Lỗi: Bản ghi thuộc bộ câu hỏi {version_bytes.hex()}, không phải {self.version}.")
+            return None
+        meta, extras = {}, []
+        offset = RECORD_HEADER.size
+        for name, length in zip(STRING_FIELDS, lengths):
+            if length != MISSING_FIELD:
+                meta[name] = data[offset:offset + length].decode('utf-8')
+                offset += length
+        if rest_len:
+            rest, extras = json.loads(data[offset:offset + rest_len])
+            meta.update(rest)
+            offset += rest_len
+        return meta, extras, memoryview(data)[offset:offset + num_questions]
+
+    def decode_codes(self, data: bytes) -> Tuple[Dict[str, Any], np.ndarray] | None:
+        """(meta của bản ghi, vector mã uint8 - không sao chép) mà không dựng lại danh sách phản hồi."""
+        parsed = self._parse(data)
+        if parsed is None:
+            return None
+        meta, _, codes = parsed
+        return meta, np.frombuffer(codes, dtype=np.uint8)
+
+    def decode(self, data: bytes) -> Dict[str, Any] | None:
+        """Khôi phục bản ghi như định dạng JSON ban đầu (cùng nội dung và thứ tự phản hồi)."""
+        parsed = self._parse(data)
+        if parsed is None:
+            return None
+        meta, extras, codes = parsed
+        responses = [{"question_id": question_id, "answer": values[code]}
+                     for question_id, values, code in zip(self.question_order, self.code_values, codes) if code != UNANSWERED]
+        for index, response in extras: # extras đã theo thứ tự vị trí tăng dần
+            responses.insert(index, response)
+        meta["responses"] = responses
+        return meta
+
+
+def peek_version(data: bytes) -> str | None:
+    """bank_version của một bản ghi nhị phân (để chọn đúng codec), None nếu không phải bản ghi nhị phân."""
+    if len(data) < RECORD_HEADER.size:
+        return None
+    magic, version_bytes = RECORD_HEADER.unpack_from(data)[:2]
+    return version_bytes.hex() if magic == MAGIC else None
+
+
+if __name__ == '__main__':
+    import os
+    import time
+    from core.question_generator import QuestionGenerator
+    from core.data_storage import DATA_DIR
+
+    bank = QuestionGenerator().bank
+    codec = ResponseCodec(bank)
+    print(f"Bộ câu hỏi {codec.version}: {len(codec.question_order)} câu hỏi")
+
+    print("\n--- Kiểm tra: decode(encode(record)) == record trên data/ và các trường hợp đặc biệt ---")
+    records = []
+    for name in sorted(os.listdir(DATA_DIR)):
+        if name.startswith("responses_") and name.endswith(".json"):
+            with open(os.path.join(DATA_DIR, name), 'r', encoding='utf-8') as f:
+                records.append(json.load(f))
+    ids = codec.question_order
+    records.append({"user_id": 7, "assessment_name": "", "extra": {"k": [1]}, "responses": [
+        {"question_id": ids[3], "answer": 2}, {"question_id": ids[1], "answer": 4}, # sai thứ tự
+        {"question_id": ids[5], "answer": 5.0}, {"question_id": ids[6], "answer": True}, # sai kiểu
+        {"question_id": ids[7], "answer": 9}, {"question_id": "KHONG_CO", "answer": 1}, # ngoài thang, câu lạ
+        {"question_id": ids[8], "answer": 1, "note": "x"}, {"question_id": ids[9]}, # khóa lạ, thiếu answer
+        {"question_id": ids[11], "answer": [1, 2]}, {"question_id": ids[12], "answer": "Tự luận"},
+        {"question_id": ids[10], "answer": 3}, {"question_id": ids[10], "answer": 3}, # trùng
+    ]})
+    mismatches = sum(codec.decode(codec.encode(record)) != record for record in records)
+    print(f"{len(records)} bản ghi, {mismatches} bản ghi sai lệch")
+
+    print("\n--- Benchmark: bản ghi đầy đủ 51 câu likert ---")
+    record = {"user_id": "user_1", "assessment_name": "tkinter_enhanced_v1", "timestamp": "2025-05-29T16:34:19.123456",
+              "responses": [{"question_id": qid, "answer": i % 5 + 1} for i, qid in enumerate(ids)]}
+    as_json = json.dumps(record, ensure_ascii=False, indent=4).encode('utf-8')
+    as_binary = codec.encode(record)
+    print(f"Kích thước: JSON indent=4 {len(as_json)} byte, nhị phân {len(as_binary)} byte ({len(as_json) / len(as_binary):.0f}x)")
+    for label, parse in (("json.loads", lambda: json.loads(as_json)), ("decode", lambda: codec.decode(as_binary)),
+                         ("decode_codes", lambda: codec.decode_codes(as_binary))):
+        start_time = time.perf_counter()
+        for _ in range(20_000):
+            parse()
+        print(f"{label}: {(time.perf_counter() - start_time) / 20_000 * 1e6:.1f} µs / bản ghi")
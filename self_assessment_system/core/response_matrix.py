@@ -0,0 +1,471 @@
+# self_assessment_system/core/response_matrix.py
+import datetime
+import json
+import os
+import shutil
+import threading
+import uuid
+from typing import List, Dict, Any, Iterable, Iterator, Tuple
+
+import numpy as np
+
+from core.analyzer import Analyzer
+from core.data_storage import DataStorage
+from core.response_codec import ResponseCodec, UNANSWERED
+from utils.file_lock import FileLock
+
+MATRIX_DIR = os.path.join(os.path.dirname(__file__), '..', 'data_matrix')
+# reconcile() đọc lại các bài làm lưu từ (hàng mới nhất trong store - khoảng này): bù cho lệch giờ giữa các tiến trình
+RECONCILE_MARGIN = datetime.timedelta(minutes=10)
+
+
+class ResponseMatrixStore:
+    """
+    Ma trận đáp án bài làm × câu hỏi lưu trên đĩa, dùng chung cho các job phân tích nhóm (norms, độ tin cậy, phân nhóm):
+    - answers.u8: mỗi bài làm một hàng uint8 độ rộng cố định theo ResponseCodec (UNANSWERED = chưa trả lời),
+      chỉ ghi nối; đọc qua numpy.memmap nên cắt lát không sao chép và không phải nạp cả file vào RAM.
+    - rows.jsonl: [submission_id, user_id, assessment_name, timestamp] của từng hàng.
+    - meta.json: bank_version, thứ tự câu hỏi của các cột và "generation" của lần build.
+    Bài làm mà vector mã không biểu diễn đúng (ResponseCodec.encode_row: đáp án ngoài thang, sai kiểu, trả lời trùng)
+    không được thêm vào store (submission_id ở self.rejected): các job cần cả những bài này phải quét storage.
+    Nhiều tiến trình có thể cùng ghi nối (mỗi UI gắn store vào DataStorage của mình): mỗi lần ghi giữ khóa .lock
+    của thư mục để hai file luôn cùng thứ tự hàng, và nạp trước các hàng do tiến trình khác đã thêm (xem refresh).
+    build() dựng trong thư mục tạm rồi thay các file dưới khóa; tiến trình đang mở store cũ thấy generation mới
+    và nạp lại từ đầu. load_or_build() đối chiếu với storage (reconcile) để bù các bài làm lưu khi chưa gắn store.
+    select() lọc bằng mask numpy trên mã số nguyên của user_id/assessment_name từng hàng (mã hóa dần khi có hàng mới).
+    """
+
+    ANSWERS_FILE = 'answers.u8'
+    ROWS_FILE = 'rows.jsonl'
+    META_FILE = 'meta.json'
+    LOCK_FILE = '.lock'
+
+    def __init__(self, codec: ResponseCodec, directory: str = MATRIX_DIR):
+        self.codec = codec
+        self.directory = directory
+        self.width = len(codec.question_order)
+        self.rows: List[List[str]] = []
+        self.row_index: Dict[str, int] = {} # submission_id -> số thứ tự hàng
+        self._matrix: np.ndarray | None = None
+        self._rows_bytes = 0 # Phần rows.jsonl đã nạp vào self.rows
+        self._generation: str | None = None # "generation" trong meta.json của các file đã nạp
+        self.rejected: set = set() # submission_id của các bài làm không thêm được vì vector mã không biểu diễn đúng
+        self._file_lock = FileLock(os.path.join(directory, self.LOCK_FILE))
+        # Mã số của user_id / assessment_name, và (mã user, mã bài đánh giá) của từng hàng (dung lượng tăng gấp đôi).
+        # Chỉ dựng khi select() cần, nên mở store không chậm thêm
+        self._user_codes: Dict[str, int] = {}
+        self._assessment_codes: Dict[str, int] = {}
+        self._row_codes = np.empty((0, 2), dtype=np.int32)
+        self._coded_rows = 0
+        self._lock = threading.Lock() # save listener (luồng ghi nền) thêm hàng trong khi UI gọi select()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Ma trận (len(self) × width) chỉ đọc trên memmap; view đã lấy trước đó vẫn hợp lệ sau khi store lớn thêm."""
+        if self._matrix is None or len(self._matrix) != len(self.rows):
+            if not self.rows:
+                return np.empty((0, self.width), dtype=np.uint8)
+            self._matrix = np.memmap(os.path.join(self.directory, self.ANSWERS_FILE), dtype=np.uint8, mode='r',
+                                     shape=(len(self.rows), self.width))
+        return self._matrix
+
+    @staticmethod
+    def _row_of(record: Dict[str, Any]) -> List[str]:
+        user_id, assessment_name, timestamp = record.get("user_id", ""), record.get("assessment_name", ""), record.get("timestamp", "")
+        # Bản ghi cũ không có submission_id (trước ULID): dùng bộ ba định danh làm id
+        submission_id = record.get("submission_id") or f"{user_id}/{assessment_name}/{timestamp}"
+        return [submission_id, user_id, assessment_name, timestamp]
+
+    def append(self, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        Ghi nối các bản ghi phản hồi (bỏ qua submission_id đã có). Bài làm có phản hồi không biểu diễn được trong
+        vector mã bị từ chối thay vì lưu thiếu. Trả về số hàng đã thêm.
+        """
+        rows, codes = [], bytearray()
+        seen = set()
+        rejected = []
+        for record in records:
+            row = self._row_of(record)
+            if row[0] in self.row_index or row[0] in seen or row[0] in self.rejected:
+                continue
+            seen.add(row[0])
+            row_codes, unencoded = self.codec.encode_row(record.get("responses", []))
+            if unencoded:
+                rejected.append(row[0])
+                continue
+            rows.append(row)
+            codes += row_codes
+        if rejected:
+            self.rejected.update(rejected)
+            print(f"Bỏ qua {len(rejected)} bài làm có đáp án không mã hóa được vào ma trận (ví dụ {rejected[0]})")
+        return self.append_codes(np.frombuffer(codes, dtype=np.uint8).reshape(len(rows), self.width), rows)
+
+    def append_codes(self, codes: np.ndarray, rows: List[List[str]]) -> int:
+        """
+        Ghi nối các hàng đã mã hóa sẵn (len(rows) × width, mã của ResponseCodec) cùng
+        [submission_id, user_id, assessment_name, timestamp] của từng hàng. Trả về số hàng đã thêm.
+        """
+        if not rows:
+            return 0
+        with self._file_lock.exclusive():
+            self._catch_up()
+            keep = [i for i, row in enumerate(rows) if row[0] not in self.row_index] # Tiến trình khác có thể đã thêm
+            if len(keep) < len(rows):
+                codes, rows = codes[keep], [rows[i] for i in keep]
+                if not rows:
+                    return 0
+            self._write_meta()
+            # Ma trận trước, metadata sau: khi bị ngắt giữa chừng, lần ghi/nạp sau cắt về số hàng có đủ cả hai
+            with open(os.path.join(self.directory, self.ANSWERS_FILE), 'ab') as f:
+                f.write(np.ascontiguousarray(codes, dtype=np.uint8).tobytes())
+            rows_bytes = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode('utf-8')
+            with open(os.path.join(self.directory, self.ROWS_FILE), 'ab') as f:
+                f.write(rows_bytes)
+            self._rows_bytes += len(rows_bytes)
+            self._add_rows(rows)
+        return len(rows)
+
+    def _add_rows(self, rows: List[List[str]]) -> None:
+        with self._lock:
+            for row in rows:
+                self.row_index[row[0]] = len(self.rows)
+                self.rows.append(row)
+
+    def _reset_in_memory(self) -> None:
+        """Bỏ mọi hàng đã nạp (các file vừa được build() thay thế). Danh sách mới: ảnh chụp cũ vẫn nhất quán."""
+        with self._lock:
+            self.rows = []
+            self.row_index = {}
+            self._matrix = None
+            self._user_codes, self._assessment_codes = {}, {}
+            self._row_codes = np.empty((0, 2), dtype=np.int32)
+            self._coded_rows = 0
+        self._rows_bytes = 0
+
+    def _update_row_codes(self) -> np.ndarray:
+        """Gọi khi đang giữ self._lock: mã hóa các hàng mới từ lần trước (lần đầu: cả store). Trả về mã của mọi hàng."""
+        start, needed = self._coded_rows, len(self.rows)
+        if needed > len(self._row_codes):
+            grown = np.empty((max(needed, 2 * len(self._row_codes), 1024), 2), dtype=np.int32)
+            grown[:start] = self._row_codes[:start]
+            self._row_codes = grown
+        rows = self.rows[start:needed]
+        self._row_codes[start:needed, 0] = [self._user_codes.setdefault(row[1], len(self._user_codes)) for row in rows]
+        self._row_codes[start:needed, 1] = [self._assessment_codes.setdefault(row[2], len(self._assessment_codes))
+                                            for row in rows]
+        self._coded_rows = needed
+        return self._row_codes[:needed]
+
+    def _catch_up(self) -> None:
+        """
+        Gọi khi đang giữ khóa: nạp các hàng đã được ghi nối kể từ lần đọc trước (bởi tiến trình khác), và cắt bỏ
+        phần dư của một lần ghi bị ngắt (mã đáp án chưa có metadata, dòng ghi dở) để hai file luôn khớp nhau.
+        """
+        meta = self._read_meta()
+        generation = meta.get("generation") if meta else None
+        if meta and (meta.get("bank_version") != self.codec.version or meta.get("question_order") != list(self.codec.question_order)):
+            # Tiến trình khác đã xây lại thư mục cho bộ câu hỏi khác: không được ghi hàng có độ rộng cũ vào đó
+            raise ValueError(f"Store '{self.directory}' đã được xây lại cho bộ câu hỏi {meta.get('bank_version')}")
+        if generation != self._generation:
+            if self.rows or self._rows_bytes:
+                self._reset_in_memory()
+            self._generation = generation
+        answers_path, rows_path = os.path.join(self.directory, self.ANSWERS_FILE), os.path.join(self.directory, self.ROWS_FILE)
+        try:
+            with open(rows_path, 'rb') as f:
+                f.seek(self._rows_bytes)
+                tail = f.read()
+        except FileNotFoundError:
+            tail = b""
+        complete = tail[:tail.rfind(b"\n") + 1] # Chỉ các dòng đầy đủ
+        lines = complete.split(b"\n")[:-1]
+        answers_size = os.path.getsize(answers_path) if os.path.exists(answers_path) else 0
+        count = min(answers_size // self.width, len(self.rows) + len(lines)) if self.width else len(self.rows)
+        if count - len(self.rows) < len(lines):
+            lines = lines[:max(count - len(self.rows), 0)]
+            complete = b"".join(line + b"\n" for line in lines)
+        if answers_size != count * self.width:
+            os.truncate(answers_path, count * self.width)
+        rows_bytes = self._rows_bytes + len(complete)
+        if len(tail) != len(complete):
+            os.truncate(rows_path, rows_bytes)
+        if lines:
+            # Một lần parse nhanh hơn nhiều so với từng dòng
+            self._add_rows(json.loads(b"[" + b",".join(lines) + b"]"))
+        self._rows_bytes = rows_bytes
+
+    def refresh(self) -> int:
+        """Nạp các hàng do tiến trình khác thêm vào từ lần đọc trước. Trả về số hàng mới."""
+        if not os.path.isdir(self.directory):
+            return 0
+        before = len(self.rows)
+        with self._file_lock.exclusive():
+            self._catch_up()
+        return len(self.rows) - before
+
+    def add_record(self, record: Dict[str, Any]) -> None:
+        """Thêm một bài làm vừa lưu; dùng làm save listener."""
+        self.append([record])
+
+    def attach(self, storage: DataStorage) -> "ResponseMatrixStore":
+        """Cập nhật store mỗi khi storage lưu một bài làm mới."""
+        storage.add_save_listener(self.add_record)
+        return self
+
+    def detach(self, storage: DataStorage) -> None:
+        """Ngừng cập nhật từ storage (trước khi store được thay bằng store của bộ câu hỏi mới)."""
+        storage.remove_save_listener(self.add_record)
+
+    def reconcile(self, storage: DataStorage, since: str | None = None, chunk_size: int = 8192) -> int:
+        """
+        Thêm các bài làm có trong storage nhưng chưa có trong store (lưu khi store chưa được gắn, hoặc trong lúc
+        build()). Chỉ đọc các bài làm từ `since`; mặc định từ hàng mới nhất trừ RECONCILE_MARGIN (store rỗng: cả kho).
+        Trả về số hàng đã thêm.
+        """
+        if since is None:
+            latest = max((row[3] for row in self.rows), default="")
+            try:
+                since = (datetime.datetime.fromisoformat(latest) - RECONCILE_MARGIN).isoformat() if latest else None
+            except ValueError:
+                since = None
+        added = 0
+        batch: List[Dict[str, Any]] = []
+        for record in storage.iter_responses(since=since):
+            submission_id = self._row_of(record)[0]
+            if submission_id in self.row_index or submission_id in self.rejected:
+                continue
+            batch.append(record)
+            if len(batch) >= chunk_size:
+                added += self.append(batch)
+                batch = []
+        return added + self.append(batch)
+
+    def select(self, user_id: str | None = None, assessment_name: str | None = None) -> np.ndarray:
+        """Chỉ số các hàng khớp bộ lọc (tăng dần), dùng để lấy hàng từ matrix."""
+        with self._lock:
+            codes = self._update_row_codes()
+            user_code = self._user_codes.get(user_id, -1) if user_id is not None else None
+            assessment_code = self._assessment_codes.get(assessment_name, -1) if assessment_name is not None else None
+        mask = np.ones(len(codes), dtype=bool)
+        if user_code is not None:
+            mask &= codes[:, 0] == user_code
+        if assessment_code is not None:
+            mask &= codes[:, 1] == assessment_code
+        return np.flatnonzero(mask)
+
+    def iter_chunks(self, rows: np.ndarray | None = None, chunk_size: int = 65_536) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Duyệt theo lô (chỉ số hàng, mã đáp án). Không lọc (rows=None): mỗi lô là một lát memmap, không sao chép;
+        với rows cho trước chỉ các hàng của lô hiện tại được đọc vào bộ nhớ.
+        """
+        matrix = self.matrix
+        if rows is None:
+            for start in range(0, len(matrix), chunk_size):
+                stop = min(start + chunk_size, len(matrix))
+                yield np.arange(start, stop), matrix[start:stop]
+        else:
+            for start in range(0, len(rows), chunk_size):
+                chunk_rows = rows[start:start + chunk_size]
+                yield chunk_rows, matrix[chunk_rows]
+
+    def _slot_table(self, analyzer: Analyzer) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Bảng tra (offset cột, slot, giá trị thô) cho mọi cặp (câu hỏi, mã đáp án): dựng bằng encode_coded_answers
+        trên các hàng giả, mỗi hàng đúng một cặp, nên quy tắc chấm điểm vẫn nằm trọn trong Analyzer.
+        """
+        offsets = np.cumsum([0] + [len(values) for values in self.codec.code_values[:-1]]).astype(np.int64)
+        answer_values = [value for values in self.codec.code_values for value in values]
+        num_pairs = len(answer_values)
+        columns = np.repeat(np.arange(self.width), [len(values) for values in self.codec.code_values])
+        values, counts = analyzer.encode_coded_answers(num_pairs, np.arange(num_pairs), columns, self.codec.question_order,
+                                                       np.arange(num_pairs), answer_values)
+        slots = np.where(counts.any(axis=1), counts.argmax(axis=1), -1) if num_pairs else np.empty(0, dtype=np.int64)
+        raw = values[np.arange(num_pairs), np.maximum(slots, 0)] if num_pairs else np.empty(0)
+        return offsets, slots, raw
+
+    def iter_encoded(self, analyzer: Analyzer, rows: np.ndarray | None = None,
+                     chunk_size: int = 65_536) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Theo lô: (values, counts) của các hàng, cùng định dạng với Analyzer.encode_response_sets, dựng thẳng từ mã đáp án."""
+        offsets, pair_slots, pair_raw = self._slot_table(analyzer)
+        num_slots = analyzer.num_slots
+        for _, codes in self.iter_chunks(rows, chunk_size):
+            row_index, columns = np.nonzero(codes != UNANSWERED)
+            pairs = offsets[columns] + codes[row_index, columns]
+            slots = pair_slots[pairs]
+            scored = slots >= 0
+            flat_slots = row_index[scored] * num_slots + slots[scored]
+            size = len(codes) * num_slots
+            values = np.bincount(flat_slots, weights=pair_raw[pairs[scored]], minlength=size).reshape(len(codes), num_slots)
+            counts = np.bincount(flat_slots, minlength=size).astype(np.float64).reshape(len(codes), num_slots)
+            yield values, counts
+
+    def _check_bank(self, analyzer: Analyzer) -> bool:
+        if analyzer.bank_version != self.codec.version:
+            print(f"Lỗi: Analyzer thuộc bộ câu hỏi {analyzer.bank_version}, store thuộc {self.codec.version}.")
+            return False
+        return True
+
+    def iter_scores(self, analyzer: Analyzer, rows: np.ndarray | None = None, chunk_size: int = 65_536) -> Iterator[np.ndarray]:
+        """Điểm các khía cạnh theo lô (mỗi lô tối đa chunk_size hàng); không lô nào nếu khác bộ câu hỏi."""
+        if not self._check_bank(analyzer):
+            return
+        for values, counts in self.iter_encoded(analyzer, rows, chunk_size):
+            yield analyzer.score_encoded(values, counts)
+
+    def scores(self, analyzer: Analyzer, rows: np.ndarray | None = None, chunk_size: int = 65_536) -> np.ndarray | None:
+        """Điểm các khía cạnh (N × analyzer.dimensions) của các hàng, tính theo lô thẳng từ mã đáp án."""
+        if not self._check_bank(analyzer):
+            return None
+        return np.vstack([np.empty((0, len(analyzer.dimensions)))] + list(self.iter_scores(analyzer, rows, chunk_size)))
+
+    def item_scores(self, analyzer: Analyzer, rows: np.ndarray | None = None, chunk_size: int = 65_536) -> np.ndarray | None:
+        """Điểm từng slot (N × analyzer.num_slots) như Analyzer.batch_item_scores; NaN nếu không trả lời."""
+        if not self._check_bank(analyzer):
+            return None
+        results = [np.empty((0, analyzer.num_slots))]
+        for values, counts in self.iter_encoded(analyzer, rows, chunk_size):
+            item_scores = np.full(values.shape, np.nan)
+            np.divide(values * analyzer.slot_signs + counts * analyzer.slot_offsets, counts, out=item_scores, where=counts > 0)
+            results.append(item_scores)
+        return np.vstack(results)
+
+    def item_values(self, rows: np.ndarray | None = None) -> np.ndarray:
+        """Ma trận giá trị đáp án (float32, NaN = chưa trả lời hoặc không phải số) theo thứ tự cột của store."""
+        table = np.full((self.width, 256), np.nan, dtype=np.float32)
+        for column, values in enumerate(self.codec.code_values):
+            for code, value in enumerate(values):
+                if type(value) in (int, float):
+                    table[column, code] = value
+        columns = np.arange(self.width)
+        return np.vstack([np.empty((0, self.width), dtype=np.float32)] +
+                         [table[columns, codes] for _, codes in self.iter_chunks(rows)])
+
+    def _read_meta(self) -> Dict[str, Any] | None:
+        try:
+            with open(os.path.join(self.directory, self.META_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (IOError, json.JSONDecodeError):
+            return None
+
+    def _write_meta(self) -> None:
+        meta_path = os.path.join(self.directory, self.META_FILE)
+        if os.path.exists(meta_path):
+            return
+        self._generation = uuid.uuid4().hex
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({"bank_version": self.codec.version, "question_order": list(self.codec.question_order),
+                       "generation": self._generation}, f, ensure_ascii=False, indent=4)
+
+    @classmethod
+    def load(cls, codec: ResponseCodec, directory: str = MATRIX_DIR) -> "ResponseMatrixStore | None":
+        """Mở store trên đĩa (chỉ đọc danh sách hàng, ma trận để nguyên trên đĩa); None nếu chưa có hoặc khác bộ câu hỏi."""
+        store = cls(codec, directory)
+        try:
+            with open(os.path.join(directory, cls.META_FILE), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("bank_version") != codec.version or meta.get("question_order") != list(codec.question_order):
+                return None
+            if not os.path.exists(os.path.join(directory, cls.ROWS_FILE)):
+                return None
+            # Lần ghi trước bị ngắt giữa chừng: chỉ giữ số hàng có đủ cả mã đáp án và metadata
+            with store._file_lock.exclusive():
+                store._catch_up()
+        except (IOError, json.JSONDecodeError, ValueError):
+            return None
+        return store
+
+    @classmethod
+    def build(cls, codec: ResponseCodec, records: Iterable[Dict[str, Any]], directory: str = MATRIX_DIR,
+              chunk_size: int = 8192) -> "ResponseMatrixStore":
+        """
+        Xây mới store từ các bản ghi phản hồi, ghi theo lô. Dựng trong thư mục tạm rồi thay các file dưới khóa:
+        tiến trình khác đang mở store không bao giờ thấy thư mục nửa cũ nửa mới.
+        """
+        temp = cls(codec, f"{directory}.tmp-{uuid.uuid4().hex[:8]}")
+        batch: List[Dict[str, Any]] = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= chunk_size:
+                temp.append(batch)
+                batch = []
+        temp.append(batch)
+        os.makedirs(temp.directory, exist_ok=True)
+        temp._write_meta() # Kho rỗng: vẫn tạo đủ ba file
+        for name in (cls.ANSWERS_FILE, cls.ROWS_FILE):
+            open(os.path.join(temp.directory, name), 'ab').close()
+
+        store = cls(codec, directory)
+        store.rejected = temp.rejected
+        with store._file_lock.exclusive():
+            for name in (cls.ANSWERS_FILE, cls.ROWS_FILE, cls.META_FILE): # meta sau cùng: generation mới
+                os.replace(os.path.join(temp.directory, name), os.path.join(directory, name))
+            store._catch_up()
+        shutil.rmtree(temp.directory, ignore_errors=True)
+        return store
+
+    @classmethod
+    def load_or_build(cls, codec: ResponseCodec, storage: DataStorage, directory: str = MATRIX_DIR) -> "ResponseMatrixStore":
+        """Mở (hoặc xây) store rồi bổ sung các bài làm trong storage mà store chưa có."""
+        store = cls.load(codec, directory)
+        if store is None:
+            started = (datetime.datetime.now() - RECONCILE_MARGIN).isoformat()
+            store = cls.build(codec, storage.iter_responses(), directory)
+            store.reconcile(storage, since=started) # Bài làm lưu trong lúc đang xây (vào các file cũ)
+        else:
+            store.reconcile(storage)
+        return store
+
+
+if __name__ == '__main__':
+    import sys
+    import tempfile
+    import time
+    from core.data_storage import create_storage
+    from core.question_generator import QuestionGenerator
+
+    generator = QuestionGenerator()
+    codec = ResponseCodec(generator.bank)
+    analyzer = generator.create_analyzer()
+    if len(sys.argv) > 1 and sys.argv[1] == "build": # python -m core.response_matrix build
+        store = ResponseMatrixStore.build(codec, create_storage().iter_responses())
+        print(f"Đã xây store {len(store)} hàng tại {os.path.abspath(MATRIX_DIR)}")
+        sys.exit(0)
+
+    print("--- Benchmark: 1.000.000 bài làm mô phỏng ---")
+    rng = np.random.default_rng(0)
+    ids = codec.question_order
+    bench_dir = tempfile.mkdtemp()
+    store = ResponseMatrixStore(codec, bench_dir)
+    start_time = time.perf_counter()
+    # Một lô nhỏ qua đường bản ghi JSON, phần còn lại ghi thẳng mã đáp án
+    answers = rng.integers(1, 6, size=(2000, len(ids)))
+    store.append({"submission_id": f"json_{i}", "user_id": f"user_{i}", "assessment_name": "assessment_0", "timestamp": "",
+                  "responses": [{"question_id": q, "answer": int(a)} for q, a in zip(ids, row)]}
+                 for i, row in enumerate(answers.tolist()))
+    for block in range(10):
+        codes = rng.integers(0, 5, size=(100_000, len(ids)), dtype=np.uint8)
+        codes[rng.random(codes.shape) < 0.1] = UNANSWERED # 10% câu bỏ trống
+        store.append_codes(codes, [[f"s{block}_{i}", f"user_{i % 50_000}", f"assessment_{i % 3}", ""] for i in range(len(codes))])
+    print(f"Ghi nối: {time.perf_counter() - start_time:.1f} giây, {os.path.getsize(os.path.join(bench_dir, store.ANSWERS_FILE)) / 1e6:.0f} MB")
+
+    start_time = time.perf_counter()
+    reopened = ResponseMatrixStore.load(codec, bench_dir)
+    print(f"Mở lại store {len(reopened)} hàng: {time.perf_counter() - start_time:.2f} giây (chỉ đọc rows.jsonl)")
+    view = reopened.matrix[200_000:300_000]
+    print(f"Lát 100.000 hàng là view của memmap (không sao chép): {np.shares_memory(view, reopened.matrix)}")
+
+    start_time = time.perf_counter()
+    scores = reopened.scores(analyzer)
+    print(f"Tính điểm toàn bộ từ memmap, theo lô 65.536 hàng: {time.perf_counter() - start_time:.1f} giây")
+    start_time = time.perf_counter()
+    subset = reopened.scores(analyzer, reopened.select(assessment_name="assessment_1"))
+    print(f"Tính điểm assessment_1 ({len(subset)} hàng): {time.perf_counter() - start_time:.1f} giây")
+
+    sample = np.sort(rng.choice(len(reopened), 2000, replace=False))
+    sample_records = [[{"question_id": q, "answer": codec.code_values[j][c]} for j, (q, c) in enumerate(zip(ids, row)) if c != UNANSWERED]
+                      for row in reopened.matrix[sample].tolist()]
+    expected = analyzer.batch_calculate_scores(sample_records)
+    print(f"Khớp batch_calculate_scores trên 2000 hàng: {np.array_equal(expected, scores[sample], equal_nan=True)}")
@@ -0,0 +1,171 @@
+# self_assessment_system/core/segmentation.py
+import os
+from typing import List, Dict, Any, Iterable
+
+import numpy as np
+
+from core.analyzer import Analyzer
+from core.data_storage import DataStorage, ANALYTICS_DIR, create_storage
+from core.response_matrix import ResponseMatrixStore
+
+SEGMENTS_FILE_PATH = os.path.join(ANALYTICS_DIR, 'profile_segments.npz')
+
+
+class ProfileSegmenter:
+    """
+    Phân nhóm (segmentation) hồ sơ người dùng theo ma trận điểm users × dimensions.
+    Huấn luyện bằng MiniBatchKMeans.partial_fit trên từng lô nên bộ nhớ chỉ phụ thuộc kích thước lô,
+    không phụ thuộc kích thước kho. Tâm cụm được lưu ra đĩa để gán nhóm cho bài làm mới với chi phí O(k × d).
+    """
+
+    def __init__(self, dimensions: List[str], centroids: np.ndarray, fill_values: np.ndarray,
+                 segment_sizes: np.ndarray, bank_version: str = ""):
+        self.dimensions = dimensions
+        self.dimension_index = {d: i for i, d in enumerate(dimensions)}
+        self.centroids = centroids
+        self.fill_values = fill_values # Giá trị điền cho khía cạnh chưa trả lời (trung bình cộng đồng)
+        self.segment_sizes = segment_sizes
+        self.bank_version = bank_version
+
+    @classmethod
+    def fit(cls, analyzer: Analyzer, response_sets: Iterable[List[Dict[str, Any]]],
+            n_segments: int = 6, chunk_size: int = 4096, random_state: int = 0) -> "ProfileSegmenter | None":
+        """
+        Huấn luyện theo luồng: mỗi lô được tính điểm bằng batch scoring, NaN được điền bằng trung bình
+        chạy (running mean) của từng khía cạnh, rồi đưa vào partial_fit.
+        """
+        def score_chunks() -> Iterable[np.ndarray]:
+            batch: List[List[Dict[str, Any]]] = []
+            for responses in response_sets:
+                batch.append(responses)
+                if len(batch) >= chunk_size:
+                    yield analyzer.batch_calculate_scores(batch)
+                    batch = []
+            if batch:
+                yield analyzer.batch_calculate_scores(batch)
+
+        return cls.fit_scores(analyzer, score_chunks(), n_segments, chunk_size, random_state)
+
+    @classmethod
+    def fit_scores(cls, analyzer: Analyzer, score_chunks: Iterable[np.ndarray],
+                   n_segments: int = 6, chunk_size: int = 4096, random_state: int = 0) -> "ProfileSegmenter | None":
+        """Huấn luyện từ các lô điểm đã tính sẵn (mỗi lô N × analyzer.dimensions, NaN = chưa trả lời)."""
+        from sklearn.cluster import MiniBatchKMeans # Chỉ cần khi huấn luyện, không cần khi gán nhóm
+
+        n_dims = len(analyzer.dimensions)
+        sums = np.zeros(n_dims)
+        counts = np.zeros(n_dims)
+        model = None
+        pending: List[np.ndarray] = [] # Gom các lô nhỏ cho đến khi đủ n_segments hàng cho lần fit đầu
+        sizes = None
+
+        def consume(scores: np.ndarray) -> None:
+            nonlocal model, sizes
+            answered = ~np.isnan(scores)
+            sums[:] += np.where(answered, scores, 0.0).sum(axis=0)
+            counts[:] += answered.sum(axis=0)
+            pending.append(scores)
+            if sum(len(p) for p in pending) < n_segments and model is None:
+                return
+            means = np.divide(sums, counts, out=np.zeros(n_dims), where=counts > 0)
+            block = np.vstack(pending)
+            pending.clear()
+            block = np.where(np.isnan(block), means, block)
+            if model is None:
+                model = MiniBatchKMeans(n_clusters=n_segments, random_state=random_state, n_init=3, batch_size=chunk_size)
+                sizes = np.zeros(n_segments, dtype=np.int64)
+            model.partial_fit(block)
+            sizes += np.bincount(model.predict(block), minlength=n_segments)
+
+        for scores in score_chunks:
+            if len(scores):
+                consume(scores)
+
+        if model is None:
+            print(f"Không đủ dữ liệu để phân thành {n_segments} nhóm.")
+            return None
+        fill_values = np.divide(sums, counts, out=np.zeros(n_dims), where=counts > 0)
+        return cls(list(analyzer.dimensions), model.cluster_centers_, fill_values, sizes, analyzer.bank_version)
+
+    @classmethod
+    def fit_storage(cls, analyzer: Analyzer, storage: DataStorage, assessment_name: str | None = None,
+                    **kwargs: Any) -> "ProfileSegmenter | None":
+        records = storage.iter_responses(assessment_name=assessment_name)
+        return cls.fit(analyzer, (record.get("responses", []) for record in records), **kwargs)
+
+    @classmethod
+    def fit_store(cls, analyzer: Analyzer, store: ResponseMatrixStore, assessment_name: str | None = None,
+                  chunk_size: int = 4096, **kwargs: Any) -> "ProfileSegmenter | None":
+        """Như fit_storage nhưng tính điểm từng lô thẳng từ ma trận đáp án (không đọc/giải mã JSON)."""
+        if analyzer.bank_version != store.codec.version:
+            print(f"Lỗi: Analyzer thuộc bộ câu hỏi {analyzer.bank_version}, store thuộc {store.codec.version}.")
+            return None
+        rows = store.select(assessment_name=assessment_name) if assessment_name is not None else None
+        return cls.fit_scores(analyzer, store.iter_scores(analyzer, rows, chunk_size), chunk_size=chunk_size, **kwargs)
+
+    def vectorize(self, overall_scores: Dict[str, float]) -> np.ndarray:
+        vector = self.fill_values.copy()
+        for dimension, score in overall_scores.items():
+            index = self.dimension_index.get(dimension)
+            if index is not None:
+                vector[index] = score
+        return vector
+
+    def assign(self, overall_scores: Dict[str, float]) -> int:
+        """Gán hồ sơ vào nhóm có tâm gần nhất; chi phí không phụ thuộc số người trong kho."""
+        distances = ((self.centroids - self.vectorize(overall_scores)) ** 2).sum(axis=1)
+        return int(np.argmin(distances))
+
+    def describe(self, segment: int, top_n: int = 3) -> Dict[str, Any]:
+        """Các khía cạnh nổi bật nhất (cao hơn trung bình cộng đồng) của một nhóm."""
+        deviation = self.centroids[segment] - self.fill_values
+        top = np.argsort(deviation)[::-1][:top_n]
+        total = self.segment_sizes.sum()
+        return {
+            "segment": segment,
+            "share": round(float(self.segment_sizes[segment] / total * 100), 1) if total else 0.0,
+            "top_dimensions": [self.dimensions[i] for i in top],
+        }
+
+    def save(self, file_path: str = SEGMENTS_FILE_PATH) -> bool:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+            np.savez(file_path,
+                     dimensions=np.array(self.dimensions, dtype=str),
+                     centroids=self.centroids,
+                     fill_values=self.fill_values,
+                     segment_sizes=self.segment_sizes,
+                     bank_version=np.array(self.bank_version))
+            return True
+        except IOError as e:
+            print(f"Lỗi khi lưu phân nhóm hồ sơ: {e}")
+            return False
+
+    @classmethod
+    def load(cls, file_path: str = SEGMENTS_FILE_PATH) -> "ProfileSegmenter | None":
+        if not os.path.exists(file_path):
+            return None
+        try:
+            with np.load(file_path, allow_pickle=False) as data:
+                return cls([str(d) for d in data["dimensions"]], data["centroids"], data["fill_values"],
+                           data["segment_sizes"], str(data["bank_version"]))
+        except (IOError, KeyError, ValueError) as e:
+            print(f"Lỗi khi tải phân nhóm hồ sơ: {e}")
+            return None
+
+
+if __name__ == '__main__':
+    # Huấn luyện lại phân nhóm từ toàn bộ kho phản hồi
+    import sys
+    from core.question_generator import QuestionGenerator
+    from core.response_codec import ResponseCodec
+    n_segments = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    generator = QuestionGenerator()
+    analyzer = generator.create_analyzer()
+    store = ResponseMatrixStore.load_or_build(ResponseCodec(generator.bank), create_storage())
+    segmenter = ProfileSegmenter.fit_store(analyzer, store, n_segments=n_segments)
+    if segmenter:
+        segmenter.save()
+        print(f"Đã lưu {len(segmenter.centroids)} nhóm vào: {os.path.abspath(SEGMENTS_FILE_PATH)}")
+        for segment in range(len(segmenter.centroids)):
+            print(segmenter.describe(segment))
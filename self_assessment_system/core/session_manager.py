@@ -1,39 +1,304 @@
+import atexit
+import collections
+import json
+import os
+import threading
+import time
+import weakref
 from datetime import datetime
+from typing import List, Dict, Any, Callable
+
+from utils.ulid import new_ulid
+
+ACTIVE = 'active'
+COMPLETED = 'completed'
+# Keys of the old dict sessions; Session answers dict-style access for these
+SESSION_KEYS = ('session_id', 'user_id', 'start_time', 'end_time', 'status', 'data')
+
+
+class Session:
+    """One user session. __slots__ keeps it to a fixed handful of pointers instead of a per-session dict."""
+
+    __slots__ = ('session_id', 'user_id', 'start_time', 'end_time', 'last_access', 'status', 'data')
+
+    def __init__(self, session_id: str, user_id: str):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.start_time = time.time() # Wall clock, for reporting
+        self.end_time: float | None = None
+        self.last_access = time.monotonic() # Monotonic, for TTL
+        self.status = ACTIVE
+        self.data: Dict[str, Any] | None = None # Created on first update
+
+    def __getitem__(self, key: str) -> Any:
+        """Dict-style access kept for callers of the old dict sessions (session['user_id'])."""
+        if key not in self:
+            raise KeyError(key)
+        if key == 'data':
+            if self.data is None:
+                self.data = {} # Stored on the session, so session['data'][k] = v is kept
+            return self.data
+        if key in ('start_time', 'end_time'):
+            return datetime.fromtimestamp(getattr(self, key))
+        return getattr(self, key)
+
+    def __contains__(self, key: object) -> bool:
+        """Like the old dicts: 'end_time' is only present once the session has ended."""
+        return key in SESSION_KEYS and (key != 'end_time' or self.end_time is not None)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self[key] if key in self else default
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'session_id': self.session_id,
+            'user_id': self.user_id,
+            'start_time': datetime.fromtimestamp(self.start_time).isoformat(),
+            'end_time': datetime.fromtimestamp(self.end_time).isoformat() if self.end_time is not None else None,
+            'status': self.status,
+            'data': self.data or {},
+        }
+
 
 class SessionManager:
-    def __init__(self):
-        self.current_session = None
-        self.sessions = {}
-    
-    def create_session(self, user_id):
+    """
+    Bounded in-memory session store for a long-running server.
+    - LRU: at most `capacity` sessions; creating one more evicts the least recently used.
+    - TTL: a session not accessed for `ttl_seconds` expires. It is dropped lazily when accessed, and a
+      background sweeper removes the rest every `sweep_interval` seconds.
+    - Every eviction (reasons: "capacity", "expired", "shutdown") is reported to the eviction listeners
+      in batches, outside the lock; SessionArchive uses this to persist completed sessions.
+    - Neither the sweeper thread nor the exit hook keeps the manager alive: a manager that is garbage
+      collected stops its sweeper, one that is still open at interpreter exit is closed.
+    """
+
+    def __init__(self, capacity: int = 10_000, ttl_seconds: float | None = 30 * 60,
+                 sweep_interval: float | None = 60.0):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.current_session: str | None = None
+        # Least recently used first, so expired sessions are always at the front
+        self.sessions: collections.OrderedDict[str, Session] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._eviction_listeners: List[Callable[[List[Session], str], None]] = []
+        self._stats = {"created": 0, "evicted_capacity": 0, "evicted_expired": 0, "evicted_shutdown": 0}
+        self._closed = threading.Event()
+        self._sweeper = None
+        if sweep_interval and ttl_seconds is not None:
+            self._sweeper = threading.Thread(target=_sweep_loop, args=(weakref.ref(self), self._closed, sweep_interval),
+                                             name="session-sweeper", daemon=True)
+            self._sweeper.start()
+        # Collected without close(): stop the sweeper. Not at exit, where _close_open_managers closes it properly
+        weakref.finalize(self, self._closed.set).atexit = False
+        _open_managers.add(self)
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def add_eviction_listener(self, listener: Callable[[List[Session], str], None]) -> None:
+        """Register a function called with (evicted sessions, reason) after each eviction."""
+        self._eviction_listeners.append(listener)
+
+    def _notify_evicted(self, sessions: List[Session], reason: str) -> None:
+        if not sessions:
+            return
+        with self._lock:
+            self._stats[f"evicted_{reason}"] += len(sessions)
+        for listener in self._eviction_listeners:
+            try:
+                listener(sessions, reason)
+            except Exception as e:
+                print(f"Error in session eviction listener: {e}")
+
+    def _expired(self, session: Session, now: float) -> bool:
+        return self.ttl_seconds is not None and now - session.last_access > self.ttl_seconds
+
+    def _evict_one(self, session_id: str) -> Session:
+        """Remove a session from the store. Call with the lock held."""
+        if self.current_session == session_id:
+            self.current_session = None
+        return self.sessions.pop(session_id)
+
+    def create_session(self, user_id: str) -> str:
         """Create a new session for a user"""
-        session_id = f"{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        self.sessions[session_id] = {
-            'user_id': user_id,
-            'start_time': datetime.now(),
-            'status': 'active',
-            'data': {}
-        }
-        self.current_session = session_id
+        session_id = new_ulid() # Unique even for two sessions started within the same second
+        with self._lock:
+            evicted = []
+            while len(self.sessions) >= self.capacity:
+                evicted.append(self._evict_one(next(iter(self.sessions))))
+            self.sessions[session_id] = Session(session_id, user_id)
+            self.current_session = session_id
+            self._stats["created"] += 1
+        self._notify_evicted(evicted, "capacity")
         return session_id
-    
-    def get_session(self, session_id):
-        """Retrieve a session by ID"""
-        return self.sessions.get(session_id)
-    
-    def update_session(self, session_id, data):
+
+    def _touch(self, session_id: str) -> Session | None:
+        """The live session (marked as just used), or None. Expired sessions are evicted here."""
+        expired = None
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return None
+            now = time.monotonic()
+            if self._expired(session, now):
+                expired = self._evict_one(session_id)
+            else:
+                session.last_access = now
+                self.sessions.move_to_end(session_id)
+        if expired is not None:
+            self._notify_evicted([expired], "expired")
+            return None
+        return session
+
+    def get_session(self, session_id: str) -> Session | None:
+        """
+        Retrieve a session by ID. The Session answers the old dict API for its keys (session['data'],
+        session.get('end_time'), 'end_time' in session); use the attributes or to_dict() for anything else.
+        """
+        return self._touch(session_id)
+
+    def update_session(self, session_id: str, data: Dict[str, Any]) -> bool:
         """Update session data"""
-        if session_id in self.sessions:
-            self.sessions[session_id]['data'].update(data)
-            return True
-        return False
-    
-    def end_session(self, session_id):
-        """End a session"""
-        if session_id in self.sessions:
-            self.sessions[session_id]['status'] = 'completed'
-            self.sessions[session_id]['end_time'] = datetime.now()
+        session = self._touch(session_id)
+        if session is None:
+            return False
+        with self._lock:
+            if session.data is None:
+                session.data = {}
+            session.data.update(data)
+        return True
+
+    def end_session(self, session_id: str) -> bool:
+        """End a session. It stays readable until evicted, at which point listeners can persist it."""
+        session = self._touch(session_id)
+        if session is None:
+            return False
+        with self._lock:
+            session.status = COMPLETED
+            session.end_time = time.time()
             if self.current_session == session_id:
                 self.current_session = None
-            return True
-        return False
\ No newline at end of file
+        return True
+
+    def sweep(self) -> int:
+        """Evict every expired session now. Returns the number evicted."""
+        now = time.monotonic()
+        with self._lock:
+            evicted = []
+            while self.sessions:
+                session = next(iter(self.sessions.values()))
+                if not self._expired(session, now):
+                    break # Everything behind it was used more recently
+                evicted.append(self._evict_one(session.session_id))
+        self._notify_evicted(evicted, "expired")
+        return len(evicted)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "sessions": len(self.sessions)}
+
+    def close(self) -> None:
+        """Stop the sweeper and hand every remaining session to the listeners (reason "shutdown")."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self._sweeper is not None and self._sweeper is not threading.current_thread():
+            self._sweeper.join()
+        with self._lock:
+            evicted = list(self.sessions.values())
+            self.sessions.clear()
+            self.current_session = None
+        self._notify_evicted(evicted, "shutdown")
+        _open_managers.discard(self)
+
+
+# Managers not closed yet; weak, so registering for the exit hook does not keep a manager alive
+_open_managers: "weakref.WeakSet[SessionManager]" = weakref.WeakSet()
+
+
+def _close_open_managers() -> None:
+    for manager in list(_open_managers):
+        manager.close()
+
+
+atexit.register(_close_open_managers)
+
+
+def _sweep_loop(manager_ref: "weakref.ref[SessionManager]", closed: threading.Event, interval: float) -> None:
+    """Sweeper thread body. Holds the manager only while sweeping, and stops once it is closed or collected."""
+    while not closed.wait(interval):
+        manager = manager_ref()
+        if manager is None:
+            return
+        manager.sweep()
+        del manager
+
+
+class SessionArchive:
+    """Eviction listener that appends completed sessions to a JSON-lines file, one write per eviction batch."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def add_sessions(self, sessions: List[Session], reason: str) -> None:
+        lines = [json.dumps(session.to_dict(), ensure_ascii=False, default=str) + "\n"
+                 for session in sessions if session.status == COMPLETED]
+        if not lines:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+
+    def attach(self, manager: SessionManager) -> "SessionArchive":
+        manager.add_eviction_listener(self.add_sessions)
+        return self
+
+
+if __name__ == '__main__':
+    import tempfile
+    import tracemalloc
+
+    print("--- Memory: 100,000 concurrent sessions ---")
+
+    def measure(build: Callable[[], Any]) -> float:
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        kept = build()
+        size = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, 'filename'))
+        tracemalloc.stop()
+        del kept
+        return size / 100_000
+
+    def old_style() -> Dict[str, Any]:
+        sessions = {}
+        for i in range(100_000):
+            user_id = f"user_{i}"
+            sessions[f"{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{i}"] = {
+                'user_id': user_id, 'start_time': datetime.now(), 'status': 'active', 'data': {}
+            }
+        return sessions
+
+    def new_style() -> SessionManager:
+        manager = SessionManager(capacity=200_000, sweep_interval=None)
+        for i in range(100_000):
+            manager.create_session(f"user_{i}")
+        return manager
+
+    print(f"Old dict sessions: {measure(old_style):.0f} bytes / session")
+    print(f"__slots__ sessions: {measure(new_style):.0f} bytes / session (including the user_id and session id strings)")
+
+    print("\n--- LRU capacity and TTL eviction, completed sessions archived ---")
+    archive_path = os.path.join(tempfile.mkdtemp(), "sessions.jsonl")
+    manager = SessionManager(capacity=1000, ttl_seconds=0.2, sweep_interval=0.1)
+    SessionArchive(archive_path).attach(manager)
+    ids = [manager.create_session(f"user_{i}") for i in range(1500)]
+    for session_id in ids[-100:]:
+        manager.end_session(session_id)
+    print(f"After 1500 creates with capacity 1000: {len(manager)} sessions, oldest evicted: {manager.get_session(ids[0]) is None}")
+    time.sleep(0.5)
+    print(f"After the TTL: {len(manager)} sessions left, stats {manager.stats()}")
+    with open(archive_path, 'r', encoding='utf-8') as f:
+        print(f"Archived completed sessions: {sum(1 for _ in f)}")
+    manager.close()
@@ -0,0 +1,226 @@
+# self_assessment_system/core/sqlite_storage.py
+import datetime
+import json
+import os
+import sqlite3
+import threading
+from typing import List, Dict, Any, Iterable, Iterator, Tuple
+
+from core.data_storage import DataStorage, DATA_DIR, time_bound
+
+SQLITE_DIR = os.path.join(os.path.dirname(__file__), '..', 'data_sqlite')
+DATABASE_FILE = 'responses.sqlite3'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    assessment_name TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    record TEXT NOT NULL,
+    source_file TEXT UNIQUE,
+    submission_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_submissions_user_assessment_time
+    ON submissions (user_id, assessment_name, timestamp);
+"""
+# Tạo sau khi cơ sở dữ liệu cũ (chưa có cột submission_id) đã được thêm cột; NULL (bản ghi cũ) không bị coi là trùng
+SUBMISSION_ID_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS idx_submissions_submission_id ON submissions (submission_id)"
+
+# Câu lệnh cố định có tham số: sqlite3 cache statement đã biên dịch theo chuỗi SQL
+INSERT_SQL = ("INSERT OR IGNORE INTO submissions (user_id, assessment_name, timestamp, record, source_file, submission_id) "
+              "VALUES (?, ?, ?, ?, ?, ?)")
+LATEST_SQL = "SELECT record FROM submissions WHERE user_id = ? AND assessment_name = ? ORDER BY timestamp DESC LIMIT 1"
+LIST_SQL = "SELECT timestamp, assessment_name, id, submission_id FROM submissions WHERE user_id = ? ORDER BY timestamp"
+LIST_BY_ASSESSMENT_SQL = ("SELECT timestamp, assessment_name, id, submission_id FROM submissions "
+                          "WHERE user_id = ? AND assessment_name = ? ORDER BY timestamp")
+HISTORY_SQL = "SELECT record FROM submissions WHERE user_id = ? ORDER BY timestamp"
+HISTORY_BY_ASSESSMENT_SQL = "SELECT record FROM submissions WHERE user_id = ? AND assessment_name = ? ORDER BY timestamp"
+
+
+class SQLiteStorage(DataStorage):
+    """
+    Backend lưu trữ SQLite (chỉ dùng thư viện chuẩn): một bảng submissions với chỉ mục
+    (user_id, assessment_name, timestamp), nên bản ghi mới nhất và lịch sử là phép tìm trên chỉ mục
+    thay vì liệt kê cả thư mục. WAL cho phép đọc song song với ghi; mỗi luồng dùng kết nối riêng.
+    Mỗi bản ghi có submission_id (ULID) như backend JSON, lưu cả ở cột submission_id (UNIQUE). Không dùng manifest
+    và segment đã gộp của backend JSON.
+    """
+
+    def __init__(self, data_directory: str = SQLITE_DIR, database_file: str = DATABASE_FILE):
+        self._init_directory(data_directory, fsync=False)
+        self.database_path = os.path.join(data_directory, database_file)
+        self._local = threading.local()
+        connection = self._connection()
+        connection.executescript(SCHEMA)
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(submissions)")}
+        if "submission_id" not in columns: # Cơ sở dữ liệu tạo trước khi có submission_id
+            with connection:
+                connection.execute("ALTER TABLE submissions ADD COLUMN submission_id TEXT")
+        connection.execute(SUBMISSION_ID_INDEX)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.database_path, timeout=30, cached_statements=64)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL") # Với WAL: an toàn khi tiến trình chết, chỉ mất khi mất điện
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _row_for(record: Dict[str, Any], source_file: str | None = None) -> tuple:
+        return (record.get("user_id", ""), record.get("assessment_name", ""), record.get("timestamp", ""),
+                json.dumps(record, ensure_ascii=False, separators=(',', ':')), source_file, record.get("submission_id"))
+
+    def save_responses(self, user_id: str, responses: List[Dict[str, Any]], assessment_name: str = "general") -> bool:
+        data_to_save = self._new_record(user_id, responses, assessment_name)
+        try:
+            connection = self._connection()
+            with connection: # Một transaction, commit khi thoát khối
+                connection.execute(INSERT_SQL, self._row_for(data_to_save))
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"Lỗi khi lưu phản hồi vào SQLite: {e}")
+            return False
+        self._notify_saved(data_to_save)
+        return True
+
+    def save_many(self, submissions: Iterable[Tuple[str, List[Dict[str, Any]], str]]) -> List[bool]:
+        """Lưu cả nhóm bài làm trong một transaction (một lần commit cho cả nhóm)."""
+        records = [self._new_record(user_id, responses, assessment_name) for user_id, responses, assessment_name in submissions]
+        try:
+            connection = self._connection()
+            with connection:
+                connection.executemany(INSERT_SQL, [self._row_for(record) for record in records])
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"Lỗi khi lưu phản hồi vào SQLite: {e}")
+            return [False] * len(records)
+        for record in records:
+            self._notify_saved(record)
+        return [True] * len(records)
+
+    def insert_records(self, records: Iterable[Dict[str, Any]], source_files: Iterable[str | None] | None = None) -> int:
+        """Chèn hàng loạt trong một transaction (executemany). Bản ghi trùng source_file hoặc submission_id bị bỏ qua."""
+        records = list(records)
+        sources = list(source_files) if source_files is not None else [None] * len(records)
+        rows = [self._row_for(record, source) for record, source in zip(records, sources)]
+        connection = self._connection()
+        with connection:
+            before = connection.total_changes
+            connection.executemany(INSERT_SQL, rows)
+            return connection.total_changes - before
+
+    def load_latest_response(self, user_id: str, assessment_name: str = "general") -> Dict[str, Any] | None:
+        """Tải phản hồi gần nhất của người dùng cho một bài đánh giá cụ thể (một lần tìm trên chỉ mục)."""
+        try:
+            row = self._connection().execute(LATEST_SQL, (user_id, assessment_name)).fetchone()
+            return json.loads(row[0]) if row else None
+        except (sqlite3.Error, json.JSONDecodeError) as e:
+            print(f"Lỗi khi tải phản hồi từ SQLite: {e}")
+            return None
+
+    def list_submissions(self, user_id: str, assessment_name: str | None = None) -> List[Dict[str, Any]]:
+        if assessment_name is None:
+            rows = self._connection().execute(LIST_SQL, (user_id,))
+        else:
+            rows = self._connection().execute(LIST_BY_ASSESSMENT_SQL, (user_id, assessment_name))
+        return [{"timestamp": timestamp, "assessment_name": name, "id": row_id, "submission_id": submission_id}
+                for timestamp, name, row_id, submission_id in rows]
+
+    def load_history(self, user_id: str, assessment_name: str | None = None) -> List[Dict[str, Any]]:
+        if assessment_name is None:
+            rows = self._connection().execute(HISTORY_SQL, (user_id,))
+        else:
+            rows = self._connection().execute(HISTORY_BY_ASSESSMENT_SQL, (user_id, assessment_name))
+        return [json.loads(record) for (record,) in rows]
+
+    def rebuild_manifest(self, if_incomplete: bool = False) -> int:
+        raise NotImplementedError("Backend SQLite không có manifest: lịch sử được tra trực tiếp trên chỉ mục của bảng")
+
+    def compact(self, older_than_seconds: float = 7 * 24 * 3600, records_per_segment: int = 100_000) -> Dict[str, int]:
+        raise NotImplementedError("Backend SQLite không có file phản hồi rời để gộp")
+
+    def iter_responses(self, user_id: str | None = None, assessment_name: str | None = None,
+                       since: datetime.datetime | str | None = None,
+                       until: datetime.datetime | str | None = None) -> Iterator[Dict[str, Any]]:
+        """
+        Duyệt các bản ghi theo thứ tự chèn; con trỏ SQLite chỉ giữ từng lô nhỏ trong bộ nhớ.
+        Bộ lọc thành mệnh đề WHERE (dùng chỉ mục khi có user_id).
+        """
+        conditions, parameters = [], []
+        for clause, value in (("user_id = ?", user_id), ("assessment_name = ?", assessment_name),
+                              ("timestamp >= ?", time_bound(since)), ("timestamp < ?", time_bound(until))):
+            if value is not None:
+                conditions.append(clause)
+                parameters.append(value)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = self._connection().execute(f"SELECT record FROM submissions{where} ORDER BY id", parameters)
+        while True:
+            rows = cursor.fetchmany(512)
+            if not rows:
+                return
+            for (record,) in rows:
+                yield json.loads(record)
+
+    def import_json_directory(self, directory: str = DATA_DIR, batch_size: int = 1000) -> int:
+        """
+        Nhập một lần các file data/responses_*.json hiện có; chạy lại an toàn vì tên file
+        được lưu ở cột source_file (UNIQUE) nên file đã nhập sẽ bị bỏ qua.
+        """
+        imported = 0
+        records: List[Dict[str, Any]] = []
+        sources: List[str] = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not (entry.name.startswith("responses_") and entry.name.endswith(".json")):
+                    continue
+                try:
+                    with open(entry.path, 'r', encoding='utf-8') as f:
+                        records.append(json.load(f))
+                    sources.append(entry.name)
+                except (IOError, json.JSONDecodeError) as e:
+                    print(f"Bỏ qua file phản hồi không đọc được '{entry.name}': {e}")
+                if len(records) >= batch_size:
+                    imported += self.insert_records(records, sources)
+                    records, sources = [], []
+        if records:
+            imported += self.insert_records(records, sources)
+        return imported
+
+    def close(self) -> None:
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+if __name__ == '__main__':
+    import sys
+    import tempfile
+    import time
+
+    if len(sys.argv) > 1 and sys.argv[1] == "import": # python -m core.sqlite_storage import [thư_mục_json]
+        storage = SQLiteStorage()
+        count = storage.import_json_directory(sys.argv[2] if len(sys.argv) > 2 else DATA_DIR)
+        print(f"Đã nhập {count} bản ghi vào {os.path.abspath(storage.database_path)}")
+        sys.exit(0)
+
+    storage = SQLiteStorage(tempfile.mkdtemp())
+    print(f"Nhập thử từ data/: {storage.import_json_directory()} bản ghi")
+    responses = [{"question_id": f"Q{i:02d}", "answer": i % 5 + 1} for i in range(50)]
+
+    print("\n--- Benchmark: 50.000 bản ghi, 5.000 người dùng ---")
+    start_time = time.perf_counter()
+    base = datetime.datetime(2024, 1, 1)
+    batch = [{"user_id": f"user_{i % 5000}", "assessment_name": f"assessment_{i % 3}",
+              "timestamp": (base + datetime.timedelta(minutes=i)).isoformat(), "responses": responses}
+             for i in range(50_000)]
+    storage.insert_records(batch)
+    print(f"Chèn hàng loạt: {time.perf_counter() - start_time:.2f} giây")
+
+    start_time = time.perf_counter()
+    for i in range(2000):
+        storage.load_latest_response(f"user_{i * 7 % 5000}", "assessment_1")
+    print(f"load_latest_response: {(time.perf_counter() - start_time) / 2000 * 1000:.3f} ms / lần")
+    plan = storage._connection().execute("EXPLAIN QUERY PLAN " + LATEST_SQL, ("user_1", "assessment_1")).fetchall()
+    print(f"Kế hoạch truy vấn: {plan[0][-1]}")
@@ -0,0 +1,195 @@
+# self_assessment_system/core/submission_manifest.py
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from typing import List, Dict, Any, Iterable, Tuple, Set
+
+from utils.file_lock import FileLock
+
+MANIFEST_DIRNAME = '.manifest'
+MANIFEST_META_FILE = 'meta.json'
+# Khóa giữa các tiến trình, đặt ngoài thư mục manifest vì thư mục đó bị thay thế khi rebuild
+MANIFEST_LOCK_FILE = '.manifest.lock'
+REBUILD_LOCK_FILE = '.manifest.rebuild.lock'
+MANIFEST_FORMAT = 1
+TAIL_BYTES = 4096 # Đủ cho vài chục dòng cuối: bài mới nhất luôn nằm trong đó
+
+
+class SubmissionManifest:
+    """
+    Chỉ mục lâu dài cho thư mục data/ của DataStorage, khóa theo (user_id, assessment_name):
+    data/.manifest/<hash user_id>/<hash assessment_name>.jsonl, mỗi dòng [timestamp, assessment_name, filename].
+    - Lưu bài: nối thêm dòng bằng một lệnh write O_APPEND, sau khi file phản hồi đã nằm trên đĩa, nên manifest
+      không bao giờ trỏ tới file chưa tồn tại và các tiến trình ghi song song không làm mất dòng của nhau.
+    - Bài mới nhất: chỉ đọc TAIL_BYTES cuối của một file, không phụ thuộc số file trong data/ hay độ dài lịch sử.
+    - Dòng ghi dở (khi tiến trình chết) bị bỏ qua khi đọc. File đặt vào data/ bằng tay (không qua save_responses)
+      chỉ xuất hiện sau khi chạy rebuild().
+    - Nhiều tiến trình (tkinter, streamlit, web): ghi nối giữ khóa chia sẻ (không chặn nhau), việc thay thư mục khi
+      rebuild giữ khóa độc quyền, và mỗi lúc chỉ một tiến trình rebuild. Người đọc không khóa; chỉ khi không tìm thấy
+      file (có thể rơi đúng lúc thay thư mục) mới đọc lại dưới khóa chia sẻ.
+    """
+
+    def __init__(self, data_directory: str):
+        self.data_directory = data_directory
+        self.directory = os.path.join(data_directory, MANIFEST_DIRNAME)
+        self._file_lock = FileLock(os.path.join(data_directory, MANIFEST_LOCK_FILE))
+        self._rebuild_lock = FileLock(os.path.join(data_directory, REBUILD_LOCK_FILE))
+
+    @staticmethod
+    def _digest(text: str) -> str:
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _user_directory(self, user_id: str, directory: str | None = None) -> str:
+        return os.path.join(directory or self.directory, self._digest(user_id))
+
+    def _key_path(self, user_id: str, assessment_name: str, directory: str | None = None) -> str:
+        return os.path.join(self._user_directory(user_id, directory), f"{self._digest(assessment_name)}.jsonl")
+
+    def is_complete(self) -> bool:
+        """True khi manifest đã được dựng từ toàn bộ thư mục (bởi rebuild)."""
+        return os.path.exists(os.path.join(self.directory, MANIFEST_META_FILE))
+
+    @staticmethod
+    def _parse_lines(text: str) -> List[List[str]]:
+        entries = []
+        for line in text.split("\n"):
+            try:
+                entry = json.loads(line) if line else None
+            except json.JSONDecodeError:
+                continue # Dòng ghi dở
+            if isinstance(entry, list) and len(entry) == 3:
+                entries.append(entry)
+        return entries
+
+    def latest(self, user_id: str, assessment_name: str) -> str | None:
+        """Tên file bài làm mới nhất của (user_id, assessment_name), đọc phần đuôi của một file manifest."""
+        filename = self._latest(user_id, assessment_name)
+        if filename is None:
+            with self._file_lock.shared(): # Không rơi vào lúc rebuild đang thay thư mục
+                filename = self._latest(user_id, assessment_name)
+        return filename
+
+    def _latest(self, user_id: str, assessment_name: str) -> str | None:
+        try:
+            with open(self._key_path(user_id, assessment_name), 'rb') as f:
+                size = f.seek(0, os.SEEK_END)
+                f.seek(max(0, size - TAIL_BYTES))
+                tail = f.read().decode('utf-8', errors='replace')
+        except FileNotFoundError:
+            return None
+        except IOError as e:
+            print(f"Lỗi khi đọc manifest của người dùng '{user_id}': {e}")
+            return None
+        if size > TAIL_BYTES:
+            tail = tail.split("\n", 1)[-1] # Dòng đầu có thể bị cắt giữa chừng
+        entries = [entry for entry in self._parse_lines(tail) if entry[1] == assessment_name]
+        # Lấy timestamp lớn nhất chứ không phải dòng cuối: tiến trình khác có thể nối dòng hơi lệch thứ tự
+        return max(entries)[2] if entries else None
+
+    def history(self, user_id: str, assessment_name: str | None = None) -> List[Tuple[str, str, str]]:
+        """[(timestamp, assessment_name, filename)] cũ -> mới, mọi bài đánh giá nếu assessment_name là None."""
+        entries, complete = self._history(user_id, assessment_name)
+        if not complete:
+            with self._file_lock.shared():
+                entries, _ = self._history(user_id, assessment_name)
+        return entries
+
+    def _history(self, user_id: str, assessment_name: str | None) -> Tuple[List[Tuple[str, str, str]], bool]:
+        """(các dòng manifest, False nếu có file không tìm thấy)."""
+        if assessment_name is not None:
+            paths = [self._key_path(user_id, assessment_name)]
+        else:
+            user_directory = self._user_directory(user_id)
+            try:
+                paths = [os.path.join(user_directory, name) for name in os.listdir(user_directory) if name.endswith(".jsonl")]
+            except FileNotFoundError:
+                return [], False
+        entries, complete = set(), True
+        for path in paths:
+            try:
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    entries.update(tuple(entry) for entry in self._parse_lines(f.read())
+                                   if assessment_name is None or entry[1] == assessment_name)
+            except FileNotFoundError:
+                complete = False
+            except IOError as e:
+                print(f"Lỗi khi đọc manifest của người dùng '{user_id}': {e}")
+        return sorted(entries), complete
+
+    def add(self, entries: Iterable[Tuple[Dict[str, Any], str]], directory: str | None = None) -> None:
+        """Ghi nhận các bài làm đã lưu (bản ghi, tên file): mỗi khóa (user_id, assessment_name) một lần ghi nối."""
+        by_key: Dict[Tuple[str, str], List[str]] = {}
+        for record, filename in entries:
+            key = (record.get("user_id", ""), record.get("assessment_name", ""))
+            by_key.setdefault(key, []).append(
+                json.dumps([record.get("timestamp", ""), key[1], filename], ensure_ascii=False, separators=(',', ':')) + "\n")
+        if directory is not None: # Thư mục tạm của rebuild, chỉ tiến trình đang rebuild ghi vào
+            self._append_lines(by_key, directory)
+            return
+        with self._file_lock.shared(): # Không ghi vào thư mục manifest đang bị rebuild thay thế
+            self._append_lines(by_key, None)
+
+    def _append_lines(self, by_key: Dict[Tuple[str, str], List[str]], directory: str | None) -> None:
+        for (user_id, assessment_name), lines in by_key.items():
+            path = self._key_path(user_id, assessment_name, directory)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, "".join(lines).encode('utf-8'))
+            finally:
+                os.close(fd)
+
+    def mark_complete(self, count: int = 0, directory: str | None = None) -> None:
+        os.makedirs(directory or self.directory, exist_ok=True)
+        with open(os.path.join(directory or self.directory, MANIFEST_META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({"format": MANIFEST_FORMAT, "submissions": count}, f)
+
+    def rebuild(self, stored: Iterable[Tuple[Dict[str, Any], str]] | None = None, if_incomplete: bool = False) -> int:
+        """
+        Dựng lại manifest từ các bài làm trên đĩa (mặc định: các file responses_*.json, đọc mỗi file một lần;
+        DataStorage truyền thêm cả bài làm đã gộp vào segment), ghi vào thư mục tạm rồi thay thế manifest cũ.
+        Bài làm được lưu trong lúc dựng lại được bổ sung sau khi thay. Trả về số bài làm.
+        if_incomplete=True: bỏ qua (trả về 0) nếu tiến trình khác vừa dựng xong trong lúc chờ khóa.
+        """
+        with self._rebuild_lock.exclusive():
+            if if_incomplete and self.is_complete():
+                return 0
+            temp_directory = f"{self.directory}.tmp-{uuid.uuid4().hex[:8]}"
+            entries = self._sorted_entries(self._scan() if stored is None else stored)
+            self.add(entries, temp_directory)
+            self.mark_complete(len(entries), temp_directory)
+            old_directory = f"{self.directory}.old-{uuid.uuid4().hex[:8]}"
+            with self._file_lock.exclusive(): # Chờ các lần ghi nối đang dở vào thư mục cũ
+                if os.path.exists(self.directory):
+                    os.rename(self.directory, old_directory)
+                os.rename(temp_directory, self.directory)
+            shutil.rmtree(old_directory, ignore_errors=True)
+            # Bổ sung mọi file chưa có trong bản dựng, so theo tên chứ không theo mtime: một lần lưu bắt đầu trước
+            # khi dựng (hoặc mtime thô của hệ thống file) không bị bỏ sót. Lần lưu ghi file trước rồi mới nối manifest,
+            # nên file nào chưa thấy ở đây sẽ tự nối vào thư mục mới. Dòng trùng không ảnh hưởng history() và latest().
+            # Sắp theo thời gian để bài mới nhất vẫn nằm trong TAIL_BYTES cuối dù nhóm này dài.
+            built = {filename for _, filename in entries}
+            self.add(self._sorted_entries(self._scan(skip_names=built)))
+            return len(entries)
+
+    @staticmethod
+    def _sorted_entries(stored: Iterable[Tuple[Dict[str, Any], str]]) -> List[Tuple[Dict[str, Any], str]]:
+        """(bản ghi, tên file) theo thứ tự timestamp, chỉ giữ các trường cần cho manifest (không giữ cả bản ghi)."""
+        return sorted((({name: record.get(name, "") for name in ("user_id", "assessment_name", "timestamp")}, filename)
+                       for record, filename in stored), key=lambda item: item[0]["timestamp"])
+
+    def _scan(self, skip_names: Set[str] | None = None) -> Iterable[Tuple[Dict[str, Any], str]]:
+        """(bản ghi, tên file) của các file responses_*.json; skip_names: các file không cần đọc lại."""
+        with os.scandir(self.data_directory) as entries:
+            for entry in entries:
+                if not (entry.name.startswith("responses_") and entry.name.endswith(".json")):
+                    continue
+                if skip_names is not None and entry.name in skip_names:
+                    continue
+                try:
+                    with open(entry.path, 'r', encoding='utf-8') as f:
+                        yield json.load(f), entry.name
+                except (IOError, json.JSONDecodeError) as e:
+                    print(f"Bỏ qua file phản hồi không đọc được '{entry.name}': {e}")
@@ -0,0 +1,85 @@
+# self_assessment_system/core/trends.py
+import datetime
+from typing import List, Dict, Any
+
+import numpy as np
+
+from core.analyzer import Analyzer
+from core.data_storage import DataStorage
+
+
+class TrendAnalyzer:
+    """
+    Phân tích xu hướng theo thời gian của một người dùng qua nhiều lần làm bài.
+    Mọi lần làm bài được tính điểm cùng lúc (batch scoring); độ dốc của mọi khía cạnh
+    được tính vector hóa bằng bình phương tối thiểu.
+    """
+
+    def __init__(self, analyzer: Analyzer, storage: DataStorage):
+        self.analyzer = analyzer
+        self.storage = storage
+
+    @staticmethod
+    def _to_days(timestamps: List[str]) -> np.ndarray:
+        """Đổi timestamp ISO sang số ngày kể từ lần làm bài đầu tiên."""
+        times = [datetime.datetime.fromisoformat(ts) for ts in timestamps]
+        return np.array([(t - times[0]).total_seconds() / 86400 for t in times], dtype=np.float64)
+
+    @staticmethod
+    def _slopes(days: np.ndarray, scores: np.ndarray) -> np.ndarray:
+        """Độ dốc (điểm/ngày) của từng cột, bỏ qua NaN; NaN nếu cột có dưới 2 điểm thời gian khác nhau."""
+        mask = ~np.isnan(scores)
+        n = mask.sum(axis=0)
+        t = np.where(mask, days[:, None], 0.0)
+        y = np.where(mask, scores, 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_mean = t.sum(axis=0) / n
+            y_mean = y.sum(axis=0) / n
+            t_centered = np.where(mask, days[:, None] - t_mean, 0.0)
+            covariance = (t_centered * (y - y_mean * mask)).sum(axis=0)
+            variance = (t_centered ** 2).sum(axis=0)
+            slopes = covariance / variance
+        slopes[(n < 2) | (variance == 0)] = np.nan
+        return slopes
+
+    def user_trends(self, user_id: str, assessment_name: str | None = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Chuỗi điểm theo thời gian cho từng khía cạnh của người dùng.
+        Trả về {dimension: {"timestamps", "scores", "deltas", "total_change", "slope_per_day"}}.
+        """
+        history = self.storage.load_history(user_id, assessment_name)
+        if not history:
+            return {}
+
+        timestamps = [record.get("timestamp", "") for record in history]
+        scores = self.analyzer.batch_calculate_scores(record.get("responses", []) for record in history)
+        days = self._to_days(timestamps)
+        slopes = self._slopes(days, scores)
+
+        trends: Dict[str, Dict[str, Any]] = {}
+        for j, dimension in enumerate(self.analyzer.dimensions):
+            answered = np.flatnonzero(~np.isnan(scores[:, j]))
+            if answered.size == 0:
+                continue
+            series = scores[answered, j]
+            trends[dimension] = {
+                "timestamps": [timestamps[i] for i in answered],
+                "scores": series.tolist(),
+                "deltas": np.round(np.diff(series), 2).tolist(),
+                "total_change": round(float(series[-1] - series[0]), 2),
+                "slope_per_day": None if np.isnan(slopes[j]) else round(float(slopes[j]), 4),
+            }
+        return trends
+
+
+if __name__ == '__main__':
+    # Test
+    from core.question_generator import QuestionGenerator
+    trend_analyzer = TrendAnalyzer(Analyzer(QuestionGenerator().get_all_questions()), DataStorage())
+    user = "Trần Thế Hảo"
+    print(f"Các lần làm bài của {user}:")
+    for submission in trend_analyzer.storage.list_submissions(user):
+        print(f"  {submission['timestamp']} - {submission['assessment_name']}")
+
+    for dimension, trend in list(trend_analyzer.user_trends(user).items())[:5]:
+        print(f"{dimension}: {trend['scores']} (delta {trend['deltas']}, độ dốc {trend['slope_per_day']}/ngày)")
@@ -2,6 +2,7 @@
 import os
 import datetime
 from typing import Dict, List, Any, Tuple
+from core.analyzer import AnalysisResult
 
 class ReportGenerator:
     def __init__(self, output_dir: str = "output_reports_tkinter_enhanced"):
@@ -40,6 +41,33 @@ class ReportGenerator:
         html_output += "</ul>"
         return html_output
 
+    def _format_percentiles(self, percentiles: Dict[str, float] | None) -> str:
+        if not percentiles:
+            return ""
+        html_output = "<h3>So sánh với cộng đồng:</h3><ul>"
+        for key, pct in sorted(percentiles.items()):
+            html_output += f"<li>{key}: bạn ở bách phân vị thứ {round(pct)}</li>"
+        html_output += "</ul>"
+        return html_output
+
+    def _format_segment(self, profile_segment: Dict[str, Any] | None) -> str:
+        if not profile_segment:
+            return ""
+        return (f"<h3>Nhóm hồ sơ tương tự:</h3><p>Bạn thuộc nhóm {profile_segment['segment'] + 1} "
+                f"({profile_segment['share']:.1f}% người dùng), nổi bật ở: {', '.join(profile_segment['top_dimensions'])}.</p>")
+
+    def _format_similar_profiles(self, similar_profiles: Dict[str, Any] | None) -> str:
+        if not similar_profiles:
+            return ""
+        strength_scores = similar_profiles.get('strength_scores', {})
+        html_output = (f"<h3>Những hồ sơ giống bạn nhất:</h3><p>{similar_profiles['count']} hồ sơ ẩn danh "
+                       f"(khoảng cách trung bình {similar_profiles['mean_distance']:.2f}) thường mạnh về:</p><ul>")
+        for key in similar_profiles['common_strengths']:
+            score = strength_scores.get(key)
+            html_output += f"<li>{key}" + (f": điểm trung bình {score:.2f}" if score is not None else "") + "</li>"
+        html_output += "</ul>"
+        return html_output
+
     def generate_html_report(self,
                              user_id: str,
                              overall_scores: Dict[str, float],
@@ -47,7 +75,10 @@ class ReportGenerator:
                              value_proportions: Dict[str, float],
                              motivation_trends: Dict[str, float],
                              open_ended_responses: List[Dict[str, str]],
-                             chart_paths_absolute: Dict[str, str | None]
+                             chart_paths_absolute: Dict[str, str | None],
+                             percentiles: Dict[str, float] | None = None,
+                             profile_segment: Dict[str, Any] | None = None,
+                             similar_profiles: Dict[str, Any] | None = None
                             ) -> str | None:
         report_timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         report_filename_base = f"report_{user_id}_{datetime.datetime.now().strftime('%Y%m%d%H%M')}"
@@ -114,6 +145,9 @@ class ReportGenerator:
                         {f'<img src="{radar_src}" alt="Radar Chart">' if radar_src else "<p>Không có biểu đồ radar.</p>"}
                     </div>
                     {self._format_dict_to_html_list(overall_scores, "Điểm số chi tiết các khía cạnh")}
+                    {self._format_percentiles(percentiles)}
+                    {self._format_segment(profile_segment)}
+                    {self._format_similar_profiles(similar_profiles)}
                 </div>
 
                 <div class="section">
@@ -180,4 +214,25 @@ class ReportGenerator:
             return report_filepath_absolute
         except IOError as e:
             print(f"Lỗi khi tạo báo cáo HTML: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    def generate_html_report_from_analysis(self,
+                                           user_id: str,
+                                           analysis: AnalysisResult,
+                                           open_ended_responses: List[Dict[str, str]],
+                                           chart_paths_absolute: Dict[str, str | None],
+                                           percentiles: Dict[str, float] | None = None,
+                                           profile_segment: Dict[str, Any] | None = None,
+                                           similar_profiles: Dict[str, Any] | None = None
+                                          ) -> str | None:
+        """Tạo báo cáo HTML trực tiếp từ kết quả Analyzer.analyze_all()."""
+        return self.generate_html_report(user_id,
+                                         analysis.overall_scores,
+                                         analysis.strengths_weaknesses,
+                                         analysis.value_proportions,
+                                         analysis.motivation_trends,
+                                         open_ended_responses,
+                                         chart_paths_absolute,
+                                         percentiles,
+                                         profile_segment,
+                                         similar_profiles)
\ No newline at end of file
@@ -1,8 +1,15 @@
 # self_assessment_system/streamlit_app.py
 import streamlit as st
 from core.question_generator import QuestionGenerator
-from core.data_storage import DataStorage
+from core.data_storage import DataStorage, create_storage
+from core.async_writer import AsyncStorageWriter
 from core.analyzer import Analyzer
+from core.analysis_cache import AnalysisCache
+from core.cohort_norms import CohortNorms
+from core.segmentation import ProfileSegmenter
+from core.profile_index import ProfileIndex
+from core.response_codec import ResponseCodec
+from core.response_matrix import ResponseMatrixStore
 from visualization.plotter import Plotter # Plotly sẽ hiển thị trực tiếp trong Streamlit
 from reporting.report_generator import ReportGenerator # Có thể hiển thị HTML hoặc link tải
 import os
@@ -12,11 +19,59 @@ import json # Để hiển thị debug
 # Nên cache để tránh tải lại câu hỏi mỗi lần tương tác
 @st.cache_resource # Dùng cache_resource cho các đối tượng không thể hash
 def load_question_generator():
-    return QuestionGenerator()
+    generator = QuestionGenerator()
+    generator.start_watching() # Sửa assets/questions.json có hiệu lực cho các phiên mới mà không cần khởi động lại
+    generator.add_reload_listener(on_bank_reloaded)
+    return generator
 
 @st.cache_resource
 def get_data_storage():
-    return DataStorage()
+    return create_storage()
+
+@st.cache_resource
+def get_async_writer():
+    # Ghi ở luồng nền: lượt chạy script không phải chờ đĩa, hàng đợi được ghi hết khi tiến trình thoát
+    return AsyncStorageWriter(get_data_storage())
+
+@st.cache_resource
+def get_analyzer():
+    return load_question_generator().snapshot().analyzer
+
+@st.cache_resource
+def get_analysis_cache():
+    return AnalysisCache(get_analyzer())
+
+@st.cache_resource
+def get_matrix_store():
+    # Ma trận đáp án trên đĩa cho các job phân tích nhóm, cập nhật mỗi khi storage lưu bài làm mới
+    bank = load_question_generator().snapshot().bank
+    return ResponseMatrixStore.load_or_build(ResponseCodec(bank), get_data_storage()).attach(get_data_storage())
+
+@st.cache_resource
+def get_cohort_norms():
+    # Norms được lưu trên đĩa, chỉ xây lại (từ ma trận đáp án) khi chưa có hoặc đã cũ; bài làm mới được chèn qua listener
+    return CohortNorms.load_or_build(get_analyzer(), get_data_storage(),
+                                     store=get_matrix_store()).attach(get_data_storage(), get_analyzer())
+
+@st.cache_resource
+def get_segmenter():
+    return ProfileSegmenter.load() # None nếu chưa chạy job phân nhóm
+
+@st.cache_resource
+def get_profile_index():
+    # Chỉ mục nạp từ đĩa và tự cập nhật mỗi khi storage lưu bài làm mới
+    return ProfileIndex.load_or_build(get_analyzer(), get_data_storage()).attach(get_data_storage())
+
+def on_bank_reloaded(old_snapshot, new_snapshot):
+    # Các đối tượng trên được dựng từ analyzer của bộ câu hỏi cũ và cache_resource không tự biết bộ câu hỏi đã đổi:
+    # gỡ listener của chúng khỏi storage rồi xóa cache để lần gọi sau dựng lại theo phiên bản mới
+    get_matrix_store().detach(get_data_storage())
+    get_profile_index().detach(get_data_storage())
+    get_cohort_norms().detach(get_data_storage())
+    for getter in (get_analyzer, get_analysis_cache, get_matrix_store, get_cohort_norms, get_segmenter, get_profile_index):
+        getter.clear()
+    get_matrix_store() # Gắn lại listener ngay, không chờ lượt chạy script kế tiếp
+    get_profile_index()
 
 @st.cache_resource
 def get_plotter():
@@ -29,6 +84,9 @@ def get_report_generator():
 
 q_generator = load_question_generator()
 storage = get_data_storage()
+writer = get_async_writer()
+get_matrix_store() # Gắn listener trước lần lưu đầu tiên để ma trận và chỉ mục không bỏ sót bài làm
+get_profile_index()
 plotter = get_plotter() # Plotter sẽ được dùng để tạo ảnh cho report, hoặc vẽ trực tiếp
 reporter = get_report_generator()
 all_questions_data = q_generator.get_all_questions()
@@ -78,12 +136,20 @@ def display_streamlit_question(question_data, question_key_suffix):
 def run_streamlit_assessment():
     st.title("📝 Hệ Thống Tự Đánh Giá Cá Nhân")
 
+    # Mỗi phiên giữ bộ câu hỏi (và Analyzer) của lúc bắt đầu, kể cả khi file câu hỏi được nạp lại giữa chừng
+    if 'bank_snapshot' not in st.session_state:
+        st.session_state.bank_snapshot = q_generator.snapshot()
+    bank, analyzer = st.session_state.bank_snapshot
+    session_questions = bank.questions
+
     if 'user_id' not in st.session_state:
         st.session_state.user_id = ""
     if 'current_question_index' not in st.session_state:
         st.session_state.current_question_index = 0
     if 'user_responses' not in st.session_state:
         st.session_state.user_responses = []
+    if 'live_scorer' not in st.session_state:
+        st.session_state.live_scorer = analyzer.incremental_scorer(category_filter="Giá trị cốt lõi")
     if 'assessment_complete' not in st.session_state:
         st.session_state.assessment_complete = False
     if 'show_report' not in st.session_state:
@@ -105,11 +171,11 @@ def run_streamlit_assessment():
         st.info(f"Chào mừng, {st.session_state.user_id}!")
 
         # --- Giai đoạn trả lời câu hỏi ---
-        num_questions = len(all_questions_data)
+        num_questions = len(session_questions)
         current_idx = st.session_state.current_question_index
 
         if current_idx < num_questions:
-            question = all_questions_data[current_idx]
+            question = session_questions[current_idx]
             st.progress((current_idx + 1) / num_questions)
             st.markdown(f"--- **Câu {current_idx + 1} / {num_questions}** ---")
 
@@ -141,6 +207,7 @@ def run_streamlit_assessment():
                                 "question_id": question['id'],
                                 "answer": user_answer
                             })
+                        st.session_state.live_scorer.record(question['id'], user_answer)
 
                         st.session_state.current_question_index += 1
                         st.rerun()
@@ -154,8 +221,10 @@ def run_streamlit_assessment():
             st.session_state.assessment_complete = True
             # Lưu trữ kết quả
             if st.session_state.user_responses:
-                storage.save_responses(st.session_state.user_id, st.session_state.user_responses, assessment_name="streamlit_assessment_v1")
-                st.info("Kết quả của bạn đã được lưu lại.")
+                if writer.save_responses(st.session_state.user_id, st.session_state.user_responses, assessment_name="streamlit_assessment_v1"):
+                    st.info("Kết quả của bạn đã được lưu lại.")
+                else:
+                    st.error("Không thể lưu kết quả, vui lòng thử lại sau.")
             if st.button("Xem Kết Quả Phân Tích", key="view_results_button"):
                 st.session_state.show_report = True
                 st.rerun()
@@ -175,15 +244,21 @@ def run_streamlit_assessment():
             st.error("Không tìm thấy dữ liệu phản hồi để phân tích.")
             return
 
-        analyzer = Analyzer(all_questions_data) # Khởi tạo analyzer ở đây
-        overall_scores = analyzer.calculate_overall_scores(user_final_responses)
-        strengths_weaknesses = analyzer.identify_strengths_weaknesses(overall_scores)
-        value_proportions = analyzer.analyze_value_proportions(user_final_responses, category_filter="Giá trị cốt lõi")
-        motivation_trends = analyzer.analyze_motivation_trends(user_final_responses)
+        # Điểm đã được cộng dồn khi từng câu được gửi; các lần rerun với cùng phản hồi lấy từ cache
+        analysis = get_analysis_cache().analyze(user_final_responses, compute=st.session_state.live_scorer.result,
+                                                analyzer=analyzer)
+        overall_scores = analysis.overall_scores
+        strengths_weaknesses = analysis.strengths_weaknesses
+        value_proportions = analysis.value_proportions
+        motivation_trends = analysis.motivation_trends
+        percentiles = get_cohort_norms().percentiles(overall_scores)
+        segmenter = get_segmenter()
+        profile_segment = segmenter.describe(segmenter.assign(overall_scores)) if segmenter else None
+        similar_profiles = get_profile_index().similar_profiles_summary(overall_scores, exclude_user=st.session_state.user_id)
 
         open_ended_responses_formatted = []
         for resp in user_final_responses:
-            q_info = q_generator.get_question_by_id(resp['question_id'])
+            q_info = bank.get(resp['question_id'])
             if q_info and q_info['type'] in ['open_short', 'open_long'] and resp['answer']:
                 open_ended_responses_formatted.append({
                     "question_text": q_info['text'],
@@ -233,6 +308,19 @@ def run_streamlit_assessment():
                 st.write("Chưa xác định.")
 
 
+        if percentiles:
+            with st.expander("So sánh với cộng đồng"):
+                for dim, pct in sorted(percentiles.items()):
+                    st.markdown(f"- {dim}: bạn ở bách phân vị thứ **{round(pct)}**")
+
+        if profile_segment:
+            st.info(f"Bạn thuộc nhóm hồ sơ {profile_segment['segment'] + 1} ({profile_segment['share']:.1f}% người dùng), "
+                    f"nổi bật ở: {', '.join(profile_segment['top_dimensions'])}")
+
+        if similar_profiles:
+            st.caption(f"{similar_profiles['count']} hồ sơ giống bạn nhất thường mạnh về: "
+                       f"{', '.join(similar_profiles['common_strengths'])}")
+
         if value_proportions:
             st.subheader("Tỷ lệ Giá trị cốt lõi")
             fig_pie_values = go.Figure(data=[go.Pie(labels=list(value_proportions.keys()),
@@ -267,14 +355,14 @@ def run_streamlit_assessment():
 
             # ... (tạo các chart khác cho báo cáo nếu cần)
 
-            html_report_path = reporter.generate_html_report(
+            html_report_path = reporter.generate_html_report_from_analysis(
                 st.session_state.user_id,
-                overall_scores,
-                strengths_weaknesses,
-                value_proportions,
-                motivation_trends,
+                analysis,
                 open_ended_responses_formatted,
-                chart_paths_for_report # Truyền các đường dẫn ảnh đã lưu
+                chart_paths_for_report, # Truyền các đường dẫn ảnh đã lưu
+                percentiles,
+                profile_segment,
+                similar_profiles
             )
             if html_report_path and os.path.exists(html_report_path):
                 with open(html_report_path, "rb") as fp:
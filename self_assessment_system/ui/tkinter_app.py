@@ -13,8 +13,15 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 from core.question_generator import QuestionGenerator
-from core.data_storage import DataStorage
+from core.data_storage import DataStorage, create_storage
+from core.async_writer import AsyncStorageWriter
 from core.analyzer import Analyzer
+from core.analysis_cache import AnalysisCache
+from core.cohort_norms import CohortNorms
+from core.segmentation import ProfileSegmenter
+from core.profile_index import ProfileIndex
+from core.response_codec import ResponseCodec
+from core.response_matrix import ResponseMatrixStore
 from visualization.plotter import Plotter
 from reporting.report_generator import ReportGenerator
 
@@ -76,8 +83,19 @@ class EnhancedTkinterApp:
             self.root.destroy()
             return
 
-        self.storage = DataStorage()
-        self.analyzer = Analyzer(self.all_questions)
+        self.storage = create_storage()
+        self.writer = AsyncStorageWriter(self.storage) # save_responses chạy ở luồng nền, mainloop không bị chặn
+        self.analyzer = self.q_generator.create_analyzer() # Dùng bảng tính điểm đã biên dịch trong cache
+        self.live_scorer = self.analyzer.incremental_scorer() # Cập nhật điểm ngay khi từng câu được trả lời
+        self.analysis_cache = AnalysisCache(self.analyzer)
+        # Ma trận đáp án cho các job phân tích nhóm, cập nhật cùng mỗi lần lưu
+        self.matrix_store = ResponseMatrixStore.load_or_build(ResponseCodec(self.q_generator.bank), self.storage).attach(self.storage)
+        # Chỉ xây lại khi norms chưa có hoặc đã cũ (từ ma trận đáp án); sau đó mỗi bài làm mới được chèn vào norms
+        self.cohort_norms = CohortNorms.load_or_build(self.analyzer, self.storage,
+                                                      store=self.matrix_store).attach(self.storage, self.analyzer)
+        self.segmenter = ProfileSegmenter.load() # None nếu chưa chạy job phân nhóm (python -m core.segmentation)
+        # "Những hồ sơ giống tôi": bổ sung các bài làm còn thiếu từ storage khi nạp, sau đó cập nhật cùng mỗi lần lưu
+        self.profile_index = ProfileIndex.load_or_build(self.analyzer, self.storage).attach(self.storage)
         self.plotter = Plotter(output_dir="output_charts_tkinter_enhanced")
         self.reporter = ReportGenerator(output_dir="output_reports_tkinter_enhanced")
 
@@ -90,6 +108,12 @@ class EnhancedTkinterApp:
         self.container_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
 
         self.setup_user_id_input()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_close(self):
+        self.writer.close() # Ghi hết các bài làm đang chờ (listener cập nhật norms chạy trong lúc đó)
+        self.cohort_norms.close() # Lưu các bài làm đã chèn vào norms từ lần lưu trước
+        self.root.destroy()
 
     def clear_frame(self, frame):
         for widget in frame.winfo_children():
@@ -127,6 +151,7 @@ class EnhancedTkinterApp:
         self.root.unbind('<Return>')
         self.current_question_index = 0
         self.user_responses = []
+        self.live_scorer.reset()
         self.display_current_question()
 
     def display_current_question(self):
@@ -241,9 +266,11 @@ class EnhancedTkinterApp:
                 self.user_responses[existing_response_index] = response_entry
             else:
                 self.user_responses.append(response_entry)
+            self.live_scorer.record(q_data['id'], answer_value)
             return True
         elif existing_response_index != -1: # Nếu câu trả lời cũ có, giờ thành không hợp lệ -> xóa
             del self.user_responses[existing_response_index]
+            self.live_scorer.remove(q_data['id'])
         return False
 
 
@@ -319,8 +346,10 @@ class EnhancedTkinterApp:
                   style="Title.TLabel").pack(pady=20)
 
         if self.user_responses:
-            self.storage.save_responses(self.user_id, self.user_responses, "tkinter_enhanced_v1")
-            ttk.Label(content_frame, text="Kết quả của bạn đã được lưu.", style="FrameSubheading.TLabel").pack(pady=10)
+            save_future = self.writer.submit(self.user_id, self.user_responses, "tkinter_enhanced_v1")
+            status_label = ttk.Label(content_frame, text="Đang lưu kết quả...", style="FrameSubheading.TLabel")
+            status_label.pack(pady=10)
+            self.show_save_status(save_future, status_label)
             ttk.Button(content_frame, text="Xem Kết Quả Phân Tích",
                        command=self.show_results_window, style="TButton").pack(pady=15, ipadx=10)
         else:
@@ -332,17 +361,35 @@ class EnhancedTkinterApp:
         ttk.Button(buttons_frame, text="Thoát", command=self.root.quit, style="TButton").pack(side=tk.LEFT, padx=10)
 
 
+    def show_save_status(self, save_future, status_label):
+        """Cập nhật nhãn trạng thái khi luồng ghi xong (tkinter chỉ được chạm widget từ mainloop, nên hỏi lại bằng after)."""
+        if not status_label.winfo_exists():
+            return
+        if not save_future.done():
+            self.root.after(100, self.show_save_status, save_future, status_label)
+        elif save_future.result():
+            status_label.config(text="Kết quả của bạn đã được lưu.")
+        else:
+            status_label.config(text="Không thể lưu kết quả. Vui lòng thử lại.")
+
+
     def show_results_window(self):
         results_win = tk.Toplevel(self.root)
         results_win.title(f"Kết Quả Phân Tích - {self.user_id}")
         results_win.geometry("1000x780")
         results_win.configure(bg=BG_COLOR)
 
-        # Phải gọi phân tích ở đây để có dữ liệu mới nhất
-        overall_scores = self.analyzer.calculate_overall_scores(self.user_responses)
-        strengths_weaknesses = self.analyzer.identify_strengths_weaknesses(overall_scores, top_n=5)
-        value_proportions = self.analyzer.analyze_value_proportions(self.user_responses)
-        motivation_trends = self.analyzer.analyze_motivation_trends(self.user_responses)
+        # Điểm đã được cộng dồn khi trả lời, dùng chung cho cửa sổ kết quả và báo cáo HTML.
+        # Mở lại cửa sổ với cùng phản hồi sẽ lấy kết quả từ cache.
+        analysis = self.analysis_cache.analyze(self.user_responses, top_n=5,
+                                               compute=lambda: self.live_scorer.result(top_n=5))
+        overall_scores = analysis.overall_scores
+        strengths_weaknesses = analysis.strengths_weaknesses
+        value_proportions = analysis.value_proportions
+        motivation_trends = analysis.motivation_trends
+        percentiles = self.cohort_norms.percentiles(overall_scores)
+        profile_segment = self.segmenter.describe(self.segmenter.assign(overall_scores)) if self.segmenter else None
+        similar_profiles = self.profile_index.similar_profiles_summary(overall_scores, exclude_user=self.user_id)
 
 
         notebook = ttk.Notebook(results_win, style="TNotebook")
@@ -423,6 +470,16 @@ class EnhancedTkinterApp:
         details_content = "--- ĐIỂM SỐ TỔNG THỂ CÁC KHÍA CẠNH ---\n"
         for dim, score in sorted(overall_scores.items()):
             details_content += f"{dim}: {score:.1f}\n"
+        if percentiles:
+            details_content += "\n--- SO SÁNH VỚI CỘNG ĐỒNG ---\n"
+            for dim, pct in sorted(percentiles.items()):
+                details_content += f"{dim}: bạn ở bách phân vị thứ {round(pct)}\n"
+        if profile_segment:
+            details_content += (f"\n--- NHÓM HỒ SƠ ---\nNhóm {profile_segment['segment'] + 1} ({profile_segment['share']:.1f}% người dùng), "
+                                f"nổi bật ở: {', '.join(profile_segment['top_dimensions'])}\n")
+        if similar_profiles:
+            details_content += (f"\n--- NHỮNG HỒ SƠ GIỐNG BẠN ---\n{similar_profiles['count']} hồ sơ giống bạn nhất thường mạnh về: "
+                                f"{', '.join(similar_profiles['common_strengths'])}\n")
         if value_proportions:
             details_content += "\n--- TỶ LỆ GIÁ TRỊ CỐT LÕI ---\n"
             for val, prop in sorted(value_proportions.items()):
@@ -457,11 +514,10 @@ class EnhancedTkinterApp:
         notebook.pack(expand=True, fill='both', padx=10, pady=10)
 
         def save_html_report_action():
-            # Đảm bảo các biến này được cập nhật từ phân tích mới nhất
-            current_overall_scores = self.analyzer.calculate_overall_scores(self.user_responses)
-            current_sw = self.analyzer.identify_strengths_weaknesses(current_overall_scores, top_n=5)
-            current_values = self.analyzer.analyze_value_proportions(self.user_responses)
-            current_motivation = self.analyzer.analyze_motivation_trends(self.user_responses)
+            # Dùng lại kết quả phân tích của cửa sổ này, không tính lại
+            current_sw = analysis.strengths_weaknesses
+            current_values = analysis.value_proportions
+            current_motivation = analysis.motivation_trends
 
             open_ended_formatted = []
             for resp in self.user_responses:
@@ -490,10 +546,10 @@ class EnhancedTkinterApp:
                 if pie_motivation_file: chart_paths_for_report_abs["pie_motivation_png"] = pie_motivation_file
 
 
-            html_path_result = self.reporter.generate_html_report(
-                self.user_id, current_overall_scores, current_sw,
-                current_values, current_motivation, open_ended_formatted,
-                chart_paths_for_report_abs # Truyền dict chứa đường dẫn tuyệt đối
+            html_path_result = self.reporter.generate_html_report_from_analysis(
+                self.user_id, analysis, open_ended_formatted,
+                chart_paths_for_report_abs, # Truyền dict chứa đường dẫn tuyệt đối
+                percentiles, profile_segment, similar_profiles
             )
             if html_path_result and os.path.exists(html_path_result):
                 abs_path_html = os.path.abspath(html_path_result)
@@ -0,0 +1,84 @@
+import contextlib
+import os
+import time
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+POLL_INTERVAL = 0.01 # Seconds between attempts when waiting with a timeout (or on Windows)
+
+
+class LockTimeout(TimeoutError):
+    """The lock could not be acquired within the requested timeout."""
+
+
+class FileLock:
+    """
+    Advisory inter-process lock on a lock file (fcntl.flock on POSIX, msvcrt.locking on Windows).
+    Every acquisition opens its own file descriptor, so the lock also excludes other threads of the same process.
+    Shared holders only exclude exclusive holders; on Windows a shared lock is exclusive.
+    Only code that takes the same lock is coordinated: readers that never lock are not slowed down.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @staticmethod
+    def _try_lock(fd: int, shared: bool) -> bool:
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except (BlockingIOError, PermissionError):
+            return False
+        except OSError:
+            if fcntl is None: # msvcrt reports a held lock as a generic OSError (EACCES/EDEADLOCK)
+                return False
+            raise
+        return True
+
+    @staticmethod
+    def _unlock(fd: int) -> None:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    @contextlib.contextmanager
+    def acquire(self, shared: bool = False, timeout: float | None = None) -> Iterator[None]:
+        """
+        Hold the lock for the duration of the with-block.
+        timeout=None waits as long as needed, timeout=0 tries once; raises LockTimeout when it expires.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if timeout is None and fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            else:
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while not self._try_lock(fd, shared):
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise LockTimeout(f"Could not lock '{self.path}' within {timeout} s")
+                    time.sleep(POLL_INTERVAL)
+            try:
+                yield
+            finally:
+                self._unlock(fd)
+        finally:
+            os.close(fd)
+
+    def shared(self, timeout: float | None = None):
+        return self.acquire(shared=True, timeout=timeout)
+
+    def exclusive(self, timeout: float | None = None):
+        return self.acquire(shared=False, timeout=timeout)
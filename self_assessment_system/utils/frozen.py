@@ -0,0 +1,31 @@
+from typing import Any
+
+
+class FrozenDict(dict):
+    """Read-only dict that stays picklable and JSON-serializable."""
+    __slots__ = ()
+
+    def _readonly(self, *args: Any, **kwargs: Any) -> None:
+        raise TypeError(f"'{type(self).__name__}' object is read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def copy(self) -> dict:
+        """Return a mutable copy"""
+        return dict(self)
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict.__repr__(self)})"
+
+
+def freeze(value: Any) -> Any:
+    """Recursively convert dicts to FrozenDict and lists to tuples."""
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
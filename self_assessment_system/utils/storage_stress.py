@@ -0,0 +1,147 @@
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import List, Dict, Any
+
+import numpy as np
+
+from core.data_storage import DataStorage
+from core.profile_index import ProfileIndex
+from core.question_generator import QuestionGenerator
+from core.response_codec import ResponseCodec
+from core.response_matrix import ResponseMatrixStore
+
+NUM_USERS = 20 # Users are shared by all writers, so several processes append to the same manifest files
+ASSESSMENTS = ("stress_a", "stress_b")
+
+
+def _random_responses(codec: ResponseCodec, rng: random.Random) -> List[Dict[str, Any]]:
+    return [{"question_id": question_id, "answer": rng.choice(values)}
+            for question_id, values in zip(codec.question_order, codec.code_values) if values and rng.random() < 0.9]
+
+
+def _writer(root: str, worker: int, submissions: int) -> List[str]:
+    """One writer process: its own DataStorage with the matrix store and profile index attached, like a UI process."""
+    generator = QuestionGenerator()
+    codec = ResponseCodec(generator.bank)
+    storage = DataStorage(os.path.join(root, "data"))
+    ResponseMatrixStore(codec, os.path.join(root, "matrix")).attach(storage)
+    ProfileIndex(generator.create_analyzer(), os.path.join(root, "profile")).attach(storage)
+    saved = []
+    storage.add_save_listener(lambda record: saved.append(record["submission_id"]))
+    rng = random.Random(worker)
+    remaining = submissions
+    while remaining:
+        batch = min(rng.choice((1, 1, 5, 20)), remaining) # Single UI saves mixed with queued group commits
+        results = storage.save_many([(f"user_{rng.randrange(NUM_USERS)}", _random_responses(codec, rng), rng.choice(ASSESSMENTS))
+                                     for _ in range(batch)])
+        if not all(results):
+            print(f"Writer {worker}: {results.count(False)} submissions reported as failed")
+        remaining -= batch
+    return saved
+
+
+def _maintenance(root: str, stop) -> None:
+    """Rebuilds the manifest and compacts every file right away while the writers are running."""
+    storage = DataStorage(os.path.join(root, "data"))
+    rebuilds = compacted = 0
+    while not stop.is_set():
+        storage.rebuild_manifest()
+        rebuilds += 1
+        compacted += storage.compact(older_than_seconds=0, records_per_segment=500)["compacted"]
+        time.sleep(0.05)
+    print(f"Maintenance: {rebuilds} manifest rebuilds, {compacted} submissions compacted during the run")
+
+
+def verify(root: str, expected_ids: List[str]) -> List[str]:
+    """Problems found in the shared directories (empty list when every saved submission is intact and indexed)."""
+    problems = []
+    generator = QuestionGenerator()
+    codec = ResponseCodec(generator.bank)
+    analyzer = generator.create_analyzer()
+    storage = DataStorage(os.path.join(root, "data"))
+    records = {}
+    for record in storage.iter_responses():
+        if record["submission_id"] in records:
+            problems.append(f"duplicate record {record['submission_id']}")
+        records[record["submission_id"]] = record
+    expected = set(expected_ids)
+    if len(expected) != len(expected_ids):
+        problems.append(f"{len(expected_ids) - len(expected)} submission ids handed out twice")
+    if expected - records.keys():
+        problems.append(f"{len(expected - records.keys())} saved submissions missing from storage")
+    if records.keys() - expected:
+        problems.append(f"{len(records.keys() - expected)} unexpected records in storage")
+
+    for user in range(NUM_USERS):
+        user_id = f"user_{user}"
+        user_records = [r for r in records.values() if r["user_id"] == user_id]
+        history = storage.list_submissions(user_id)
+        if len(history) != len(user_records):
+            problems.append(f"manifest lists {len(history)} submissions for {user_id}, storage has {len(user_records)}")
+        for assessment_name in ASSESSMENTS:
+            candidates = [r for r in user_records if r["assessment_name"] == assessment_name]
+            latest = storage.load_latest_response(user_id, assessment_name)
+            newest = max((r["timestamp"] for r in candidates), default=None)
+            if (latest["timestamp"] if latest else None) != newest:
+                problems.append(f"wrong latest submission for {user_id}/{assessment_name}")
+
+    store = ResponseMatrixStore.load(codec, os.path.join(root, "matrix"))
+    if store is None or len(store) != len(expected_ids):
+        problems.append(f"matrix store has {len(store) if store else 0} rows, expected {len(expected_ids)}")
+    else:
+        misaligned = sum(row[0] not in records or
+                         bytes(store.matrix[i]) != bytes(codec.encode_row(records[row[0]]["responses"])[0])
+                         for i, row in enumerate(store.rows))
+        if misaligned:
+            problems.append(f"{misaligned} matrix rows do not match their submission")
+
+    index = ProfileIndex.load(analyzer, os.path.join(root, "profile"))
+    if index is None or len(index) != len(expected_ids):
+        problems.append(f"profile index has {len(index) if index else 0} rows, expected {len(expected_ids)}")
+    else:
+        by_key: Dict[tuple, List[np.ndarray]] = {}
+        scores = analyzer.batch_calculate_scores(r["responses"] for r in records.values())
+        for record, row_scores in zip(records.values(), scores):
+            key = (record["user_id"], record["assessment_name"], record["timestamp"])
+            by_key.setdefault(key, []).append(index._dequantize(index._quantize(row_scores[None, :]))[0])
+        misaligned = sum(not any(np.array_equal(index._vectors[i], vector) for vector in by_key.get(tuple(row), []))
+                         for i, row in enumerate(index.rows))
+        if misaligned:
+            problems.append(f"{misaligned} profile index rows do not match their submission")
+    return problems
+
+
+def run(processes: int = 8, submissions_per_process: int = 500, root: str | None = None) -> bool:
+    root = root or tempfile.mkdtemp(prefix="storage_stress_")
+    print(f"{processes} writer processes x {submissions_per_process} submissions into {root}")
+    context = multiprocessing.get_context()
+    stop = context.Event()
+    maintenance = context.Process(target=_maintenance, args=(root, stop))
+    maintenance.start()
+    start_time = time.perf_counter()
+    with context.Pool(processes) as pool:
+        saved = pool.starmap(_writer, [(root, worker, submissions_per_process) for worker in range(processes)])
+    elapsed = time.perf_counter() - start_time
+    stop.set()
+    maintenance.join()
+    expected_ids = [submission_id for ids in saved for submission_id in ids]
+    print(f"Saved {len(expected_ids)} submissions in {elapsed:.1f} s ({len(expected_ids) / elapsed:.0f} submissions/s, "
+          f"including matrix and profile index updates)")
+
+    problems = verify(root, expected_ids)
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    print("OK: no lost, duplicated or misindexed submissions" if not problems else f"{len(problems)} problems found")
+    return not problems
+
+
+if __name__ == '__main__':
+    # python -m utils.storage_stress [processes] [submissions_per_process] [directory]
+    ok = run(int(sys.argv[1]) if len(sys.argv) > 1 else 8,
+             int(sys.argv[2]) if len(sys.argv) > 2 else 500,
+             sys.argv[3] if len(sys.argv) > 3 else None)
+    sys.exit(0 if ok else 1)
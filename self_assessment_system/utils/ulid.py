@@ -0,0 +1,55 @@
+import secrets
+import threading
+import time
+
+# Crockford base32: 26 characters encode 48-bit millisecond time + 80 random bits; string order == time order
+ENCODING = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+ULID_LENGTH = 26
+RANDOM_BITS = 80
+
+
+class ULIDGenerator:
+    """
+    Thread-safe monotonic ULID generator. Within the same millisecond (or if the clock steps back)
+    the random part of the previous id is incremented, so ids from one process are strictly increasing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._last_random = 0
+
+    def new(self) -> str:
+        with self._lock:
+            ms = time.time_ns() // 1_000_000
+            if ms <= self._last_ms:
+                ms = self._last_ms
+                random = self._last_random + 1
+                if random >> RANDOM_BITS: # Random part exhausted: borrow the next millisecond
+                    ms += 1
+                    random = secrets.randbits(RANDOM_BITS - 1)
+            else:
+                random = secrets.randbits(RANDOM_BITS - 1) # Top bit clear leaves room to increment
+            self._last_ms, self._last_random = ms, random
+        return encode((ms << RANDOM_BITS) | random)
+
+
+def encode(value: int) -> str:
+    """Encode a 128-bit integer as a 26-character ULID string."""
+    chars = []
+    for _ in range(ULID_LENGTH):
+        chars.append(ENCODING[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def is_ulid(text: str) -> bool:
+    return len(text) == ULID_LENGTH and all(c in ENCODING for c in text)
+
+
+_default_generator = ULIDGenerator()
+
+
+def new_ulid() -> str:
+    """Next id from the process-wide generator."""
+    return _default_generator.new()